@@ -37,7 +37,9 @@ def set_properties(project):
 
     project.build_depends_on("assertpy")
     project.build_depends_on("mockito")
+    project.build_depends_on("numpy")
 
     # project.depends_on("coloredlogs")
     # project.depends_on("verboselogs")
     project.depends_on_requirements("requirements.txt")
+    project.depends_on("numpy", extra="columnar")  # rete.columnar only
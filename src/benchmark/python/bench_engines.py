@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+""" Compare memory and throughput of the match engines on a synthetic workload.
+
+    PYTHONPATH=src/main/python python src/benchmark/python/bench_engines.py --rules 20 --conditions 4
+"""
+import argparse
+import time
+import tracemalloc
+
+from rete.network import create_network
+from rete.workload import Generator
+from rete.workload import Profile
+
+
+def run(engine, generator):
+    operations = list(generator.operations())
+    tracemalloc.start()
+    network = create_network(engine)
+    productions = [network.add_production(rule) for rule in generator.rules()]
+    start = time.perf_counter()
+    for op in operations:
+        getattr(network, op.name)(*op.args)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'engine': engine,
+        'ops/s': len(operations) / elapsed if elapsed else float('inf'),
+        'current KiB': current / 1024,
+        'peak KiB': peak / 1024,
+        'matches': sum(len(p.memory) for p in productions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for field, default in Profile._field_defaults.items():
+        parser.add_argument(f"--{field}", type=type(default), default=default)
+    args = parser.parse_args()
+    generator = Generator(Profile(**vars(args)))
+
+    print(f"{'engine':>8} {'ops/s':>12} {'current KiB':>12} {'peak KiB':>12} {'matches':>8}")
+    for engine in ['rete', 'treat']:
+        row = run(engine, generator)
+        print(f"{row['engine']:>8} {row['ops/s']:>12.0f} {row['current KiB']:>12.0f} {row['peak KiB']:>12.0f} "
+              f"{row['matches']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+""" Measure the cost of journaling a synthetic workload and the time to recover it, scaled per million operations.
+
+Recovery is measured from the write-ahead file alone, then from a snapshot taken after the given fraction of the
+operations followed by the tail of the write-ahead file.
+
+    PYTHONPATH=src/main/python python src/benchmark/python/bench_recovery.py --conditions 2 --selectivity 0.01
+"""
+import argparse
+import tempfile
+import time
+
+from rete.journal import Journal
+from rete.network import create_network
+from rete.workload import Generator
+from rete.workload import Profile
+
+
+def play(network, generator, journal=None, snapshot=None):
+    operations = list(generator.operations())
+    for rule, kwargs in generator.productions():
+        network.add_production(rule, **kwargs)
+    start = time.perf_counter()
+    for i, op in enumerate(operations):
+        getattr(network, op.name)(*op.args)
+        if journal is not None and i == snapshot:
+            journal.snapshot()
+    if journal is not None:
+        journal.close()
+    return len(operations) + len(generator.productions()), time.perf_counter() - start
+
+
+def recover(directory):
+    network = create_network()
+    start = time.perf_counter()
+    journal = Journal(network, directory)
+    elapsed = time.perf_counter() - start
+    journal.close()
+    return journal.recovered, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for field, default in Profile._field_defaults.items():
+        parser.add_argument(f"--{field}", type=type(default), default=default)
+    parser.add_argument('--sync-every', type=int, default=1000, help='records per fsync')
+    parser.add_argument('--snapshot', type=float, default=0.9, help='fraction of the operations before the snapshot')
+    args = vars(parser.parse_args())
+    sync_every = args.pop('sync_every')
+    snapshot = args.pop('snapshot')
+    generator = Generator(Profile(**args))
+
+    count, plain = play(create_network(), generator)
+    print(f"{'run':>20} {'records':>10} {'s / 1M ops':>12}")
+    print(f"{'no journal':>20} {count:>10} {plain / count * 1e6:>12.2f}")
+    with tempfile.TemporaryDirectory() as directory:
+        network = create_network()
+        count, elapsed = play(network, generator, Journal(network, directory, sync_every=sync_every))
+        print(f"{'journaled':>20} {count:>10} {elapsed / count * 1e6:>12.2f}")
+        records, elapsed = recover(directory)
+        print(f"{'recover journal':>20} {records:>10} {elapsed / records * 1e6:>12.2f}")
+    with tempfile.TemporaryDirectory() as directory:
+        network = create_network()
+        journal = Journal(network, directory, sync_every=sync_every)
+        play(network, generator, journal, int(snapshot * generator.profile.wmes))
+        records, elapsed = recover(directory)
+        print(f"{'recover snapshot':>20} {records:>10} {elapsed / count * 1e6:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+""" Compare the throughput of a match server on localhost with in-process calls, on a synthetic workload.
+
+    PYTHONPATH=src/main/python python src/benchmark/python/bench_server.py --conditions 2 --selectivity 0.01
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from rete.network import create_network
+from rete.server import Client
+from rete.server import MatchServer
+from rete.workload import Generator
+from rete.workload import Profile
+
+
+def build(generator):
+    network = create_network()
+    for rule, kwargs in generator.productions():
+        network.add_production(rule, **kwargs)
+    return network
+
+
+def facts(generator):
+    return [(op.name, (op.args[0].identifier, op.args[0].attribute, op.args[0].value))
+            for op in generator.operations()]
+
+
+def in_process(generator):
+    network = build(generator)
+    operations = list(generator.operations())
+    start = time.perf_counter()
+    for op in operations:
+        getattr(network, op.name)(*op.args)
+    return len(operations), time.perf_counter() - start
+
+
+def served(generator, address, batch):
+    operations = facts(generator)
+    with MatchServer(build(generator), address) as server, Client(server.address) as client:
+        start = time.perf_counter()
+        if batch:
+            pipeline = client.pipeline(batch)
+            for name, fact in operations:
+                getattr(pipeline, name)(*fact)
+            pipeline.execute()
+        else:
+            for name, fact in operations:
+                getattr(client, name)(*fact)
+        return len(operations), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for field, default in Profile._field_defaults.items():
+        parser.add_argument(f"--{field}", type=type(default), default=default)
+    parser.add_argument('--batch', type=int, default=100, help='requests per frame when pipelined')
+    args = vars(parser.parse_args())
+    batch = args.pop('batch')
+    generator = Generator(Profile(**args))
+
+    print(f"{'run':>16} {'ops/s':>12}")
+    count, elapsed = in_process(generator)
+    print(f"{'in-process':>16} {count / elapsed:>12.0f}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, address in [('unix', os.path.join(directory, 'rete.sock')), ('tcp', ('127.0.0.1', 0))]:
+            for label, size in [('', 0), (' pipelined', batch)]:
+                count, elapsed = served(generator, address, size)
+                print(f"{name + label:>16} {count / elapsed:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,13 @@
+from .common import Aggregate
 from .common import Bind
+from .common import Exists
 from .common import Filter
 from .common import Has
 from .common import Ncc
 from .common import Neg
 from .common import parse_xml
 from .common import Rule
+from .common import Within
+from .predicates import OneOf
+from .predicates import Prefix
+from .predicates import Range
@@ -0,0 +1,163 @@
+import heapq
+from typing import Any
+from typing import List
+from typing import Tuple
+
+from rete.utils import number
+
+
+class Aggregator(object):
+    """ An aggregate function updated incrementally, one value at a time. """
+
+    @property
+    def defined(self) -> bool:
+        return True
+
+    @property
+    def value(self) -> Any:
+        raise NotImplementedError
+
+    def add(self, key: int, value: Any) -> None:
+        """ Add the value of a new match.
+
+        :param key: the identity of the match
+        :param value: the aggregated value of the match
+        """
+        raise NotImplementedError
+
+    def remove(self, key: int, value: Any) -> None:
+        """ Remove the value of a match added earlier.
+
+        :param key: the identity of the match
+        :param value: the aggregated value of the match
+        """
+        raise NotImplementedError
+
+
+class Count(Aggregator):
+
+    def __init__(self) -> None:
+        self._count = 0
+
+    @property
+    def value(self) -> int:
+        return self._count
+
+    def add(self, key: int, value: Any) -> None:
+        self._count += 1
+
+    def remove(self, key: int, value: Any) -> None:
+        self._count -= 1
+
+
+class Sum(Aggregator):
+
+    def __init__(self) -> None:
+        self._sum = 0
+
+    @property
+    def value(self) -> Any:
+        return self._sum
+
+    def add(self, key: int, value: Any) -> None:
+        self._sum += number(value)
+
+    def remove(self, key: int, value: Any) -> None:
+        self._sum -= number(value)
+
+
+class Descending(object):
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    def __lt__(self, other: 'Descending') -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Descending) and self.value == other.value
+
+
+class Minimum(Aggregator):
+    """ The smallest value, kept on a heap; removed values are only dropped when they reach the top.
+
+    Numeric strings are ordered as numbers, but the value returned is the one added.
+    """
+
+    def __init__(self) -> None:
+        self._heap = []  # list of (ordering key, sequence number, key, value)
+        self._live = {}  # key -> sequence number of its entry in the heap
+        self._sequence = 0
+
+    @property
+    def defined(self) -> bool:
+        self.prune()
+        return bool(self._heap)
+
+    @property
+    def value(self) -> Any:
+        self.prune()
+        return self._heap[0][3] if self._heap else None
+
+    def order(self, value: Any) -> Any:
+        return number(value)
+
+    def add(self, key: int, value: Any) -> None:
+        self._sequence += 1
+        self._live[key] = self._sequence
+        heapq.heappush(self._heap, (self.order(value), self._sequence, key, value))
+
+    def remove(self, key: int, value: Any) -> None:
+        self._live.pop(key, None)
+        if len(self._heap) > 2 * len(self._live) + 16:
+            self._heap = [entry for entry in self._heap if self._live.get(entry[2]) == entry[1]]
+            heapq.heapify(self._heap)
+
+    def prune(self) -> None:
+        while self._heap and self._live.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+
+class Maximum(Minimum):
+
+    def order(self, value: Any) -> Any:
+        return Descending(number(value))
+
+
+class Collect(Aggregator):
+
+    def __init__(self) -> None:
+        self._values = {}  # key -> value, in order of addition
+
+    @property
+    def value(self) -> Tuple[Any, ...]:
+        return tuple(self._values.values())
+
+    def add(self, key: int, value: Any) -> None:
+        self._values[key] = value
+
+    def remove(self, key: int, value: Any) -> None:
+        self._values.pop(key, None)
+
+
+AGGREGATORS = {
+    'count': Count,
+    'sum': Sum,
+    'min': Minimum,
+    'max': Maximum,
+    'collect': Collect,
+}
+
+
+def aggregate(function: str, values: List[Any]) -> Tuple[bool, Any]:
+    """ Compute the given aggregate function over the given values at once.
+
+    :param function: the name of the function, a key of `AGGREGATORS`
+    :param values: the values to aggregate
+    :return: whether the aggregate is defined for the values, and its value
+    """
+    aggregator = AGGREGATORS[function]()
+    for key, value in enumerate(values):
+        aggregator.add(key, value)
+
+    return aggregator.defined, aggregator.value
@@ -0,0 +1,285 @@
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from rete.common import Bind
+from rete.common import Exists
+from rete.common import FIELDS
+from rete.common import Filter
+from rete.common import Has
+from rete.common import Neg
+from rete.common import WME
+from rete.predicates import Predicate
+from rete.symbols import SymbolTable
+from rete.symbols import SYMBOLS
+from rete.utils import evaluate
+from rete.utils import is_var
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+
+class Relation(NamedTuple):
+    variables: List[str]  # the variables bound by the relation
+    columns: Any  # one row per solution, one column per variable
+    support: Any  # one row per solution, one column per positive condition: the matching row of the memory
+
+
+class ColumnarMemory(object):
+    """ A store of WMEs as three integer-coded columns, joined with vectorized operations.
+
+    Conditions made of `Has`, `Neg` and `Exists` are matched over whole columns at once: constant tests become
+    vectorized comparisons and every join a sort-merge join over integer keys. `Filter` and `Bind` are evaluated per
+    solution, after the joins.
+    """
+
+    def __init__(self, symbols: SymbolTable = None, capacity: int = 1024) -> None:
+        """ Constructor.
+
+        :param symbols: the table encoding the symbols, the global one by default
+        :param capacity: the number of rows allocated in advance
+        """
+        if np is None:
+            raise ImportError('ColumnarMemory requires numpy, see the "columnar" extra')
+
+        self._symbols = SYMBOLS if symbols is None else symbols
+        self._columns = np.zeros((capacity, len(FIELDS)), dtype=np.int64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._wmes = []
+        self._rows = {}  # id(WME) -> row
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def symbols(self) -> SymbolTable:
+        return self._symbols
+
+    @property
+    def wmes(self) -> List[Optional[WME]]:
+        return self._wmes
+
+    def reserve(self, size: int) -> None:
+        if size > len(self._alive):
+            capacity = max(size, 2 * len(self._alive))
+            columns = np.zeros((capacity, len(FIELDS)), dtype=np.int64)
+            columns[:len(self._wmes)] = self._columns[:len(self._wmes)]
+            alive = np.zeros(capacity, dtype=bool)
+            alive[:len(self._wmes)] = self._alive[:len(self._wmes)]
+            self._columns, self._alive = columns, alive
+
+    def extend(self, wmes: Iterable[WME]) -> None:
+        """ Add the given WMEs to this memory.
+
+        :param wmes: the WMEs to add
+        """
+        wmes = [w for w in wmes if id(w) not in self._rows]
+        start = len(self._wmes)
+        self.reserve(start + len(wmes))
+        encode = self._symbols.encode
+        codes = [encode(getattr(w, f)) for w in wmes for f in FIELDS]
+        self._columns[start:start + len(wmes)] = np.array(codes, dtype=np.int64).reshape(len(wmes), len(FIELDS))
+        self._alive[start:start + len(wmes)] = True
+        for row, wme in enumerate(wmes, start):
+            self._rows[id(wme)] = row
+        self._wmes.extend(wmes)
+
+    def append(self, wme: WME) -> None:
+        self.extend([wme])
+
+    def remove(self, wme: WME) -> None:
+        """ Remove the given WME from this memory.
+
+        :param wme: the WME to remove
+        """
+        row = self._rows.pop(id(wme))
+        self._alive[row] = False
+        self._wmes[row] = None
+        if len(self._rows) < len(self._wmes) // 2:
+            self.compact()
+
+    def compact(self) -> None:
+        rows = np.flatnonzero(self._alive[:len(self._wmes)])
+        self._columns[:len(rows)] = self._columns[rows]
+        self._alive[:] = False
+        self._alive[:len(rows)] = True
+        self._wmes = [self._wmes[row] for row in rows]
+        self._rows = {id(w): row for row, w in enumerate(self._wmes)}
+
+    def select(self, cond: Has) -> Optional[Relation]:
+        """ Return the relation of the rows matching the given condition.
+
+        :param cond: the condition to match
+        :return: the relation of the matching rows, or None if a constant of `cond` is an unknown symbol
+        """
+        mask = self._alive[:len(self._wmes)].copy()
+        columns = self._columns[:len(self._wmes)]
+        variables = {}
+        for i, field in enumerate(FIELDS):
+            symbol = getattr(cond, field)
+            if isinstance(symbol, Predicate):
+                # only the values of the rows left are tested: as in the alpha network, a predicate raising an
+                # error on a value raises it here too, but never sees the values of the rows it cannot match
+                codes = [c for c in np.unique(columns[mask, i]).tolist() if symbol.test(self._symbols.decode(c))]
+                mask &= np.isin(columns[:, i], codes)
+            elif not is_var(symbol):
+                code = self._symbols.lookup(symbol)
+                if code is None:
+                    return None
+                mask &= columns[:, i] == code
+            elif symbol in variables:
+                mask &= columns[:, i] == columns[:, variables[symbol]]
+            else:
+                variables[symbol] = i
+        rows = np.flatnonzero(mask)
+
+        return Relation(list(variables), columns[rows][:, list(variables.values())], rows.reshape(-1, 1))
+
+    def match(self, rule: Iterable[Any]) -> Relation:
+        """ Return the relation of the solutions of the given rule.
+
+        :param rule: the conditions to match, `Ncc` is not supported
+        :return: the relation of the solutions
+        """
+        result = Relation([], np.zeros((1, 0), dtype=np.int64), np.zeros((1, 0), dtype=np.int64))
+        for cond in rule:
+            if isinstance(cond, Neg):
+                result = anti_join(result, self.select(cond))
+            elif isinstance(cond, Exists):
+                result = semi_join(result, self.select(cond))
+            elif isinstance(cond, Has):
+                result = join(result, self.select(cond))
+            elif isinstance(cond, (Filter, Bind)):
+                result = self.evaluate(result, cond)
+            else:
+                raise ValueError(f"unsupported condition: {cond}")
+
+        return result
+
+    def count(self, rule: Iterable[Any]) -> int:
+        return len(self.match(rule).columns)
+
+    def solutions(self, rule: Iterable[Any]) -> Iterator[Dict[str, Any]]:
+        """ Return the solutions of the given rule as binding dicts.
+
+        :param rule: the conditions to match
+        :return: the stream of solutions
+        """
+        relation = self.match(rule)
+        for row in relation.columns.tolist():
+            yield {v: self.decode(code) for v, code in zip(relation.variables, row)}
+
+    def decode(self, code: int) -> Any:
+        return self._symbols.decode(code)
+
+    def evaluate(self, relation: Relation, cond: Any) -> Relation:
+        """ Apply a `Filter` or a `Bind` to every solution of the given relation.
+
+        :param relation: the solutions computed so far
+        :param cond: the condition to apply
+        :return: the solutions satisfying the condition
+        """
+        keep = []
+        values = []
+        for row in relation.columns.tolist():
+            result = evaluate(cond.template, {v: self.decode(c) for v, c in zip(relation.variables, row)})
+            keep.append(bool(result) if isinstance(cond, Filter) else True)
+            values.append(self._symbols.encode(result) if isinstance(cond, Bind) else 0)
+        keep = np.array(keep, dtype=bool)
+        if isinstance(cond, Filter):
+            return Relation(relation.variables, relation.columns[keep], relation.support[keep])
+
+        column = np.array(values, dtype=np.int64).reshape(-1, 1)
+        return Relation(relation.variables + [cond.symbol], np.hstack([relation.columns, column]), relation.support)
+
+
+def keys(left: Any, right: Any) -> Any:
+    """ Encode the rows of the given key columns as single integers, consistently between the two sides.
+
+    :param left: the key columns of the left relation
+    :param right: the key columns of the right relation
+    :return: the codes of the left rows and the codes of the right rows
+    """
+    if left.shape[1] == 1:
+        return left[:, 0], right[:, 0]
+
+    _, inverse = np.unique(np.vstack([left, right]), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    return inverse[:len(left)], inverse[len(left):]
+
+
+def join(left: Relation, right: Optional[Relation]) -> Relation:
+    """ Return the sort-merge equality join of two relations on their shared variables.
+
+    :param left: the left relation
+    :param right: the right relation, None if empty
+    :return: the joined relation
+    """
+    if right is None:
+        right = Relation([], np.zeros((0, 0), dtype=np.int64), np.zeros((0, 1), dtype=np.int64))
+    shared = [v for v in right.variables if v in left.variables]
+    extra = [i for i, v in enumerate(right.variables) if v not in left.variables]
+    n, m = len(left.columns), len(right.columns)
+    if not shared:
+        li = np.repeat(np.arange(n), m)
+        ri = np.tile(np.arange(m), n)
+    else:
+        lk, rk = keys(left.columns[:, [left.variables.index(v) for v in shared]],
+                      right.columns[:, [right.variables.index(v) for v in shared]])
+        order = np.argsort(rk, kind='stable')
+        sorted_rk = rk[order]
+        lo = np.searchsorted(sorted_rk, lk, 'left')
+        counts = np.searchsorted(sorted_rk, lk, 'right') - lo
+        li = np.repeat(np.arange(n), counts)
+        offsets = np.arange(len(li)) - np.repeat(np.cumsum(counts) - counts, counts)
+        ri = order[np.repeat(lo, counts) + offsets]
+
+    return Relation(
+        left.variables + [right.variables[i] for i in extra],
+        np.hstack([left.columns[li], right.columns[ri][:, extra]]),
+        np.hstack([left.support[li], right.support[ri]]),
+    )
+
+
+def anti_join(left: Relation, right: Optional[Relation]) -> Relation:
+    """ Return the rows of the left relation without any partner in the right relation.
+
+    :param left: the left relation
+    :param right: the relation of the negated condition, None if empty
+    :return: the rows of `left` without a partner
+    """
+    if right is None or not len(right.columns):
+        return left
+
+    keep = ~partnered(left, right)
+    return Relation(left.variables, left.columns[keep], left.support[keep])
+
+
+def semi_join(left: Relation, right: Optional[Relation]) -> Relation:
+    """ Return the rows of the left relation with at least a partner in the right relation.
+
+    :param left: the left relation
+    :param right: the relation of the existential condition, None if empty
+    :return: the rows of `left` with a partner, once each
+    """
+    if right is None or not len(right.columns):
+        return Relation(left.variables, left.columns[:0], left.support[:0])
+
+    keep = partnered(left, right)
+    return Relation(left.variables, left.columns[keep], left.support[keep])
+
+
+def partnered(left: Relation, right: Relation) -> Any:
+    shared = [v for v in right.variables if v in left.variables]
+    if not shared:
+        return np.ones(len(left.columns), dtype=bool)
+
+    lk, rk = keys(left.columns[:, [left.variables.index(v) for v in shared]],
+                  right.columns[:, [right.variables.index(v) for v in shared]])
+    return np.isin(lk, rk)
@@ -1,3 +1,4 @@
+import math
 from typing import Any
 from typing import Dict
 from typing import Iterable
@@ -9,9 +10,22 @@ from typing import Union
 from xml.etree import ElementTree
 from xml.etree.ElementTree import Element
 
+from rete.predicates import accepts
+from rete.predicates import Expression
+from rete.predicates import OneOf
+from rete.predicates import Predicate
+from rete.predicates import Prefix
+from rete.predicates import Range
+from rete.sessions import deferred
+from rete.sessions import Local
+from rete.sessions import own
+from rete.sessions import restore_pending
+from rete.symbols import intern
+from rete.utils import comparison
 from rete.utils import is_var
 
 FIELDS = ['identifier', 'attribute', 'value']
+DYING = set()  # id of the tokens and WMEs whose deletion is in progress
 
 
 class Triple(object):
@@ -28,9 +42,9 @@ class Triple(object):
         :param attribute: a Var or str for the predicate
         :param value: a Var or str for the object
         """
-        self._identifier = identifier
-        self._attribute = attribute
-        self._value = value
+        self._identifier = intern(identifier)
+        self._attribute = intern(attribute)
+        self._value = intern(value)
 
     def __eq__(self, other: Any) -> bool:
         """ Check this and the other object are the same.
@@ -67,7 +81,7 @@ class Triple(object):
 
     @property
     def vars(self) -> List[Tuple[str, str]]:
-        return [(k[1:], v) for k, v in self.__dict__.items() if is_var(v)]
+        return [(f, getattr(self, f)) for f in FIELDS if is_var(getattr(self, f))]
 
     def contain(self, val: str) -> Optional[str]:
         """ Return the position where the given `val` is found, or None.
@@ -75,18 +89,34 @@ class Triple(object):
         :param val: the value to check
         :return: the position where the given `val` is found, or None
         """
-        for key, value in self.__dict__.items():
-            if val == value:
-                return key[1:]
+        for field in FIELDS:
+            if val == getattr(self, field):
+                return field
 
         return None
 
 
+@deferred(_amems=Local(list), _tokens=Local(list), _negative_join_results=Local(list))
 class WME(Triple):
 
-    def __init__(self, identifier: str = None, attribute: str = None, value: str = None) -> None:
+    def __init__(
+            self,
+            identifier: str = None,
+            attribute: str = None,
+            value: str = None,
+            timestamp: float = None,
+    ) -> None:
+        """ Constructor.
+
+        :param identifier: the subject
+        :param attribute: the predicate
+        :param value: the object
+        :param timestamp: the time of the fact, in seconds; stamped by the network when added if None
+        """
         super().__init__(identifier, attribute, value)
 
+        own(self)
+        self.timestamp = timestamp
         self._amems = []  # amems: the ones containing this WME
         self._tokens = []  # tokens: the ones containing this WME
         self._negative_join_results = []  # negative_join_result
@@ -158,6 +188,8 @@ class WME(Triple):
         self._tokens.append(token)
 
 
+@deferred(children=Local(list), join_results=Local(list), ncc_results=Local(list),
+          owner=Local(lambda: None, inherit=lambda token: token))
 class Token:
 
     def __init__(self, parent, wme, node=None, binding=None):
@@ -166,6 +198,7 @@ class Token:
         :type parent: Token
         :type binding: dict
         """
+        own(self)
         self.parent = parent
         self.wme = wme
         self.node = node  # points to memory this token is in
@@ -175,6 +208,8 @@ class Token:
         self.owner = None  # Ncc
         self.binding = binding if binding else {}  # {"$x": "B1"}
 
+        if node is not None:
+            node.created += 1
         if self.wme:
             self.wme.append_token(self)
         if self.parent:
@@ -187,6 +222,17 @@ class Token:
         return isinstance(other, Token) and \
                self.parent == other.parent and self.wme == other.wme
 
+    def is_dying(self) -> bool:
+        """ Return whether this token is being deleted, with one of its ancestors or WMEs. """
+        if not DYING:
+            return False
+        token = self
+        while token is not None:
+            if id(token) in DYING or id(token.wme) in DYING:
+                return True
+            token = token.parent
+        return False
+
     def is_root(self):
         return not self.parent and not self.wme
 
@@ -201,15 +247,13 @@ class Token:
 
     def get_binding(self, v):
         t = self
-        ret = t.binding.get(v)
-        while not ret and t.parent:
+        while v not in t.binding and t.parent:
             t = t.parent
-            ret = t.binding.get(v)
-        return ret
+        return t.binding.get(v)
 
     def all_binding(self):
         path = [self]
-        if path[0].parent:
+        while path[0].parent:
             path.insert(0, path[0].parent)
         binding = {}
         for t in path:
@@ -225,10 +269,13 @@ class Token:
         from rete.nodes import NccPartnerNode
         from rete.nodes import NccNode
 
-        for child in token.children:
+        restore_pending()  # the descendants of the token must all be restored
+        DYING.add(id(token))
+        for child in list(token.children):
             Token.delete_token_and_descendants(child)
+        DYING.discard(id(token))
 
-        if not isinstance(token.node, NccPartnerNode):
+        if token.node is not None and not isinstance(token.node, NccPartnerNode):
             token.node.remove_token(token)
         if token.wme:
             token.wme.remove_token(token)
@@ -266,6 +313,31 @@ class JoinNodeTest(NamedTuple):
         return f"<JoinNodeTest WME.{self.field1}=Condition[{self.condition2}].{self.field2}?>"
 
 
+class BindingTest(NamedTuple):
+    field1: str
+    variable: str
+
+    def __repr__(self) -> str:
+        """ Return a serialization of this object.
+
+        :return: a serialization of this object
+        """
+        return f"<BindingTest WME.{self.field1}={self.variable}?>"
+
+
+class ComparisonTest(NamedTuple):
+    field1: str
+    operator: str
+    variable: str
+
+    def __repr__(self) -> str:
+        """ Return a serialization of this object.
+
+        :return: a serialization of this object
+        """
+        return f"<ComparisonTest WME.{self.field1}{self.operator}{self.variable}?>"
+
+
 class Condition(object):
     pass
 
@@ -278,11 +350,12 @@ class Has(Triple):
         :param wme: the `wme` to check
         :return: True if the given `wme` matches this condition, False otherwise
         """
-        for key, value in self.__dict__.items():
-            if value.startswith('$'):
+        for field in FIELDS:
+            value = getattr(self, field)
+            if is_var(value):
                 continue
 
-            if value != wme.__dict__[key]:
+            if not accepts(value, getattr(wme, field)):
                 return False
 
         return True
@@ -294,6 +367,52 @@ class Neg(Has):
         return f"-({self._identifier} {self._attribute} {self._value})"
 
 
+class Exists(Has):
+
+    def __repr__(self):
+        return f"?({self._identifier} {self._attribute} {self._value})"
+
+
+class Within(Has):
+
+    def __init__(self, identifier: str = None, attribute: str = None, value: str = None, window: float = 0) -> None:
+        """ Constructor.
+
+        A WME matches this condition if it also follows the facts matched by the earlier conditions by at most
+        `window` seconds: its timestamp is between the latest of their timestamps and that plus `window`.
+
+        :param identifier: a Var or str for the subject
+        :param attribute: a Var or str for the predicate
+        :param value: a Var or str for the object
+        :param window: the maximum delay from the latest earlier fact, in seconds
+        """
+        super().__init__(identifier, attribute, value)
+        self._window = window
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Within) and self._window == other._window and super().__eq__(other)
+
+    def __repr__(self) -> str:
+        return f"({self._identifier} {self._attribute} {self._value} within {self._window})"
+
+    @property
+    def window(self) -> float:
+        return self._window
+
+    def follows(self, wme: WME, earlier: Iterable[Optional[WME]]) -> bool:
+        """ Check if the given `wme` happens within the window after the given earlier WMEs.
+
+        :param wme: the WME to check
+        :param earlier: the WMEs matched by the earlier conditions, None for the unmatched ones
+        :return: True if the given `wme` is in the window, False otherwise
+        """
+        times = [w.timestamp for w in earlier if w is not None and w.timestamp is not None]
+        if not times or wme.timestamp is None:
+            return True
+
+        return 0 <= wme.timestamp - max(times) <= self._window
+
+
 class Rule(list):
 
     def __init__(self, *args):
@@ -308,7 +427,56 @@ class Ncc(Rule):
 
     @property
     def number_of_conditions(self):
-        return len(self)
+        return sum(1 for cond in self if not isinstance(cond, (Filter, Bind)))
+
+
+class Aggregate(Rule):
+
+    FUNCTIONS = ['count', 'sum', 'min', 'max', 'collect']
+
+    def __init__(self, function: str, to: str, *conditions: Any, of: str = None) -> None:
+        """ Constructor.
+
+        For example, the number of failed logins of each user:
+            Has('$u', 'is-a', 'user'), Aggregate('count', '$n', Has('$u', 'login', 'failed'))
+
+        :param function: one of `FUNCTIONS`
+        :param to: the variable bound to the aggregate of the matches of `conditions` extending each earlier match
+        :param conditions: the conditions to aggregate
+        :param of: the variable whose values are aggregated, unless counting
+        """
+        if function not in self.FUNCTIONS:
+            raise ValueError(f"unknown aggregate function: '{function}'")
+        if of is None and function != 'count':
+            raise ValueError(f"'{function}' needs a variable to aggregate")
+
+        super().__init__(*conditions)
+        self._function = function
+        self._to = to
+        self._of = of
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Aggregate) and (self._function, self._to, self._of) == \
+            (other._function, other._to, other._of) and super().__eq__(other)
+
+    def __repr__(self) -> str:
+        return f"{self._to}={self._function}({self._of or ''}){super().__repr__()}"
+
+    @property
+    def function(self) -> str:
+        return self._function
+
+    @property
+    def to(self) -> str:
+        return self._to
+
+    @property
+    def of(self) -> Optional[str]:
+        return self._of
+
+    @property
+    def number_of_conditions(self) -> int:
+        return sum(1 for cond in self if not isinstance(cond, (Filter, Bind)))
 
 
 class Filter:
@@ -318,10 +486,17 @@ class Filter:
     def __eq__(self, other):
         return isinstance(other, Filter) and self._template == other._template
 
+    def __repr__(self) -> str:
+        return f"[{self._template}]"
+
     @property
     def template(self) -> str:
         return self._template
 
+    @property
+    def comparison(self) -> Optional[Tuple[str, str, str]]:
+        return comparison(self._template)
+
 
 class Bind:
     def __init__(self, template: str, symbol: str) -> None:
@@ -342,6 +517,9 @@ class Bind:
 
         return (self.template, self.symbol) == (other.template, other.symbol)
 
+    def __repr__(self) -> str:
+        return f"[{self._symbol} := {self._template}]"
+
     @property
     def template(self) -> str:
         return self._template
@@ -357,19 +535,19 @@ def parse_xml(content: str) -> List[Tuple[Rule, Dict[Any, Any]]]:
     for production in root:
         lhs = Rule()
         lhs.extend(parsing(production[0]))
-        rhs = production[1].attrib
+        rhs = dict(production[1].attrib)
+        if 'module' in production.attrib:
+            rhs['module'] = production.attrib['module']
         result.append((lhs, rhs))
 
     return result
 
 
-def parsing(root: Element) -> List[Union[Has, Neg, Filter, Bind, Ncc]]:
+def parsing(root: Element) -> List[Union[Has, Neg, Exists, Within, Filter, Bind, Ncc, Aggregate]]:
     result = []
     for item in root:
-        if item.tag == 'has':
-            result.append(Has(**item.attrib))
-        elif item.tag == 'neg':
-            result.append(Neg(**item.attrib))
+        if item.tag in ('has', 'neg', 'exists', 'within'):
+            result.append(parsing_triple(item))
         elif item.tag == 'filter':
             result.append(Filter(item.text))
         elif item.tag == 'bind':
@@ -379,5 +557,106 @@ def parsing(root: Element) -> List[Union[Has, Neg, Filter, Bind, Ncc]]:
             n = Ncc()
             n.extend(parsing(item))
             result.append(n)
+        elif item.tag == 'aggregate':
+            result.append(Aggregate(item.attrib['function'], item.attrib['to'], *parsing(item),
+                                    of=item.attrib.get('of')))
 
     return result
+
+
+def parsing_triple(item: Element) -> Has:
+    attrib = dict(item.attrib)
+    for child in item:
+        attrib[child.attrib['field']] = parsing_predicate(child)
+    if item.tag == 'within':
+        return Within(window=float(attrib.pop('window')), **attrib)
+
+    return {'has': Has, 'neg': Neg, 'exists': Exists}[item.tag](**attrib)
+
+
+def parsing_predicate(item: Element) -> Predicate:
+    if item.tag == 'range':
+        return Range(float(item.attrib['low']) if 'low' in item.attrib else None,
+                     float(item.attrib['high']) if 'high' in item.attrib else None,
+                     item.attrib.get('low_closed') != 'false', item.attrib.get('high_closed') != 'false')
+    if item.tag == 'prefix':
+        return Prefix(item.text or '')
+    if item.tag == 'one-of':
+        return OneOf(*(value.text or '' for value in item))
+    if item.tag == 'expression':
+        return Expression(item.text)
+
+    raise ValueError(f"unknown predicate: {item.tag}")
+
+
+def dump_xml(productions: Iterable[Tuple[Rule, Dict[str, str]]]) -> str:
+    """ Serialize the given productions in the format read by `parse_xml`.
+
+    :param productions: the list of (lhs, rhs) pairs to serialize
+    :return: the XML document describing the given productions
+    """
+    root = Element('data', version='0.0.2')
+    for lhs, rhs in productions:
+        rhs = dict(rhs or {})
+        module = rhs.pop('module', None)
+        production = ElementTree.SubElement(root, 'production', {} if module is None else {'module': str(module)})
+        dumping(ElementTree.SubElement(production, 'lhs'), lhs)
+        ElementTree.SubElement(production, 'rhs', {k: str(v) for k, v in rhs.items()})
+
+    return ElementTree.tostring(root, encoding='unicode')
+
+
+def dumping(
+        root: Element,
+        conditions: Iterable[Union[Has, Neg, Exists, Within, Filter, Bind, Ncc, Aggregate]],
+) -> None:
+    for cond in conditions:
+        if isinstance(cond, Has):
+            dumping_triple(root, cond)
+        elif isinstance(cond, Filter):
+            ElementTree.SubElement(root, 'filter').text = cond.template
+        elif isinstance(cond, Bind):
+            ElementTree.SubElement(root, 'bind', to=cond.symbol).text = cond.template
+        elif isinstance(cond, Ncc):
+            dumping(ElementTree.SubElement(root, 'ncc'), cond)
+        elif isinstance(cond, Aggregate):
+            attrib = {'function': cond.function, 'to': cond.to}
+            if cond.of is not None:
+                attrib['of'] = cond.of
+            dumping(ElementTree.SubElement(root, 'aggregate', attrib), cond)
+
+
+def dumping_triple(root: Element, cond: Has) -> None:
+    # the tag of a `Has`, `Neg`, `Exists` or `Within` is the name of its class, its predicates are child elements
+    fields = dict(zip(FIELDS, (cond.identifier, cond.attribute, cond.value)))
+    attrib = {field: value for field, value in fields.items() if not isinstance(value, Predicate)}
+    if isinstance(cond, Within):
+        attrib['window'] = str(cond.window)
+    element = ElementTree.SubElement(root, type(cond).__name__.lower(), attrib)
+    for field, value in fields.items():
+        if isinstance(value, Predicate):
+            dumping_predicate(element, field, value)
+
+
+def dumping_predicate(root: Element, field: str, predicate: Predicate) -> None:
+    if isinstance(predicate, Range):
+        attrib = {'field': field}
+        if predicate.low != -math.inf:
+            attrib['low'] = repr(float(predicate.low))
+        if predicate.high != math.inf:
+            attrib['high'] = repr(float(predicate.high))
+        if not predicate.low_closed:
+            attrib['low_closed'] = 'false'
+        if not predicate.high_closed:
+            attrib['high_closed'] = 'false'
+        ElementTree.SubElement(root, 'range', attrib)
+    elif isinstance(predicate, Prefix):
+        ElementTree.SubElement(root, 'prefix', field=field).text = predicate.prefix
+    elif isinstance(predicate, OneOf):
+        element = ElementTree.SubElement(root, 'one-of', field=field)
+        for value in sorted(map(str, predicate.values)):
+            ElementTree.SubElement(element, 'value').text = value
+    elif isinstance(predicate, Expression):
+        ElementTree.SubElement(root, 'expression', field=field).text = predicate.template
+    else:
+        raise TypeError(f"cannot serialize the predicate {predicate!r}")
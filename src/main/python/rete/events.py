@@ -0,0 +1,104 @@
+from contextlib import contextmanager
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import NamedTuple
+from typing import Optional
+
+ADDED = 'added'
+REMOVED = 'removed'
+
+
+class Event(NamedTuple):
+    kind: str  # ADDED or REMOVED
+    production: Any  # the ProductionNode whose memory changed
+    token: Any  # the Token added to or removed from the memory
+    binding: Dict[str, Any]  # the values of the variables of the match
+
+
+Listener = Callable[[Event], None]
+
+
+class Dispatcher(object):
+    """ Deliver production events to their listeners, immediately or at the end of a batch.
+
+    While a batch is open, events are queued; an addition followed by the removal of the same token within the
+    batch cancels out, so that listeners only receive the net changes when the outermost batch closes.
+    """
+
+    def __init__(self) -> None:
+        self._depth = 0
+        self._queue = []  # list of Event, None once cancelled
+        self._pending = {}  # id(token) -> position in queue of its ADDED event
+
+    @property
+    def deferred(self) -> bool:
+        return self._depth > 0
+
+    def dispatch(self, event: Event) -> None:
+        """ Deliver the given event, or queue it if a batch is open.
+
+        :param event: the event to deliver
+        """
+        if not self._depth:
+            self.deliver(event)
+        elif event.kind == REMOVED and id(event.token) in self._pending:
+            self._queue[self._pending.pop(id(event.token))] = None
+        else:
+            if event.kind == ADDED:
+                self._pending[id(event.token)] = len(self._queue)
+            self._queue.append(event)
+
+    @staticmethod
+    def deliver(event: Event) -> None:
+        for listener in list(event.production.listeners):
+            listener(event)
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """ Defer the delivery of the events until the outermost batch closes. """
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if not self._depth:
+                self.flush()
+
+    def flush(self) -> None:
+        """ Deliver the queued events; the events raised by the listeners meanwhile are queued and delivered next.
+
+        A listener raising an exception does not stop the delivery: every queued event is delivered, then the first
+        exception is raised again.
+        """
+        error = None
+        self._depth += 1
+        try:
+            while self._queue:
+                queue, self._queue, self._pending = self._queue, [], {}
+                for event in queue:
+                    try:
+                        if event is not None:
+                            self.deliver(event)
+                    except Exception as e:
+                        error = error or e
+        finally:
+            self._depth -= 1
+        if error is not None:
+            raise error
+
+
+def notify(production: Any, kind: str, token: Any, dispatcher: Optional[Dispatcher] = None) -> None:
+    """ Notify the listeners of the given production that a token was added to or removed from its memory.
+
+    :param production: the production whose memory changed
+    :param kind: ADDED or REMOVED
+    :param token: the token added or removed
+    :param dispatcher: the dispatcher of the network, if any
+    """
+    event = Event(kind, production, token, token.all_binding())
+    if dispatcher is None:
+        Dispatcher.deliver(event)
+    else:
+        dispatcher.dispatch(event)
@@ -0,0 +1,274 @@
+import math
+import os
+import struct
+import zlib
+from typing import Any
+from typing import Dict
+from typing import IO
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+from rete.common import dump_xml
+from rete.common import parse_xml
+from rete.common import WME
+from rete.utils import decode_value
+from rete.utils import encode_value
+
+JOURNAL = 'journal.wal'
+SNAPSHOT = 'snapshot.bin'
+
+CHECKPOINT = 0
+ADD_WME = 1
+REMOVE_WME = 2
+ADD_PRODUCTION = 3
+REMOVE_PRODUCTION = 4
+CODES = {'add_wme': ADD_WME, 'remove_wme': REMOVE_WME, 'add_production': ADD_PRODUCTION,
+         'remove_production': REMOVE_PRODUCTION}
+
+HEADER = struct.Struct('<IBQI')  # CRC-32 of the rest of the record, op code, sequence number, payload length
+REF = struct.Struct('<Q')  # the sequence number of the record adding the WME or production removed
+TIME = struct.Struct('<dd')  # the timestamp and the time-to-live of a WME, NaN if none
+FIELD = struct.Struct('<cI')  # the type of a field of a WME and the length of its encoding, followed by the encoding
+
+
+def encode_field(value: Any) -> bytes:
+    code, encoded = encode_value(value)
+    return FIELD.pack(code, len(encoded)) + encoded
+
+
+def encode_wme(wme: WME, ttl: Optional[float] = None) -> bytes:
+    return TIME.pack(math.nan if wme.timestamp is None else wme.timestamp, math.nan if ttl is None else ttl) + b''.join(
+        encode_field(field) for field in (wme.identifier, wme.attribute, wme.value))
+
+
+def decode_wme(payload: bytes) -> Tuple[WME, Optional[float]]:
+    timestamp, ttl = TIME.unpack_from(payload)
+    offset = TIME.size
+    fields = []
+    for _ in range(3):
+        code, length = FIELD.unpack_from(payload, offset)
+        offset += FIELD.size
+        fields.append(decode_value(code, payload[offset:offset + length]))
+        offset += length
+
+    return WME(*fields, timestamp=None if math.isnan(timestamp) else timestamp), None if math.isnan(ttl) else ttl
+
+
+def encode_record(code: int, sequence: int, payload: bytes) -> bytes:
+    head = HEADER.pack(0, code, sequence, len(payload))[4:]
+    return struct.pack('<I', zlib.crc32(payload, zlib.crc32(head))) + head + payload
+
+
+def read_records(data: bytes) -> Iterator[Tuple[int, int, bytes, int]]:
+    """ Parse the records of a journal or snapshot, up to the first one torn or corrupted by a crash.
+
+    :param data: the content of the file
+    :return: the (op code, sequence number, payload, offset of the end of the record) of every valid record
+    """
+    view = memoryview(data)
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        crc, code, sequence, length = HEADER.unpack_from(data, offset)
+        end = offset + HEADER.size + length
+        if end > len(data) or zlib.crc32(view[offset + 4:end]) != crc:
+            return
+        yield code, sequence, bytes(view[offset + HEADER.size:end]), end
+        offset = end
+
+
+class Journal(object):
+    """ An append-only journal of the operations changing a network, for crash recovery and fast replay.
+
+    Every `add_wme`, `remove_wme`, `add_production` and `remove_production` is appended to a write-ahead file in a
+    compact binary record: a header with a CRC-32, the op code and a sequence number, followed by the WME fields, the
+    XML of the production (see `dump_xml`) or, for a removal, the sequence number of the record that added the target.
+
+    Records are buffered and synced to disk as a group, with one `fsync` every `sync_every` records, so that the cost
+    of durability is shared by many operations; up to `sync_every - 1` operations can be lost in a crash.
+
+    A snapshot rewrites the productions and WMEs alive as a compact file, then truncates the write-ahead file. When
+    the journal is opened on an existing directory, the network is rebuilt from the snapshot and the tail of the
+    write-ahead file, as one batch of events, before journaling resumes::
+
+        with Journal(network, 'state/', sync_every=100, snapshot_every=100000):
+            network.add_wme(WME('B1', 'on', 'B2'))
+
+    The WME fields are journaled with their type, and the time-to-live of a WME is counted again from its recovery.
+    WMEs added by the truth maintenance are journaled as plain facts, and restored as such. A production testing a
+    custom `Predicate`, which `dump_xml` cannot serialize, is removed again and refused with a TypeError.
+    """
+
+    def __init__(
+            self,
+            network: Any,
+            directory: str,
+            sync_every: int = 1000,
+            snapshot_every: Optional[int] = None,
+    ) -> None:
+        """ Constructor.
+
+        :param network: the network to journal, empty or holding only what the directory records
+        :param directory: the directory of the journal, created if missing
+        :param sync_every: the number of records buffered before they are written and synced to disk
+        :param snapshot_every: the number of records after which a snapshot is taken, if any
+        """
+        self._network = network
+        self._directory = directory
+        self._sync_every = max(1, sync_every)
+        self._snapshot_every = snapshot_every
+        self._sequence = 0  # the sequence number of the last record
+        self._checkpoint = 0  # the sequence number of the last record covered by the snapshot
+        self._refs = {}  # id(WME or production) -> sequence number of the record adding it
+        self._alive = {}  # sequence number -> (op code, WME or production, payload or None for a WME)
+        self._buffer = bytearray()
+        self._pending = 0  # the number of records in the buffer
+        os.makedirs(directory, exist_ok=True)
+        self.recovered = self.recover()
+        self._file = open(os.path.join(directory, JOURNAL), 'ab')
+        network.attach(self)
+
+    def __enter__(self) -> 'Journal':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    @property
+    def sequence(self) -> int:
+        return self._sequence
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def recover(self) -> int:
+        """ Rebuild the network from the snapshot and the write-ahead file of the directory, if any.
+
+        The operations are applied as one batch: listeners receive only the net changes. A record torn by a crash
+        ends the write-ahead file, which is truncated there.
+
+        :return: the number of records applied
+        """
+        applied = 0
+        with self._network.batch():
+            path = os.path.join(self._directory, SNAPSHOT)
+            if os.path.exists(path):
+                with open(path, 'rb') as file:
+                    for code, sequence, payload, _ in read_records(file.read()):
+                        if code == CHECKPOINT:
+                            self._checkpoint = self._sequence = sequence
+                        else:
+                            self.apply(code, sequence, payload)
+                            applied += 1
+            path = os.path.join(self._directory, JOURNAL)
+            if os.path.exists(path):
+                with open(path, 'rb+') as file:
+                    data = file.read()
+                    valid = 0
+                    for code, sequence, payload, valid in read_records(data):
+                        if sequence > self._checkpoint:
+                            self.apply(code, sequence, payload)
+                            self._sequence = sequence
+                            applied += 1
+                    if valid < len(data):
+                        file.truncate(valid)
+
+        return applied
+
+    def apply(self, code: int, sequence: int, payload: bytes) -> None:
+        if code == ADD_WME:
+            target, ttl = decode_wme(payload)
+            self._network.add_wme(target, ttl)
+        elif code == ADD_PRODUCTION:
+            lhs, kwargs = parse_xml(payload.decode('utf-8'))[0]
+            target = self._network.add_production(lhs, **kwargs)
+        else:
+            ref, = REF.unpack(payload)
+            _, target, _ = self._alive.pop(ref)
+            del self._refs[id(target)]
+            if code == REMOVE_WME:
+                self._network.remove_wme(target)
+            else:
+                self._network.remove_production(target)
+            return
+
+        self._refs[id(target)] = sequence
+        self._alive[sequence] = (code, target, None if code == ADD_WME and ttl is None else payload)
+
+    def on_operation(self, name: str, args: Tuple[Any, ...], kwargs: Dict[str, Any], result: Any) -> None:
+        code = CODES.get(name)
+        if code is None:
+            return
+
+        if code in (ADD_WME, ADD_PRODUCTION):
+            target = args[0] if code == ADD_WME else result
+            if id(target) in self._refs:
+                return  # the WME was already added or the production shared, nothing changed
+            ttl = kwargs.get('ttl')
+            payload = encode_wme(target, ttl) if code == ADD_WME else self.encode_production(target, args[0], kwargs)
+        else:
+            ref = self._refs.pop(id(args[0]), None)
+            if ref is None:
+                return  # added before the journal was opened
+            del self._alive[ref]
+            payload = REF.pack(ref)
+        self._sequence += 1
+        if code in (ADD_WME, ADD_PRODUCTION):
+            self._refs[id(target)] = self._sequence
+            # the payload of a WME is rebuilt from the WME in a snapshot, but for its time-to-live
+            self._alive[self._sequence] = (code, target, None if code == ADD_WME and ttl is None else payload)
+        self._buffer += encode_record(code, self._sequence, payload)
+        self._pending += 1
+        if self._pending >= self._sync_every:
+            self.sync()
+        if self._snapshot_every and self._sequence - self._checkpoint >= self._snapshot_every:
+            self.snapshot()
+
+    def encode_production(self, production: Any, lhs: Any, kwargs: Dict[str, Any]) -> bytes:
+        try:
+            return dump_xml([(lhs, kwargs)]).encode('utf-8')
+        except TypeError:
+            # a production that cannot be recovered is refused
+            self._network.remove_production(production)
+            raise
+
+    def sync(self) -> None:
+        """ Write the buffered records to the write-ahead file and sync it to disk. """
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def snapshot(self) -> None:
+        """ Write the productions and WMEs alive to the snapshot, then truncate the write-ahead file.
+
+        The snapshot is written aside and renamed, so that a crash leaves either the old or the new one. Should the
+        write-ahead file survive a crash after the rename, its records up to the snapshot are skipped on recovery.
+        """
+        self.sync()
+        path = os.path.join(self._directory, SNAPSHOT)
+        with open(path + '.tmp', 'wb') as file:
+            self.write_snapshot(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + '.tmp', path)
+        self._checkpoint = self._sequence
+        self._file.truncate(0)
+        self.sync()
+
+    def write_snapshot(self, file: IO[bytes]) -> None:
+        file.write(encode_record(CHECKPOINT, self._sequence, b''))
+        for sequence, (code, target, payload) in self._alive.items():
+            file.write(encode_record(code, sequence, encode_wme(target) if payload is None else payload))
+
+    def close(self) -> None:
+        """ Sync the buffered records and stop journaling. """
+        if self._file.closed:
+            return
+
+        self._network.detach(self)
+        self.sync()
+        self._file.close()
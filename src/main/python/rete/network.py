@@ -1,62 +1,474 @@
 import io
+import weakref
+from itertools import chain
 
+from rete import Aggregate
 from rete import Bind
+from rete import Exists
 from rete import Filter
 from rete import Has
 from rete import Ncc
 from rete import Neg
+from rete import planner
+from rete import snapshots
+from rete import Within
+from rete.common import BindingTest
+from rete.common import ComparisonTest
+from rete.common import DYING
 from rete.common import FIELDS
 from rete.common import JoinNodeTest
 from rete.common import Token
+from rete.events import Dispatcher
+from rete.nodes import AggregateNode
+from rete.nodes import AggregatePartnerNode
 from rete.nodes import AlphaMemory
 from rete.nodes import BetaMemory
 from rete.nodes import BetaNode
 from rete.nodes import BindNode
 from rete.nodes import ConstantTestNode
+from rete.nodes import ExistsNode
 from rete.nodes import FilterNode
 from rete.nodes import JoinNode
 from rete.nodes import NccNode
 from rete.nodes import NccPartnerNode
 from rete.nodes import NegativeNode
 from rete.nodes import ProductionNode
+from rete.nodes import SortedMemory
+from rete.nodes import ThetaJoinNode
+from rete.nodes import WindowJoinNode
+from rete.nodes import WindowMemory
+from rete.predicates import accepts
+from rete.predicates import Expression
+from rete.query import lookup_alpha_memory
+from rete.query import Query
+from rete.sessions import Local
+from rete.sessions import own
+from rete.sessions import restore_pending
+from rete.sessions import STATE
+from rete.sessions import Transaction
+from rete.sessions import Session
+from rete.stats import activations
+from rete.stats import ancestors
+from rete.stats import cost_report
+from rete.stats import node_stats
+from rete.stats import path
+from rete.stats import Replan
+from rete.symbols import release
+from rete.timers import SystemClock
+from rete.timers import TimerWheel
+from rete.tms import TruthMaintenance
+from rete.utils import CONVERSE
 from rete.utils import is_var
+from rete.utils import variables
+
+MAIN = 'MAIN'  # the module of the productions added without one
 
 
 class Network:
+    # the state of the working memory, kept apart for every session; a fork starts with no observer or listener
+    observers = Local(list, inherit=None)
+    dispatcher = Local(Dispatcher, inherit=None)
+    tms = Local(TruthMaintenance, bound=True, inherit=TruthMaintenance.copy)
+    timers = Local(lambda network: TimerWheel(start=network.clock.now()), bound=True, inherit=TimerWheel.copy)
+    focus_stack = Local(lambda: [MAIN])
+    unlinked = Local(weakref.WeakSet)  # the join nodes serving only modules out of focus
+    version = Local(int)  # the number of operations performed, to detect the changes made under a transaction
 
-    def __init__(self):
+    def __init__(self, clock=None):
+        """
+        :param clock: the source of the current time for the WME time-to-live, an object exposing `now()`;
+            defaults to the monotonic system clock
+        """
         self.alpha_root = ConstantTestNode('no-test', amem=AlphaMemory())
         self.beta_root = BetaNode()
         self.buf = None
+        self.clock = clock or SystemClock()
+        self.timers = TimerWheel(start=self.clock.now())
+        self.windows = weakref.WeakSet()
+        self.prefixes = set()  # repr of the prefixes of the compiled rules
+        self.rules = {}  # ProductionNode -> (Rule as written, Rule as compiled)
+        self.modules = {}  # module -> {beta node: number of productions of the module it serves}
+
+    def session(self):
+        """ Open a new, empty working memory matched against the rules of this network.
+
+        :rtype: Session
+        """
+        return Session(self)
+
+    def fork(self):
+        """ Open a working memory starting from the current one, copied on write, for what-if evaluations.
+
+        The fork shares the memories of this network, or of the session entered, until it changes them. Discarding
+        it leaves the original working memory untouched.
+
+        :rtype: Session
+        """
+        state = STATE.get()
+        return Session(self, None, True) if state is None else state.fork()
+
+    def transaction(self):
+        """ Open a transaction over the current working memory, to be used as a context manager.
+
+        The operations performed inside are matched in a fork, invisible from outside. When the context closes,
+        they are committed as one batch of events; if it closes with an exception, they are rolled back, which
+        costs nothing as the original memories were never written.
+
+        :rtype: Transaction
+        """
+        return Transaction(self, STATE.get())
+
+    def snapshot(self, path):
+        """ Write the match state of the current working memory to the given file, to be restored by `restore`.
+
+        The WMEs and tokens are laid out as flat arrays of indexes, the rest of the state of the nodes is pickled
+        with its references to WMEs, tokens and nodes replaced by indexes.
+
+        :param path: the file to write, replaced atomically
+        """
+        snapshots.dump(self, path)
+
+    def restore(self, path):
+        """ Restore the match state written by `snapshot` into the current working memory, which must be empty.
+
+        The file is memory-mapped and no join is performed: the memories of every node are rebuilt from it when
+        first read, with the WMEs and tokens they reference, and all the rest once a WME is removed or a token
+        deleted. The network must compile the same productions, added in the same order, as the one the snapshot
+        was taken from. Only restore files you trust, as they contain pickles.
 
-    def add_production(self, lhs, **kwargs):
+        :param path: the file to read
+        """
+        snapshots.load(self, path)
+
+    def nodes(self):
+        """ Iterate over the nodes holding match state: the alpha memories, then the beta nodes.
+
+        The order depends only on the productions compiled and the order they were added in.
+
+        :rtype: iterator of AlphaMemory or BetaNode
+        """
+        alpha = [self.alpha_root]
+        while alpha:
+            node = alpha.pop()
+            if node.amem is not None:
+                yield node.amem
+            alpha.extend(reversed(list(node.children)))
+        seen = set()
+        beta = [self.beta_root]
+        while beta:
+            node = beta.pop()
+            if id(node) not in seen:
+                seen.add(id(node))
+                yield node
+                beta.extend(reversed(list(node.children)))
+
+    def attach(self, observer):
+        """ Register an observer notified after every operation that changes this network.
+
+        :param observer: an object exposing `on_operation(name, args, kwargs, result)`
+        """
+        if observer not in self.observers:
+            self.observers.append(observer)
+
+    def detach(self, observer):
+        """ Unregister an observer previously attached to this network.
+
+        :param observer: the observer to unregister
+        """
+        if observer in self.observers:
+            self.observers.remove(observer)
+
+    def notify(self, name, args, kwargs=None, result=None):
+        self.version += 1
+        for observer in list(self.observers):
+            observer.on_operation(name, args, kwargs or {}, result)
+
+    def batch(self):
+        """ Defer the production events raised inside the returned context until it closes.
+
+        Listeners then receive only the net changes: a match added and removed within the batch is not reported.
+
+        :rtype: contextmanager
+        """
+        return self.dispatcher.batch()
+
+    def add_production(self, lhs, reorder=False, module=MAIN, **kwargs):
         """
         :type kwargs:
         :type lhs: Rule
-        """
-        current_node = self.build_or_share_network_for_conditions(self.beta_root, lhs, [])
-        return self.build_or_share_p(current_node, **kwargs)
+        :param reorder: whether to compile the conditions ordered by estimated selectivity, see `planner.reorder`
+        :param module: the name of the module of the production, see `focus`
+        """
+        rule = planner.reorder(lhs, self.estimate, shared=self.is_compiled) if reorder else lhs
+        self.prefixes.update(repr(rule[:end]) for end in range(1, len(rule) + 1))
+        current_node = self.build_or_share_network_for_conditions(self.beta_root, rule, [])
+        node = self.build_or_share_p(current_node, module=module, **kwargs)
+        if node not in self.rules:
+            self.enlist(node)
+        self.rules[node] = (lhs, rule)
+        if module != MAIN:
+            kwargs = dict(kwargs, module=module)
+        self.notify('add_production', (lhs,), dict(kwargs, reorder=True) if reorder else kwargs, node)
+        return node
 
     def remove_production(self, node):
+        if self.rules.pop(node, None) is not None:
+            self.dismiss(node)
         self.delete_node_and_any_unused_ancestors(node)
+        self.notify('remove_production', (node,))
+        self.tms.drain()
+
+    @property
+    def focused(self):
+        """ The module on top of the focus stack, None if the stack is empty.
+
+        :rtype: str
+        """
+        return self.focus_stack[-1] if self.focus_stack else None
+
+    def focus(self, module):
+        """ Push the given module on the focus stack: only its productions are matched from now on.
+
+        The join nodes serving only productions of other modules are unlinked: they record the activations they
+        receive, and catch up with them once a module they serve is focused again.
+
+        :param module: the name of the module to focus
+        """
+        previous = self.focused
+        self.focus_stack.append(module)
+        self.refocus(chain(self.modules.get(previous, ()), self.modules.get(module, ())))
+
+    def pop_focus(self):
+        """ Pop the module on top of the focus stack, returning the focus to the one below.
+
+        :return: the name of the module popped, None if the stack is empty
+        """
+        module = self.focus_stack.pop() if self.focus_stack else None
+        self.refocus(chain(self.modules.get(module, ()), self.modules.get(self.focused, ())))
+        return module
+
+    def enlist(self, production):
+        """ Count the nodes of the given production as serving its module, and link or unlink them accordingly.
+
+        :type production: ProductionNode
+        """
+        nodes = self.modules.setdefault(production.module, {})
+        used = ancestors(production)
+        for node in used:
+            nodes[node] = nodes.get(node, 0) + 1
+        self.refocus(used)
+
+    def dismiss(self, production):
+        """ Stop counting the nodes of the given production as serving its module, see `enlist`.
+
+        :type production: ProductionNode
+        """
+        nodes = self.modules.get(production.module, {})
+        used = ancestors(production)
+        for node in used:
+            count = nodes.pop(node, 0) - 1
+            if count > 0:
+                nodes[node] = count
+        self.refocus(used)
+
+    def refocus(self, nodes):
+        """ Link the given join nodes if they serve the focused module or no module, and unlink the others.
+
+        :type nodes: iterable of BetaNode
+        """
+        wanted = self.modules.get(self.focused, {})
+        for node in nodes:
+            if node in wanted or not any(node in served for served in self.modules.values()):
+                if node in self.unlinked:
+                    self.unlinked.discard(node)
+                    node.link()
+            # a window join evicts its partners as time goes by: it cannot defer its activations
+            elif isinstance(node, JoinNode) and not isinstance(node, WindowJoinNode) and node.linked:
+                node.unlink()
+                self.unlinked.add(node)
+
+    def stats(self, production):
+        """ Return the running statistics of the nodes matching the given production, root first.
+
+        :type production: ProductionNode
+        :rtype: list of NodeStats
+        """
+        return [node_stats(n) for n in path(production)]
+
+    def cost_report(self, tracer=None):
+        """ Rank the productions by the work of the nodes they use, and by the tokens those nodes hold.
+
+        The pairs tested by the joins, the tokens created and the templates evaluated are counted by the nodes
+        since they were compiled; the work of a node shared by several productions is split evenly between them.
+
+        :param tracer: a `Tracer` attached to this network, to rank by the time spent in the cascades it recorded
+        :rtype: CostReport
+        """
+        return cost_report(self.rules, None if tracer is None else tracer.exclusive())
+
+    def replan(self, limit=None):
+        """ Recompile the productions whose conditions have a cheaper order for the current working memory.
 
-    def add_wme(self, wme):
+        The productions are considered from the one with most join activations on its path. Each is reordered
+        with `planner.reorder` using the current alpha memory sizes, and rebuilt if the estimated cost of the new
+        order is lower. A rebuilt production keeps its identity, listeners and logical assertions: its matches
+        are moved to the new path without raising events.
+
+        :param limit: the number of productions to consider, all if None
+        :rtype: list of Replan
+        """
+        productions = sorted(self.rules, key=activations, reverse=True)[:limit]
+        reports = []
+        for production in productions:
+            lhs, rule = self.rules[production]
+            better = planner.reorder(lhs, self.estimate)
+            before, after = planner.cost(rule, self.estimate), planner.cost(better, self.estimate)
+            count = activations(production)
+            if after >= before or repr(better) == repr(rule):
+                reports.append(Replan(production, before, after, count, False))
+                continue
+            self.dismiss(production)
+            self.rebuild(production, better)
+            self.enlist(production)
+            self.rules[production] = (lhs, better)
+            reports.append(Replan(production, before, after, count, True))
+        return reports
+
+    def rebuild(self, production, rule):
+        """ Move the given production below the nodes compiled for the given rule, keeping its matches.
+
+        :type production: ProductionNode
+        :type rule: Rule
+        """
+        self.prefixes.update(repr(rule[:end]) for end in range(1, len(rule) + 1))
+        current_node = self.build_or_share_network_for_conditions(self.beta_root, rule, [])
+        old_parent = production.parent
+        old_tokens = production.move(current_node)
+        listeners, production.listeners = production.listeners, []
+        self.update_new_node_with_matches_from_above(production)
+        production.listeners = listeners
+
+        def key(token):
+            wmes = tuple(sorted(id(w) for w in token.wmes if w is not None))
+            return wmes, tuple(sorted(token.all_binding().items(), key=lambda item: item[0]))
+
+        replacements = {}
+        for token in production.memory:
+            replacements.setdefault(key(token), []).append(token)
+        for token in old_tokens:
+            matching = replacements.get(key(token))
+            if matching:
+                self.tms.transfer(token, matching.pop())
+            else:
+                self.tms.release(token)
+            token.node = None
+            Token.delete_token_and_descendants(token)
+        if not old_parent.children:
+            self.delete_node_and_any_unused_ancestors(old_parent)
+        self.tms.drain()
+
+    def add_wme(self, wme, ttl=None):
+        """
+        :type wme: WME
+        :param ttl: the number of seconds after which the WME expires, if any
+        """
+        self.stamp(wme, ttl)
         self.alpha_root.activation(wme)
+        self.notify('add_wme', (wme,), None if ttl is None else {'ttl': ttl})
+        self.tms.drain()
 
-    @classmethod
-    def remove_wme(cls, wme):
+    def add_logical_wme(self, wme, token):
+        """ Add a WME that stays in working memory only while the given production match holds.
+
+        :type wme: WME
+        :type token: Token
+        :rtype: WME
         """
+        return self.tms.add(wme, token)
+
+    def stamp(self, wme, ttl):
+        """ Record the arrival time of the given WME, if not timestamped yet, and schedule its expiry.
+
         :type wme: WME
+        :param ttl: the number of seconds after which the WME expires, if any
         """
+        own(wme)
+        if wme.timestamp is None:
+            wme.timestamp = self.clock.now()
+        if ttl is not None:
+            self.timers.schedule(wme, self.clock.now() + ttl)
+
+    def advance_clock(self, now=None):
+        """ Retract, as a single batch, the WMEs whose time-to-live elapsed.
+
+        :param now: the current time, in seconds; defaults to the time of the clock of this network
+        :rtype: list of WME
+        """
+        now = self.clock.now() if now is None else now
+        for node in list(self.windows):
+            node.advance(now)
+        expired = self.timers.advance(now)
+        with self.batch():
+            for wme in expired:
+                self.remove_wme(wme)
+        return expired
+
+    def remove_wme(self, wme):
+        """
+        :type wme: WME
+        """
+        restore_pending()  # the memories and tokens referencing the WME must all be restored
+        self.timers.cancel(wme)
+        self.tms.discard(wme)
         for am in wme.amems:
             am.memory.remove(wme)
-        for t in wme.tokens:
-            Token.delete_token_and_descendants(t)
+            for child in am.children:
+                if isinstance(child, JoinNode):
+                    child.forget(wme)
+                elif isinstance(child, ExistsNode):
+                    child.right_retraction(wme)
+        DYING.add(id(wme))
+        while wme.tokens:
+            Token.delete_token_and_descendants(wme.tokens[0])
+        DYING.discard(id(wme))
         for jr in wme.negative_join_results:
-            jr.owner.join_results.remove(jr)
-            if not jr.owner.join_results:
-                for child in jr.owner.node.children:
-                    child.left_activation(jr.owner, None)
+            jr.owner.node.remove_join_result(jr)
+        self.notify('remove_wme', (wme,))
+        release(wme.identifier, wme.attribute, wme.value)
+        self.tms.drain()
+
+    def query(self, rule, binding=None):
+        """ Evaluate a one-off rule against the current working memory, without building any node.
+
+        :type rule: Rule
+        :type binding: dict
+        :rtype: generator of dict
+        """
+        return Query(rule, self.candidates).run(binding)
+
+    def candidates(self, condition):
+        """
+        :type condition: Has
+        :rtype: (list of WME, bool)
+        """
+        amem, exact = lookup_alpha_memory(self.alpha_root, condition)
+        return amem.memory, exact
+
+    def estimate(self, condition):
+        """ Return the number of WMEs expected to match the given condition, from the existing alpha memories.
+
+        :type condition: Has
+        :rtype: int
+        """
+        return len(self.candidates(condition)[0])
+
+    def is_compiled(self, prefix):
+        """ Check if the given conditions start a rule compiled earlier, so that their nodes can be shared.
+
+        :type prefix: list of BaseCondition
+        :rtype: bool
+        """
+        return repr(prefix) in self.prefixes
 
     def dump(self):
         self.buf = io.StringIO()
@@ -105,9 +517,10 @@ class Network:
         if node == self.beta_root:
             self.buf.write("    }\n")
 
-    def build_or_share_alpha_memory(self, condition):
+    def build_or_share_alpha_memory(self, condition, tests=()):
         """
         :type condition: Condition
+        :param tests: the list of (field, Predicate) also tested on the WMEs, after the constants of `condition`
         :rtype: AlphaMemory
         """
         path = []
@@ -115,9 +528,10 @@ class Network:
             v = getattr(condition, f)
             if not is_var(v):
                 path.append((f, v))
+        path.extend(tests)
         am = ConstantTestNode.build_or_share_alpha_memory(self.alpha_root, path)
         for w in self.alpha_root.amem.memory:
-            if condition.match(w):
+            if condition.match(w) and all(accepts(p, getattr(w, f)) for f, p in tests):
                 am.activation(w)
         return am
 
@@ -126,18 +540,75 @@ class Network:
         """
         :type c: Has
         :type earlier_conds: Rule
-        :rtype: list of JoinNodeTest
+        :rtype: list of JoinNodeTest or BindingTest
         """
         result = []
         for field_of_v, v in c.vars:
-            for idx, cond in enumerate(earlier_conds):
-                if isinstance(cond, Ncc) or isinstance(cond, Neg):
-                    continue
-                field_of_v2 = cond.contain(v)
-                if not field_of_v2:
-                    continue
-                t = JoinNodeTest(field_of_v, idx, field_of_v2)
-                result.append(t)
+            idx = 0  # the level of the token of each condition, filters and binds adding none
+            for cond in earlier_conds:
+                if isinstance(cond, Bind) and cond.symbol == v or isinstance(cond, Aggregate) and cond.to == v:
+                    result.append(BindingTest(field_of_v, v))
+                elif isinstance(cond, Has) and not isinstance(cond, (Neg, Exists)):
+                    field_of_v2 = cond.contain(v)
+                    if field_of_v2:
+                        result.append(JoinNodeTest(field_of_v, idx, field_of_v2))
+                if not isinstance(cond, (Filter, Bind)):
+                    idx += 1
+        return result
+
+    @classmethod
+    def get_comparison_tests_from_condition(cls, c, earlier_conds, later_conds):
+        """ Return the later `Filter` comparing a variable first bound by `c` with one bound earlier, as join tests.
+
+        :type c: Has
+        :type earlier_conds: Rule
+        :type later_conds: Rule
+        :rtype: list of (ComparisonTest, Filter)
+        """
+        bound = set()
+        for cond in earlier_conds:
+            if isinstance(cond, Has) and not isinstance(cond, (Neg, Exists)):
+                bound.update(v for _, v in cond.vars)
+            elif isinstance(cond, Bind):
+                bound.add(cond.symbol)
+            elif isinstance(cond, Aggregate):
+                bound.add(cond.to)
+        new = {v: f for f, v in reversed(c.vars) if v not in bound}
+        result = []
+        for cond in later_conds:
+            if not isinstance(cond, Filter) or not cond.comparison:
+                continue
+            left, op, right = cond.comparison
+            if left in new and right in bound:
+                result.append((ComparisonTest(new[left], op, right), cond))
+            elif right in new and left in bound:
+                result.append((ComparisonTest(new[right], CONVERSE[op], left), cond))
+        return result
+
+    @classmethod
+    def get_alpha_tests_from_condition(cls, c, earlier_conds, later_conds):
+        """ Return the later `Filter` referencing only a variable first bound by `c`, as alpha tests.
+
+        :type c: Has
+        :type earlier_conds: Rule
+        :type later_conds: Rule
+        :rtype: list of ((field, Expression), Filter)
+        """
+        bound = set()
+        for cond in earlier_conds:
+            if isinstance(cond, Has) and not isinstance(cond, (Neg, Exists)):
+                bound.update(v for _, v in cond.vars)
+            elif isinstance(cond, Bind):
+                bound.add(cond.symbol)
+            elif isinstance(cond, Aggregate):
+                bound.add(cond.to)
+        new = {v: f for f, v in reversed(c.vars) if v not in bound}
+        result = []
+        for cond in later_conds:
+            if isinstance(cond, Filter) and len(set(variables(cond.template))) == 1:
+                v = variables(cond.template)[0]
+                if v in new:
+                    result.append(((new[v], Expression(cond.template)), cond))
         return result
 
     @classmethod
@@ -168,12 +639,32 @@ class Network:
         :rtype: JoinNode
         """
         for child in parent.children:
-            if isinstance(child, NegativeNode) and child.amem == amem and child.tests == tests:
+            if type(child) is NegativeNode and child.amem == amem and child.tests == tests:
                 return child
 
         node = NegativeNode(parent=parent, amem=amem, tests=tests)
         parent.append_child(node)
         amem.append_child(node)
+        cls.update_new_node_with_matches_from_above(node)
+
+        return node
+
+    @classmethod
+    def build_or_share_exists_node(cls, parent, amem, tests):
+        """
+        :type parent: BetaNode
+        :type amem: AlphaMemory
+        :type tests: list of JoinNodeTest
+        :rtype: ExistsNode
+        """
+        for child in parent.children:
+            if isinstance(child, ExistsNode) and child.amem == amem and child.tests == tests:
+                return child
+
+        node = ExistsNode(parent=parent, amem=amem, tests=tests)
+        parent.append_child(node)
+        amem.append_child(node)
+        cls.update_new_node_with_matches_from_above(node)
 
         return node
 
@@ -183,7 +674,7 @@ class Network:
         :rtype: BetaMemory
         """
         for child in parent.children:
-            if isinstance(child, BetaMemory):
+            if isinstance(child, BetaMemory) and not isinstance(child, (WindowMemory, SortedMemory)):
                 return child
         node = BetaMemory(None, parent)
         # dummy top beta memory
@@ -193,16 +684,85 @@ class Network:
         self.update_new_node_with_matches_from_above(node)
         return node
 
-    def build_or_share_p(self, parent, **kwargs):
+    def build_or_share_window_memory(self, parent, window):
+        """
+        :type parent: BetaNode
+        :type window: float
+        :rtype: WindowMemory
+        """
+        for child in parent.children:
+            if isinstance(child, WindowMemory) and child.window == window:
+                return child
+        node = WindowMemory(None, parent, window)
+        parent.append_child(node)
+        self.update_new_node_with_matches_from_above(node)
+        return node
+
+    def build_or_share_sorted_memory(self, parent, variable):
+        """
+        :type parent: BetaNode
+        :type variable: str
+        :rtype: SortedMemory
+        """
+        for child in parent.children:
+            if isinstance(child, SortedMemory) and child.variable == variable:
+                return child
+        node = SortedMemory(None, parent, variable)
+        parent.append_child(node)
+        self.update_new_node_with_matches_from_above(node)
+        return node
+
+    @classmethod
+    def build_or_share_theta_join_node(cls, parent, amem, tests, has):
+        """
+        :type parent: SortedMemory
+        :type amem: AlphaMemory
+        :type tests: list of JoinNodeTest or ComparisonTest
+        :type has: Has
+        :rtype: ThetaJoinNode
+        """
+        for child in parent.children:
+            if isinstance(child, ThetaJoinNode) and child.amem == amem and child.tests == tests and child.has == has:
+                return child
+
+        node = ThetaJoinNode([], parent, amem, tests, has)
+        parent.append_child(node)
+        amem.append_child(node)
+
+        return node
+
+    def build_or_share_window_join_node(self, parent, amem, tests, within):
+        """
+        :type parent: WindowMemory
+        :type amem: AlphaMemory
+        :type tests: list of JoinNodeTest
+        :type within: Within
+        :rtype: WindowJoinNode
+        """
+        for child in parent.children:
+            if isinstance(child, WindowJoinNode) and child.amem == amem and child.tests == tests \
+                    and child.has == within:
+                return child
+
+        node = WindowJoinNode([], parent, amem, tests, within)
+        parent.append_child(node)
+        amem.append_child(node)
+        self.windows.add(node)
+
+        return node
+
+    def build_or_share_p(self, parent, module=MAIN, **kwargs):
         """
         :type kwargs:
         :type parent: BetaNode
+        :type module: str
         :rtype: ProductionNode
         """
         for child in parent.children:
-            if isinstance(child, ProductionNode):
+            if isinstance(child, ProductionNode) and child.module == module:
                 return child
-        node = ProductionNode(None, parent, **kwargs)
+        node = ProductionNode(None, parent, module=module, **kwargs)
+        node.network = self
         parent.append_child(node)
         self.update_new_node_with_matches_from_above(node)
         return node
@@ -213,7 +773,7 @@ class Network:
         :type ncc: Ncc
         :type parent: BetaNode
         """
-        bottom_of_subnetwork = self.build_or_share_network_for_conditions(parent, ncc, earlier_conds)
+        bottom_of_subnetwork = self.build_or_share_network_for_conditions(parent, ncc, list(earlier_conds))
         for child in parent.children:
             if isinstance(child, NccNode) and child.partner.parent == bottom_of_subnetwork:
                 return child
@@ -228,6 +788,28 @@ class Network:
         self.update_new_node_with_matches_from_above(ncc_partner)
         return ncc_node
 
+    def build_or_share_aggregate_nodes(self, parent, aggregate, earlier_conds):
+        """
+        :type earlier_conds: Rule
+        :type aggregate: Aggregate
+        :type parent: BetaNode
+        :rtype: AggregateNode
+        """
+        bottom_of_subnetwork = self.build_or_share_network_for_conditions(parent, aggregate, list(earlier_conds))
+        for child in parent.children:
+            if isinstance(child, AggregateNode) and child.partner.parent == bottom_of_subnetwork and \
+                    (child.function, child.to, child.partner.of) == (aggregate.function, aggregate.to, aggregate.of):
+                return child
+        aggregate_node = AggregateNode([], parent, aggregate.function, aggregate.to)
+        partner = AggregatePartnerNode([], bottom_of_subnetwork, aggregate_node, aggregate.number_of_conditions,
+                                       aggregate.of)
+        aggregate_node.partner = partner
+        parent.append_child(aggregate_node)
+        bottom_of_subnetwork.append_child(partner)
+        self.update_new_node_with_matches_from_above(partner)
+        self.update_new_node_with_matches_from_above(aggregate_node)
+        return aggregate_node
+
     def build_or_share_filter_node(self, parent, f):
         """
         :type f: Filter
@@ -261,67 +843,120 @@ class Network:
         """
         current_node = parent
         conds_higher_up = earlier_conds
-        for cond in rule:
-            if isinstance(cond, Neg):
-                tests = self.get_join_tests_from_condition(cond, conds_higher_up)
-                am = self.build_or_share_alpha_memory(cond)
-                current_node = self.build_or_share_negative_node(current_node, am, tests)
-            elif isinstance(cond, Has):
-                current_node = self.build_or_share_beta_memory(current_node)
-                tests = self.get_join_tests_from_condition(cond, conds_higher_up)
-                am = self.build_or_share_alpha_memory(cond)
-                current_node = self.build_or_share_join_node(current_node, am, tests, cond)
-            elif isinstance(cond, Ncc):
-                current_node = self.build_or_share_ncc_nodes(current_node, cond, conds_higher_up)
-            elif isinstance(cond, Filter):
-                current_node = self.build_or_share_filter_node(current_node, cond)
-            elif isinstance(cond, Bind):
-                current_node = self.build_or_share_bind_node(current_node, cond)
+        absorbed = []  # the Filter performed by the join nodes
+        for position, cond in enumerate(rule):
+            if not any(cond is f for f in absorbed):
+                current_node = self.build_or_share_condition(current_node, cond, conds_higher_up,
+                                                             rule[position + 1:], absorbed)
             conds_higher_up.append(cond)
         return current_node
 
+    def build_or_share_condition(self, parent, cond, earlier_conds, later_conds, absorbed):
+        """ Build or share the nodes matching the given condition below the given node.
+
+        :type parent: BetaNode
+        :type cond: BaseCondition
+        :type earlier_conds: list of BaseCondition
+        :type later_conds: list of BaseCondition
+        :param absorbed: the filters performed by the join nodes, extended with those the new nodes perform
+        :rtype: BetaNode
+        """
+        if isinstance(cond, (Neg, Exists)):
+            tests = self.get_join_tests_from_condition(cond, earlier_conds)
+            am = self.build_or_share_alpha_memory(cond)
+            if isinstance(cond, Neg):
+                return self.build_or_share_negative_node(parent, am, tests)
+            return self.build_or_share_exists_node(parent, am, tests)
+        if isinstance(cond, Within):
+            return self.build_or_share_within_nodes(parent, cond, earlier_conds)
+        if isinstance(cond, Has):
+            return self.build_or_share_has_nodes(parent, cond, earlier_conds, later_conds, absorbed)
+        if isinstance(cond, Ncc):
+            return self.build_or_share_ncc_nodes(parent, cond, earlier_conds)
+        if isinstance(cond, Aggregate):
+            if parent is self.beta_root:
+                raise ValueError(f"{cond} aggregates no earlier condition")
+            return self.build_or_share_aggregate_nodes(parent, cond, earlier_conds)
+        if isinstance(cond, Filter):
+            return self.build_or_share_filter_node(parent, cond)
+        if isinstance(cond, Bind):
+            return self.build_or_share_bind_node(parent, cond)
+        return parent
+
+    def build_or_share_within_nodes(self, parent, cond, earlier_conds):
+        """
+        :type parent: BetaNode
+        :type cond: Within
+        :type earlier_conds: list of BaseCondition
+        :rtype: WindowJoinNode
+        """
+        if not any(isinstance(c, Has) and not isinstance(c, (Neg, Exists)) for c in earlier_conds):
+            raise ValueError(f"{cond} follows no earlier condition")
+        memory = self.build_or_share_window_memory(parent, cond.window)
+        tests = self.get_join_tests_from_condition(cond, earlier_conds)
+        am = self.build_or_share_alpha_memory(cond)
+        return self.build_or_share_window_join_node(memory, am, tests, cond)
+
+    def build_or_share_has_nodes(self, parent, cond, earlier_conds, later_conds, absorbed):
+        """ Build or share the join matching the given positive condition, performing the filters it can absorb.
+
+        :type parent: BetaNode
+        :type cond: Has
+        :type earlier_conds: list of BaseCondition
+        :type later_conds: list of BaseCondition
+        :param absorbed: the filters performed by the join nodes, extended with those the new nodes perform
+        :rtype: JoinNode
+        """
+        tests = self.get_join_tests_from_condition(cond, earlier_conds)
+        pushed = self.get_alpha_tests_from_condition(cond, earlier_conds, later_conds)
+        absorbed.extend(f for _, f in pushed)
+        am = self.build_or_share_alpha_memory(cond, [t for t, _ in pushed])
+        comparisons = []
+        if parent is not self.beta_root:
+            comparisons = self.get_comparison_tests_from_condition(cond, earlier_conds, later_conds)
+        if comparisons:
+            absorbed.extend(f for _, f in comparisons)
+            memory = self.build_or_share_sorted_memory(parent, comparisons[0][0].variable)
+            return self.build_or_share_theta_join_node(memory, am, tests + [t for t, _ in comparisons], cond)
+
+        memory = self.build_or_share_beta_memory(parent)
+        return self.build_or_share_join_node(memory, am, tests, cond)
+
     @classmethod
     def update_new_node_with_matches_from_above(cls, new_node):
         """
         :type new_node: BetaNode
         """
-        parent = new_node.parent
-        if isinstance(parent, BetaMemory):
-            for tok in parent.memory:
-                new_node.left_activation(tok, None)
-
-        elif isinstance(parent, JoinNode):
-            saved_list_of_children = parent.replace_children(new_node)
-            for item in parent.amem.memory:
-                parent.right_activation(item)
-            parent.replace_children(*saved_list_of_children)
-
-            # saved_list_of_children = parent.children
-            # parent.children = [new_node]
-            # for item in parent.amem.memory:
-            #     parent.right_activation(item)
-            # parent.children = saved_list_of_children
-
-        elif isinstance(parent, NegativeNode):
-            for token in parent.memory:
-                if not token.join_results:
-                    new_node.left_activation(token, None)
-
-        elif isinstance(parent, NccNode):
-            for token in parent.memory:
-                if not token.ncc_results:
-                    new_node.left_activation(token, None)
+        new_node.parent.replay_into(new_node)
 
     @classmethod
     def delete_node_and_any_unused_ancestors(cls, node):
         """
         :type node: BetaNode
         """
-        if isinstance(node, JoinNode):
+        if isinstance(node, (JoinNode, NegativeNode)):
             node.amem.remove_child(node)
-        else:
-            for item in node.memory:
-                Token.delete_token_and_descendants(item)
+        for item in list(getattr(node, 'memory', [])):
+            Token.delete_token_and_descendants(item)
+        if isinstance(node, (NccNode, AggregateNode)):
+            cls.delete_node_and_any_unused_ancestors(node.partner)
         node.parent.remove_child(node)
-        if not node.parent.children:
+        if not node.parent.children and node.parent.parent is not None:
             cls.delete_node_and_any_unused_ancestors(node.parent)
+
+
+def create_network(engine='rete', clock=None):
+    """ Return an empty network matching with the given engine.
+
+    :param engine: 'rete' to store partial matches in beta memories, 'treat' to keep only alpha memories and
+        conflict sets
+    :param clock: the source of the current time for the WME time-to-live
+    :rtype: Network
+    """
+    if engine == 'rete':
+        return Network(clock)
+    if engine == 'treat':
+        from rete.treat import TreatNetwork
+        return TreatNetwork(clock)
+
+    raise ValueError(f"unknown engine: '{engine}'")
@@ -1,3 +1,4 @@
+import bisect
 import copy
 from typing import Any
 from typing import Dict
@@ -7,15 +8,35 @@ from typing import Optional
 from typing import Tuple
 from typing import Union
 
+from rete.aggregates import AGGREGATORS
+from rete.common import BindingTest
+from rete.common import ComparisonTest
 from rete.common import FIELDS
 from rete.common import NegativeJoinResult
 from rete.common import Token
 from rete.common import WME
+from rete.events import ADDED
+from rete.events import Listener
+from rete.events import notify
+from rete.events import REMOVED
+from rete.predicates import accepts
+from rete.predicates import Predicate
+from rete.predicates import PredicateIndex
+from rete.sessions import Local
+from rete.symbols import intern
+from rete.utils import compare
+from rete.utils import CONVERSE
+from rete.utils import evaluate
+from rete.utils import Identity
+from rete.utils import number
+from rete.utils import ordinal
 
 
 class AlphaMemory:
     from rete.common import WME
 
+    _memory = Local(list)
+
     def __init__(self, memory: List[WME] = None, children: List[Union['JoinNode', 'NegativeNode']] = None):
         """ Constructor.
 
@@ -52,7 +73,7 @@ class AlphaMemory:
         if child not in self._children:
             raise ValueError('unknown child')
 
-        self._children.append(child)
+        self._children.remove(child)
 
     def replace_children(self, *child: Union['JoinNode', 'NegativeNode']) -> List[Union['JoinNode', 'NegativeNode']]:
         result = self._children
@@ -84,15 +105,27 @@ class ConstantTestNode:
         return ConstantTestNode.build_or_share_alpha_memory(next_node, path)
 
     @staticmethod
-    def build_or_share_constant_test_node(parent: 'ConstantTestNode', field: str, symbol: str) -> 'ConstantTestNode':
+    def build_or_share_constant_test_node(parent: 'ConstantTestNode', field: str, symbol: Any) -> 'ConstantTestNode':
         """ Build or share ConstantTestNode from given `parent` for given `field` and `symbol`.
 
+        Nodes testing a `Predicate` are not linked as plain children but indexed by field, so that a WME is only
+        passed to the predicates it satisfies.
+
         :param parent: the parent node
         :param field: the field to test
-        :param symbol: the symbol to match
+        :param symbol: the symbol to match, or the `Predicate` to satisfy
         :return: the desired `ConstantTestNode`
         """
-        for child in parent.children:
+        if isinstance(symbol, Predicate):
+            index = parent._indexes.setdefault(field, PredicateIndex())
+            new_node = index.find(symbol)
+            if new_node is None:
+                new_node = ConstantTestNode(field, symbol, children=[])
+                index.add(new_node)
+
+            return new_node
+
+        for child in parent._children:
             if child._field == field and child._symbol == symbol:
                 return child
 
@@ -104,21 +137,22 @@ class ConstantTestNode:
     def __init__(
             self,
             field: str,
-            symbol: str = None,
+            symbol: Any = None,
             amem: AlphaMemory = None,
             children: List['ConstantTestNode'] = None,
     ) -> None:
         """ Constructor.
 
         :param field: the field to test
-        :param symbol: the symbol to match, if any
+        :param symbol: the symbol to match or the `Predicate` to satisfy, if any
         :param amem: the corresponding `AlphaMemory`
         :param children: the list of ConstantTestNode successors
         """
         self._field = field
-        self._symbol = symbol
+        self._symbol = intern(symbol)
         self._amem = amem
         self._children = children or []
+        self._indexes = {}  # field -> PredicateIndex of the successors testing a Predicate
 
     def __repr__(self) -> str:
         if not self._symbol and self._field == 'no-test':
@@ -144,7 +178,7 @@ class ConstantTestNode:
 
     @property
     def children(self) -> Iterable['ConstantTestNode']:
-        return self._children
+        return self._children + [child for index in self._indexes.values() for child in index.nodes]
 
     def dump(self) -> str:
         """ Return the descriptor for this node.
@@ -159,21 +193,33 @@ class ConstantTestNode:
         :param wme: the activating payload
         """
         if self._field != 'no-test':
-            symbol = getattr(wme, self._field)
-            if symbol != self._symbol:
+            if not accepts(self._symbol, getattr(wme, self._field)):
                 return False
 
+        self.propagate(wme)
+
+    def propagate(self, wme: WME) -> None:
+        """ Pass the given WME, known to pass the test of this node, to the alpha memory and the successors.
+
+        :param wme: the activating payload
+        """
         if self._amem:
             self._amem.activation(wme)
         for child in self._children:
             child.activation(wme)
+        for field, index in self._indexes.items():
+            for child in index.search(getattr(wme, field)):
+                child.propagate(wme)
 
 
 class BetaNode(object):
 
+    created = Local(int)  # number of tokens created for the node, counted in the working memory they belong to
+
     def __init__(self, children: List[Any] = None, parent: Any = None) -> None:
         self._children = children or []
         self._parent = parent
+        self.created = 0  # number of tokens created for the node
 
     @property
     def children(self) -> Iterable[Any]:
@@ -194,7 +240,7 @@ class BetaNode(object):
         if child not in self._children:
             raise ValueError('unknown child')
 
-        self._children.append(child)
+        self._children.remove(child)
 
     def replace_children(self, *child: Any) -> List[Any]:
         result = self._children
@@ -215,9 +261,19 @@ class BetaNode(object):
         for child in self.children:
             child.left_activation(new_token)
 
+    def replay_into(self, new_node: Any) -> None:
+        """ Activate the given new child with the matches of this node, as if they were made after it was added.
+
+        :param new_node: the new child of this node
+        """
+
 
 class BetaMemory(BetaNode):
 
+    # the memory right below the root starts with the dummy token, joined with the first condition
+    _memory = Local(lambda node: [Token(None, None)] if node.parent is not None and node.parent.parent is None
+                    else [], bound=True)
+
     def __init__(self, children: List[Any] = None, parent=None, memory: List[Token] = None):
         """
         :type memory: list of Token
@@ -241,6 +297,10 @@ class BetaMemory(BetaNode):
         for child in self.children:
             child.left_activation(new_token)
 
+    def replay_into(self, new_node: Any) -> None:
+        for tok in self.memory:
+            new_node.left_activation(tok, None)
+
     def append_token(self, token: Token) -> None:
         self._memory.append(token)
 
@@ -248,8 +308,165 @@ class BetaMemory(BetaNode):
         self._memory.remove(token)
 
 
+def span(keys: List[float], op: str, value: float) -> Tuple[int, int]:
+    """ Return the bounds of the sorted keys satisfying the given comparison with the given value.
+
+    :param keys: the sorted keys, with -inf standing for the non-numeric ones
+    :param op: the operator, a key of `OPERATORS`
+    :param value: the right operand
+    :return: the start and the end of the keys `k` such that `k op value`
+    """
+    start = bisect.bisect_right(keys, float('-inf'))
+    if op == '<':
+        return start, bisect.bisect_left(keys, value)
+    if op == '<=':
+        return start, bisect.bisect_right(keys, value)
+    if op == '>':
+        return bisect.bisect_right(keys, value), len(keys)
+
+    return bisect.bisect_left(keys, value), len(keys)
+
+
+class SortedMemory(BetaMemory):
+    """ A beta memory keeping its tokens ordered by the numeric value bound to a variable, for a `ThetaJoinNode`. """
+
+    _keys = Local(list)
+
+    def __init__(self, children: List[Any] = None, parent: Any = None, variable: str = None) -> None:
+        """ Constructor.
+
+        :param children: the children nodes
+        :param parent: the parent node
+        :param variable: the variable ordering the tokens
+        """
+        super(SortedMemory, self).__init__(children=children, parent=parent)
+        self.variable = variable
+        self._keys = []
+
+    def key(self, token: Token) -> float:
+        key = ordinal(token.get_binding(self.variable))
+        return float('-inf') if key is None else key
+
+    def left_activation(self, token, wme, binding=None):
+        """
+        :type binding: dict
+        :type wme: WME
+        :type token: Token
+        """
+        new_token = Token(token, wme, node=self, binding=binding)
+        self.append_token(new_token)
+        for child in self.children:
+            child.left_activation(new_token)
+
+    def append_token(self, token: Token) -> None:
+        key = self.key(token)
+        position = bisect.bisect_right(self._keys, key)
+        self._keys.insert(position, key)
+        self._memory.insert(position, token)
+
+    def remove_token(self, token: Token) -> None:
+        key = self.key(token)
+        for position in range(bisect.bisect_left(self._keys, key), bisect.bisect_right(self._keys, key)):
+            if self._memory[position] is token:
+                del self._keys[position]
+                del self._memory[position]
+                return
+
+    def compared(self, op: str, value: float) -> List[Token]:
+        """ Return the tokens whose value satisfies the given comparison with the given value.
+
+        :param op: the operator, a key of `OPERATORS`
+        :param value: the right operand
+        :return: the tokens `t` such that `t op value`, in order of value
+        """
+        start, end = span(self._keys, op, value)
+
+        return self._memory[start:end]
+
+
+class WindowMemory(BetaMemory):
+    """ A beta memory keeping its tokens ordered by the time of their latest WME.
+
+    The tokens too old to be followed by a new WME within the window are evicted: they stay in the token tree, so
+    their matches are retracted as usual, but they are not joined with new WMEs any more.
+    """
+
+    _times = Local(list)
+    _evicted = Local(set)
+
+    def __init__(self, children: List[Any] = None, parent: Any = None, window: float = 0) -> None:
+        """ Constructor.
+
+        :param children: the children nodes
+        :param parent: the parent node
+        :param window: the maximum delay between the latest WME of a token and the WMEs joined with it
+        """
+        super(WindowMemory, self).__init__(children=children, parent=parent)
+        self.window = window
+        self._times = []
+        self._evicted = set()  # id(Token) of the tokens evicted, still in the token tree
+
+    @staticmethod
+    def time(token: Token) -> float:
+        times = [w.timestamp for w in token.wmes if w is not None and w.timestamp is not None]
+        return max(times) if times else float('-inf')
+
+    def left_activation(self, token, wme, binding=None):
+        """
+        :type binding: dict
+        :type wme: WME
+        :type token: Token
+        """
+        new_token = Token(token, wme, node=self, binding=binding)
+        self.append_token(new_token)
+        for child in self.children:
+            child.left_activation(new_token)
+
+    def append_token(self, token: Token) -> None:
+        time = self.time(token)
+        position = bisect.bisect_right(self._times, time)
+        self._times.insert(position, time)
+        self._memory.insert(position, token)
+
+    def remove_token(self, token: Token) -> None:
+        if id(token) in self._evicted:
+            self._evicted.discard(id(token))
+            return
+
+        time = self.time(token)
+        for position in range(bisect.bisect_left(self._times, time), bisect.bisect_right(self._times, time)):
+            if self._memory[position] is token:
+                del self._times[position]
+                del self._memory[position]
+                return
+
+        raise ValueError(f"unknown token: {token}")
+
+    def between(self, start: float, end: float) -> List[Token]:
+        """ Return the tokens whose time is in the given interval.
+
+        :param start: the lower bound of the interval, included
+        :param end: the upper bound of the interval, included
+        :return: the tokens in the interval, oldest first
+        """
+        return self._memory[bisect.bisect_left(self._times, start):bisect.bisect_right(self._times, end)]
+
+    def evict(self, horizon: float) -> None:
+        """ Drop the tokens that no WME newer than the given time can follow within the window.
+
+        :param horizon: the time of the oldest WME that can still arrive
+        """
+        position = bisect.bisect_left(self._times, horizon - self.window)
+        if position:
+            self._evicted.update(Identity(id(t)) for t in self._memory[:position])
+            del self._times[:position]
+            del self._memory[:position]
+
+
 class BindNode(BetaNode):
 
+    evaluations = Local(int)
+
     def __init__(self, children, parent, template, to):
         """
         :type children:
@@ -259,6 +476,7 @@ class BindNode(BetaNode):
         super(BindNode, self).__init__(children=children, parent=parent)
         self.template = template
         self.bind = to
+        self.evaluations = 0  # number of templates evaluated
 
     def left_activation(self, token, wme, binding=None):
         """
@@ -266,20 +484,27 @@ class BindNode(BetaNode):
         :type wme: WME
         :type token: Token
         """
-        code = self.template
+        self.evaluations += 1
+        binding = binding or {}
         all_binding = token.all_binding()
         all_binding.update(binding)
-        for k in all_binding:
-            code = code.replace(k, str(all_binding[k]))
-        result = eval(code)
+        result = evaluate(self.template, all_binding)
         binding[self.bind] = result
         for child in self.children:
             binding = copy.deepcopy(binding)
             child.left_activation(token, wme, binding)
 
+    def replay_into(self, new_node: Any) -> None:
+        # no memory is kept: replay the matches of the parent through this node
+        saved_list_of_children = self.replace_children(new_node)
+        self.parent.replay_into(self)
+        self.replace_children(*saved_list_of_children)
+
 
 class FilterNode(BetaNode):
 
+    evaluations = Local(int)
+
     def __init__(self, children, parent, template):
         """ Constructor.
 
@@ -289,6 +514,7 @@ class FilterNode(BetaNode):
         """
         super(FilterNode, self).__init__(children=children, parent=parent)
         self.template = template
+        self.evaluations = 0  # number of templates evaluated
 
     def left_activation(self, token, wme, binding=None):
         """
@@ -296,20 +522,32 @@ class FilterNode(BetaNode):
         :type wme: WME
         :type token: Token
         """
-        code = self.template
+        self.evaluations += 1
+        binding = binding or {}
         all_binding = token.all_binding()
         all_binding.update(binding)
-        for k in all_binding:
-            code = code.replace(k, str(all_binding[k]))
-        result = eval(code)
+        result = evaluate(self.template, all_binding)
         if bool(result):
             for child in self.children:
                 child.left_activation(token, wme, binding)
 
+    def replay_into(self, new_node: Any) -> None:
+        # no memory is kept: replay the matches of the parent through this node
+        saved_list_of_children = self.replace_children(new_node)
+        self.parent.replay_into(self)
+        self.replace_children(*saved_list_of_children)
+
 
 class JoinNode(BetaNode):
     from rete.common import WME
 
+    linked = Local(lambda: True)
+    _backlog = Local(dict)
+    _pending = Local(list)
+    activations = Local(int)
+    matches = Local(int)
+    tested = Local(int)
+
     def __init__(self, children, parent, amem, tests, has):
         """
         :type children:
@@ -322,28 +560,91 @@ class JoinNode(BetaNode):
         self.amem = amem
         self.tests = tests
         self.has = has
+        self.activations = 0  # number of left and right activations
+        self.matches = 0  # number of join results passed to the children
+        self.tested = 0  # number of token and WME pairs tested
+        self.linked = True
+        self._backlog = {}  # id(WME) -> WME, the right activations received while unlinked
+        self._pending = []  # the left activations received while unlinked
 
     def right_activation(self, wme: WME) -> None:
         """
 
         :param wme: the activation WME
         """
-        for token in self.parent.memory:
-            if self.perform_join_test(token, wme):
-                binding = self.make_binding(wme)
-                for child in self.children:
-                    child.left_activation(token, wme, binding)
+        if not self.linked:
+            self._backlog[Identity(id(wme))] = wme
+            return
+
+        self.join_right(wme)
+
+    def replay_into(self, new_node: Any) -> None:
+        if not self.linked:
+            # catch up first, or the activations it recorded would reach the new node twice
+            self.link()
+        saved_list_of_children = self.replace_children(new_node)
+        for item in self.amem.memory:
+            self.right_activation(item)
+        self.replace_children(*saved_list_of_children)
 
     def left_activation(self, token: Token) -> None:
         """
 
         :param token: the activation Token
         """
-        for wme in self.amem.memory:
+        if not self.linked:
+            self._pending.append(token)
+            return
+
+        self.join_left(token)
+
+    def join_right(self, wme: WME) -> None:
+        """ Join the given WME with the tokens of the parent memory.
+
+        :param wme: the activation WME
+        """
+        self.activations += 1
+        for token in self.parent.memory:
             if self.perform_join_test(token, wme):
-                binding = self.make_binding(wme)
-                for child in self.children:
-                    child.left_activation(token, wme, binding)
+                self.emit(token, wme)
+
+    def join_left(self, token: Token) -> None:
+        """ Join the given token with the WMEs of the alpha memory, but those still waiting in the backlog.
+
+        :param token: the activation Token
+        """
+        self.activations += 1
+        for wme in self.amem.memory:
+            if id(wme) not in self._backlog and self.perform_join_test(token, wme):
+                self.emit(token, wme)
+
+    def unlink(self) -> None:
+        """ Stop joining: the activations received from now on are only recorded, until `link` is called. """
+        self.linked = False
+
+    def link(self) -> None:
+        """ Resume joining, catching up with the activations received while unlinked.
+
+        The pending tokens are joined first, with the WMEs that were already there; the WMEs of the backlog are
+        then joined with every token, so that each pair is joined exactly once.
+        """
+        self.linked = True
+        pending, self._pending = self._pending, []
+        alive = {id(t) for t in self.parent.memory}
+        for token in pending:
+            if id(token) in alive:
+                self.join_left(token)
+        backlog = list(self._backlog.values())
+        self._backlog.clear()
+        for wme in backlog:
+            self.join_right(wme)
+
+    def forget(self, wme: WME) -> None:
+        """ Drop the given WME, which is being removed from working memory.
+
+        :param wme: the removed WME
+        """
+        self._backlog.pop(id(wme), None)
 
     def perform_join_test(self, token: Token, wme: WME) -> bool:
         """
@@ -352,8 +653,17 @@ class JoinNode(BetaNode):
         :param wme: the WME on which to try to perform the join
         :return: True if the the join is possible, False otherwise
         """
+        self.tested += 1
         for this_test in self.tests:
             arg1 = getattr(wme, this_test.field1)
+            if isinstance(this_test, BindingTest):
+                if number(arg1) != number(token.get_binding(this_test.variable)):
+                    return False
+                continue
+            if isinstance(this_test, ComparisonTest):
+                if not compare(arg1, this_test.operator, token.get_binding(this_test.variable)):
+                    return False
+                continue
             wme2 = token.wmes[this_test.condition2]
             arg2 = getattr(wme2, this_test.field2)
             if arg1 != arg2:
@@ -361,6 +671,21 @@ class JoinNode(BetaNode):
 
         return True
 
+    def emit(self, token: Token, wme: WME) -> None:
+        """ Pass the join of the given token and WME to the children.
+
+        :param token: the matching Token
+        :param wme: the matching WME
+        """
+        self.matches += 1
+        binding = self.make_binding(wme)
+        for child in self.children:
+            child.left_activation(token, wme, binding)
+
+    @property
+    def fan_out(self) -> float:
+        return self.matches / self.activations if self.activations else 0.0
+
     def make_binding(self, wme: WME) -> Dict[str, str]:
         """
 
@@ -370,8 +695,196 @@ class JoinNode(BetaNode):
         return {v: getattr(wme, f) for f, v in self.has.vars}
 
 
+class WindowJoinNode(JoinNode):
+    """ A join node matching the WMEs that follow the tokens of its `WindowMemory` parent within its window.
+
+    Both inputs are ordered by time, so the partners of an activation are found by bisection instead of being
+    tested one by one. Facts may arrive out of time order by up to one window: the WMEs and tokens older than the
+    newest time seen minus the window are evicted, as only the facts later than that can still be matched.
+    """
+
+    watermark = Local(lambda: float('-inf'))
+    _wmes = Local(list)
+    _times = Local(list)
+    _indexed = Local(set)
+
+    def __init__(self, children, parent, amem, tests, has):
+        """
+        :type children:
+        :type parent: WindowMemory
+        :type amem: AlphaMemory
+        :type tests: list of TestAtJoinNode
+        :type has: Within
+        """
+        super(WindowJoinNode, self).__init__(children, parent, amem, tests, has)
+        self.watermark = float('-inf')
+        self._wmes = []
+        self._times = []
+        self._indexed = set()  # id(WME) of the WMEs in _wmes
+        for wme in amem.memory:
+            self.index(wme)
+
+    @property
+    def window(self) -> float:
+        return self.has.window
+
+    def index(self, wme: WME) -> None:
+        if id(wme) in self._indexed or wme.timestamp is None or wme.timestamp < self.watermark - self.window:
+            return
+
+        position = bisect.bisect_right(self._times, wme.timestamp)
+        self._times.insert(position, wme.timestamp)
+        self._wmes.insert(position, wme)
+        self._indexed.add(Identity(id(wme)))
+
+    def forget(self, wme: WME) -> None:
+        """ Drop the given WME, which is being removed from working memory.
+
+        :param wme: the removed WME
+        """
+        super(WindowJoinNode, self).forget(wme)
+        if id(wme) not in self._indexed:
+            return
+
+        self._indexed.discard(id(wme))
+        start = bisect.bisect_left(self._times, wme.timestamp)
+        position = next(i for i in range(start, len(self._wmes)) if self._wmes[i] is wme)
+        del self._times[position]
+        del self._wmes[position]
+
+    def advance(self, now: float) -> None:
+        """ Move the watermark of this node forward, evicting the partners out of the window from then on.
+
+        :param now: the time of the newest WME seen
+        """
+        if now <= self.watermark:
+            return
+
+        self.watermark = now
+        position = bisect.bisect_left(self._times, now - self.window)
+        if position:
+            for wme in self._wmes[:position]:
+                self._indexed.discard(id(wme))
+            del self._times[:position]
+            del self._wmes[:position]
+        self.parent.evict(now - self.window)
+
+    def join_right(self, wme: WME) -> None:
+        """
+
+        :param wme: the activation WME
+        """
+        self.activations += 1
+        if wme.timestamp is None:
+            return
+
+        self.index(wme)
+        self.advance(wme.timestamp)
+        for token in self.parent.between(wme.timestamp - self.window, wme.timestamp):
+            if self.perform_join_test(token, wme):
+                self.emit(token, wme)
+
+    def join_left(self, token: Token) -> None:
+        """
+
+        :param token: the activation Token
+        """
+        self.activations += 1
+        time = WindowMemory.time(token)
+        start, end = bisect.bisect_left(self._times, time), bisect.bisect_right(self._times, time + self.window)
+        for wme in self._wmes[start:end]:
+            if self.perform_join_test(token, wme):
+                self.emit(token, wme)
+
+
+class ThetaJoinNode(JoinNode):
+    """ A join node comparing a field of the WMEs with a variable of the tokens of its `SortedMemory` parent.
+
+    Both inputs are ordered by the compared values, so the partners of an activation are found by bisection instead
+    of being tested one by one; the other tests are only performed on the partners found.
+    """
+
+    _wmes = Local(list)
+    _keys = Local(list)
+    _indexed = Local(set)
+
+    def __init__(self, children, parent, amem, tests, has):
+        """
+        :type children:
+        :type parent: SortedMemory
+        :type amem: AlphaMemory
+        :type tests: list of TestAtJoinNode
+        :type has: Has
+        """
+        super(ThetaJoinNode, self).__init__(children, parent, amem, tests, has)
+        self.comparison = next(t for t in tests if isinstance(t, ComparisonTest))
+        self._wmes = []
+        self._keys = []
+        self._indexed = set()  # id(WME) of the WMEs in _wmes
+        for wme in amem.memory:
+            self.index(wme)
+
+    def index(self, wme: WME) -> None:
+        key = ordinal(getattr(wme, self.comparison.field1))
+        if id(wme) in self._indexed or key is None:
+            return
+
+        position = bisect.bisect_right(self._keys, key)
+        self._keys.insert(position, key)
+        self._wmes.insert(position, wme)
+        self._indexed.add(Identity(id(wme)))
+
+    def forget(self, wme: WME) -> None:
+        """ Drop the given WME, which is being removed from working memory.
+
+        :param wme: the removed WME
+        """
+        super(ThetaJoinNode, self).forget(wme)
+        if id(wme) not in self._indexed:
+            return
+
+        self._indexed.discard(id(wme))
+        key = ordinal(getattr(wme, self.comparison.field1))
+        start = bisect.bisect_left(self._keys, key)
+        position = next(i for i in range(start, len(self._wmes)) if self._wmes[i] is wme)
+        del self._keys[position]
+        del self._wmes[position]
+
+    def join_right(self, wme: WME) -> None:
+        """
+
+        :param wme: the activation WME
+        """
+        self.activations += 1
+        self.index(wme)
+        key = ordinal(getattr(wme, self.comparison.field1))
+        if key is None:
+            return
+
+        for token in self.parent.compared(CONVERSE[self.comparison.operator], key):
+            if self.perform_join_test(token, wme):
+                self.emit(token, wme)
+
+    def join_left(self, token: Token) -> None:
+        """
+
+        :param token: the activation Token
+        """
+        self.activations += 1
+        key = ordinal(token.get_binding(self.comparison.variable))
+        if key is None:
+            return
+
+        start, end = span(self._keys, self.comparison.operator, key)
+        for wme in self._wmes[start:end]:
+            if self.perform_join_test(token, wme):
+                self.emit(token, wme)
+
+
 class NccNode(BetaNode):
 
+    _memory = Local(list)
+
     def __init__(
             self,
             children: List[Any] = None,
@@ -410,12 +923,19 @@ class NccNode(BetaNode):
             for child in self.children:
                 child.left_activation(new_token, None)
 
+    def replay_into(self, new_node: Any) -> None:
+        for token in self.memory:
+            if not token.ncc_results:
+                new_node.left_activation(token, None)
+
     def remove_token(self, token: Token) -> None:
         self._memory.remove(token)
 
 
 class NccPartnerNode(BetaNode):
 
+    new_result_buffer = Local(list)
+
     def __init__(self, children=None, parent=None, ncc_node=None,
                  number_of_conditions=0, new_result_buffer=None):
         """
@@ -443,12 +963,145 @@ class NccPartnerNode(BetaNode):
             if token.parent == owners_t and token.wme == owners_w:
                 token.ncc_results.append(new_result)
                 new_result.owner = token
-                Token.delete_token_and_descendants(token)
+                for child in list(token.children):
+                    Token.delete_token_and_descendants(child)
+                return
         self.new_result_buffer.append(new_result)
 
 
+class AggregateNode(BetaNode):
+    """ Extend every token with the aggregate of the matches of a subnetwork below the same parent.
+
+    The matches reach the node through its `AggregatePartnerNode`, which feeds the aggregator of the token they
+    extend; the single child token of a token is replaced when the aggregate value changes.
+    """
+
+    _memory = Local(list)
+    _groups = Local(dict, inherit=lambda groups: {k: [copy.deepcopy(a), t, v] for k, (a, t, v) in groups.items()})
+
+    def __init__(self, children=None, parent=None, function='count', to=None, partner=None):
+        """
+        :type parent: BetaNode
+        :type function: str
+        :type to: str
+        :type partner: AggregatePartnerNode
+        """
+        super(AggregateNode, self).__init__(children=children, parent=parent)
+        self._memory = []
+        self.function = function
+        self.to = to
+        self.partner = partner
+        self._groups = {}  # (id(parent token), id(WME)) -> [aggregator, token or None, (value emitted,) or None]
+
+    @property
+    def memory(self) -> Iterable[Token]:
+        return self._memory
+
+    def group(self, key: Tuple[int, int]) -> List[Any]:
+        if key not in self._groups:
+            self._groups[key] = [AGGREGATORS[self.function](), None, None]
+        return self._groups[key]
+
+    def left_activation(self, token, wme, binding=None):
+        """
+        :type wme: WME
+        :type token: Token
+        :type binding: dict
+        """
+        new_token = Token(token, wme, self, binding)
+        self._memory.append(new_token)
+        group = self.group((Identity(id(token)), Identity(id(wme))))
+        group[1] = new_token
+        self.emit(group)
+
+    def emitted(self, token: Token) -> Optional[Tuple[Any]]:
+        """ Return the aggregate value last passed to the children for the given token of this node.
+
+        :param token: a token of the memory of this node
+        :return: the value in a 1-tuple, or None if the aggregate is undefined
+        """
+        group = self._groups.get((id(token.parent), id(token.wme)))
+        return None if group is None else group[2]
+
+    def replay_into(self, new_node: Any) -> None:
+        for token in self.memory:
+            emitted = self.emitted(token)
+            if emitted is not None:
+                new_node.left_activation(token, None, {self.to: emitted[0]})
+
+    def emit(self, group: List[Any]) -> None:
+        aggregator, token, emitted = group
+        current = (aggregator.value,) if aggregator.defined else None
+        if token is None or current == emitted or token.is_dying():
+            # a token being deleted loses its matches one by one: only its own deletion is reported
+            return
+
+        for child in list(token.children):
+            Token.delete_token_and_descendants(child)
+        group[2] = current
+        if current is not None:
+            for child in self.children:
+                child.left_activation(token, None, {self.to: current[0]})
+
+    def add(self, key: Tuple[int, int], result: int, value: Any) -> None:
+        group = self.group(key)
+        group[0].add(result, value)
+        self.emit(group)
+
+    def remove(self, key: Tuple[int, int], result: int, value: Any) -> None:
+        group = self._groups.get(key)
+        if group is not None:
+            group[0].remove(result, value)
+            self.emit(group)
+
+    def remove_token(self, token: Token) -> None:
+        self._memory.remove(token)
+        self._groups.pop((id(token.parent), id(token.wme)), None)
+
+
+class AggregatePartnerNode(BetaNode):
+
+    _results = Local(dict)
+
+    def __init__(self, children=None, parent=None, aggregate_node=None, number_of_conditions=0, of=None):
+        """
+        :type aggregate_node: AggregateNode
+        :type of: str
+        """
+        super(AggregatePartnerNode, self).__init__(children=children, parent=parent)
+        self.aggregate_node = aggregate_node
+        self.number_of_conditions = number_of_conditions
+        self.of = of
+        self._results = {}  # id(Token) -> (key of the group, aggregated value)
+
+    def left_activation(self, t, w, binding=None):
+        """
+        :type w: rete.WME
+        :type t: rete.Token
+        :type binding: dict
+        """
+        new_result = Token(t, w, self, binding)
+        owners_t = t
+        owners_w = w
+        for i in range(self.number_of_conditions):
+            owners_w = owners_t.wme
+            owners_t = owners_t.parent
+        key = (Identity(id(owners_t)), Identity(id(owners_w)))
+        value = new_result.get_binding(self.of) if self.of else None
+        result = Identity(id(new_result))
+        self._results[result] = (key, value)
+        self.aggregate_node.add(key, result, value)
+
+    def remove_token(self, token: Token) -> None:
+        key, value = self._results.pop(id(token))
+        self.aggregate_node.remove(key, id(token), value)
+
+
 class NegativeNode(BetaNode):
 
+    _memory = Local(list)
+    tested = Local(int)
+
     def __init__(self, children=None, parent=None, amem=None, tests=None):
         """
         :type amem: rete.alpha.AlphaMemory
@@ -457,6 +1110,7 @@ class NegativeNode(BetaNode):
         self._memory = []
         self.amem = amem
         self.tests = tests if tests else []
+        self.tested = 0  # number of token and WME pairs tested
 
     @property
     def memory(self) -> Iterable[Any]:
@@ -486,18 +1140,43 @@ class NegativeNode(BetaNode):
         for t in self.memory:
             if self.perform_join_test(t, wme):
                 if not t.join_results:
-                    Token.delete_token_and_descendants(t)
+                    for child in list(t.children):
+                        Token.delete_token_and_descendants(child)
                 jr = NegativeJoinResult(t, wme)
                 t.join_results.append(jr)
                 wme.negative_join_results.append(jr)
 
+    def replay_into(self, new_node: Any) -> None:
+        for token in self.memory:
+            if not token.join_results:
+                new_node.left_activation(token, None)
+
+    def remove_join_result(self, jr):
+        """ Forget the given join result, whose WME is being removed, and unblock its token if it was the last.
+
+        :type jr: NegativeJoinResult
+        """
+        jr.owner.join_results.remove(jr)
+        if not jr.owner.join_results:
+            for child in self.children:
+                child.left_activation(jr.owner, None)
+
     def perform_join_test(self, token, wme):
         """
         :type token: rete.Token
         :type wme: rete.WME
         """
+        self.tested += 1
         for this_test in self.tests:
             arg1 = getattr(wme, this_test.field1)
+            if isinstance(this_test, BindingTest):
+                if number(arg1) != number(token.get_binding(this_test.variable)):
+                    return False
+                continue
+            if isinstance(this_test, ComparisonTest):
+                if not compare(arg1, this_test.operator, token.get_binding(this_test.variable)):
+                    return False
+                continue
             wme2 = token.wmes[this_test.condition2]
             arg2 = getattr(wme2, this_test.field2)
             if arg1 != arg2:
@@ -508,14 +1187,84 @@ class NegativeNode(BetaNode):
         self._memory.remove(token)
 
 
+class ExistsNode(NegativeNode):
+    """ The mirror image of `NegativeNode`: a token passes while at least one WME of the alpha memory matches it.
+
+    Only the number of matching WMEs of every token is kept; the single child token of a token is added when the
+    number rises from 0, and deleted when it falls back to 0.
+    """
+
+    _counts = Local(dict)
+
+    def __init__(self, children=None, parent=None, amem=None, tests=None):
+        """
+        :type amem: rete.alpha.AlphaMemory
+        """
+        super(ExistsNode, self).__init__(children=children, parent=parent, amem=amem, tests=tests)
+        self._counts = {}  # id(Token) -> number of matching WMEs
+
+    def count(self, token: Token) -> int:
+        return self._counts.get(id(token), 0)
+
+    def replay_into(self, new_node: Any) -> None:
+        for token in self.memory:
+            if self.count(token):
+                new_node.left_activation(token, None)
+
+    def left_activation(self, token, wme, binding=None):
+        """
+        :type wme: rete.WME
+        :type token: rete.Token
+        :type binding: dict
+        """
+        new_token = Token(token, wme, self, binding)
+        self._memory.append(new_token)
+        count = self._counts[Identity(id(new_token))] = sum(
+            1 for item in self.amem.memory if self.perform_join_test(new_token, item))
+        if count:
+            for child in self.children:
+                child.left_activation(new_token, None)
+
+    def right_activation(self, wme):
+        """
+        :type wme: rete.WME
+        """
+        for t in list(self.memory):
+            if self.perform_join_test(t, wme):
+                self._counts[id(t)] += 1
+                if self._counts[id(t)] == 1:
+                    for child in self.children:
+                        child.left_activation(t, None)
+
+    def right_retraction(self, wme):
+        """
+        :type wme: rete.WME
+        """
+        for t in list(self.memory):
+            if self.perform_join_test(t, wme):
+                self._counts[id(t)] -= 1
+                if not self._counts[id(t)]:
+                    for child in list(t.children):
+                        Token.delete_token_and_descendants(child)
+
+    def remove_token(self, token: Token) -> None:
+        self._memory.remove(token)
+        del self._counts[id(token)]
+
+
 class ProductionNode(BetaNode):
 
+    _memory = Local(list)
+    listeners = Local(list, inherit=None)  # a fork notifies nobody
+
     def __init__(self, children=None, parent=None, memory=None, **kwargs):
         """
         :type memory: list of Token
         """
         super(ProductionNode, self).__init__(children=children, parent=parent)
         self._memory = memory or []
+        self.listeners = []
+        self.network = None  # the network compiling the node, holding the dispatcher and the TMS
         # self.children = children if children else []
         for k, v in kwargs.items():
             setattr(self, k, v)
@@ -524,6 +1273,39 @@ class ProductionNode(BetaNode):
     def memory(self) -> Iterable[Token]:
         return self._memory
 
+    @property
+    def dispatcher(self) -> Any:
+        return None if self.network is None else self.network.dispatcher
+
+    def move(self, parent: Any) -> List[Token]:
+        """ Detach this node from its parent and attach it below the given node, with an empty memory.
+
+        :param parent: the new parent of the node
+        :return: the tokens held so far, which the caller deletes or replaces
+        """
+        tokens, self._memory = list(self._memory), []
+        self._parent.remove_child(self)
+        self._parent = parent
+        parent.append_child(self)
+
+        return tokens
+
+    @property
+    def tms(self) -> Any:
+        return None if self.network is None else self.network.tms
+
+    def subscribe(self, listener: Listener) -> None:
+        """ Register a callback invoked with an `Event` whenever a match is added to or removed from this node.
+
+        :param listener: the callback to register
+        """
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def unsubscribe(self, listener: Listener) -> None:
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
     def left_activation(self, token, wme, binding=None):
         """
         :type wme: WME
@@ -532,9 +1314,15 @@ class ProductionNode(BetaNode):
         """
         new_token = Token(token, wme, node=self, binding=binding)
         self._memory.append(new_token)
+        if self.listeners:
+            notify(self, ADDED, new_token, self.dispatcher)
 
     def execute(self, *args, **kwargs):
         raise NotImplementedError
 
     def remove_token(self, token: Token) -> None:
         self._memory.remove(token)
+        if self.tms is not None:
+            self.tms.release(token)
+        if self.listeners:
+            notify(self, REMOVED, token, self.dispatcher)
@@ -0,0 +1,153 @@
+import math
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import List
+from typing import Set
+
+from rete.common import Aggregate
+from rete.common import Bind
+from rete.common import Exists
+from rete.common import Filter
+from rete.common import Has
+from rete.common import Ncc
+from rete.common import Neg
+from rete.common import Rule
+from rete.common import Within
+from rete.query import names
+
+JOIN_SELECTIVITY = 0.1  # the fraction of the partners expected to agree on a shared variable
+
+
+def is_barrier(cond: Any) -> bool:
+    """ Check if the given condition depends on the position it is written in.
+
+    Negated, existential, aggregated and temporal conditions match differently when a variable they use is bound
+    earlier or later, so they are never moved and no condition is moved across them.
+
+    :param cond: the condition to check
+    :return: True if `cond` must keep its position, False otherwise
+    """
+    return isinstance(cond, (Neg, Exists, Ncc, Aggregate, Within))
+
+
+def bucket(estimate: float) -> int:
+    return round(math.log2(1 + estimate))
+
+
+def reorder(
+        rule: Iterable[Any],
+        estimate: Callable[[Has], int],
+        bound: Iterable[str] = (),
+        shared: Callable[[List[Any]], bool] = None,
+) -> Rule:
+    """ Return the given rule with its positive conditions ordered by estimated selectivity.
+
+    Between two barriers, the positive conditions are placed greedily: first the ones extending a prefix already
+    compiled for another rule, whose nodes are shared at no cost, then the ones joining with the conditions already
+    placed, then the ones with the fewest expected partners, i.e. the size of their alpha memory reduced by
+    `JOIN_SELECTIVITY` for every variable already bound. Estimates are compared by order of magnitude and ties keep
+    the written order, so that rules written alike compile alike. Filters and binds are placed as soon as their
+    variables are bound, and a positive condition using the variable of a bind only after that bind.
+
+    :param rule: the conditions to order
+    :param estimate: returns the number of WMEs expected to match a condition
+    :param bound: the variables bound before the first condition
+    :param shared: returns whether the given conditions are the prefix of a compiled rule, if known
+    :return: the ordered rule, matching the same facts as `rule`
+    """
+    bound = set(bound)
+    result = Rule()
+    segment = []
+    for cond in rule:
+        if not is_barrier(cond):
+            segment.append(cond)
+            continue
+        result.extend(reorder_segment(segment, estimate, bound, shared, result))
+        segment = []
+        if isinstance(cond, Ncc):
+            cond = Ncc(*reorder(cond, estimate, bound))
+        elif isinstance(cond, Aggregate):
+            cond = Aggregate(cond.function, cond.to, *reorder(cond, estimate, bound), of=cond.of)
+            bound.add(cond.to)
+        elif isinstance(cond, Within):
+            bound.update(names(cond))
+        result.append(cond)
+    result.extend(reorder_segment(segment, estimate, bound, shared, result))
+
+    return result
+
+
+def reorder_segment(
+        segment: List[Any],
+        estimate: Callable[[Has], int],
+        bound: Set[str],
+        shared: Callable[[List[Any]], bool] = None,
+        prefix: List[Any] = (),
+) -> List[Any]:
+    """ Order the given conditions, none of which is a barrier, updating the given bound variables.
+
+    :param segment: the conditions to order
+    :param estimate: returns the number of WMEs expected to match a condition
+    :param bound: the variables bound before the first condition, updated in place
+    :param shared: returns whether the given conditions are the prefix of a compiled rule, if known
+    :param prefix: the conditions placed before the segment
+    :return: the ordered conditions
+    """
+    positives = [c for c in segment if isinstance(c, Has)]
+    produced = {c.symbol for c in segment if isinstance(c, Bind)}
+    producible = bound | produced | {v for c in positives for v in names(c)}
+    sizes = {id(c): estimate(c) for c in positives}
+    pending = [c for c in segment if isinstance(c, (Filter, Bind))]
+    result = []
+    while positives or pending:
+        ready = next((c for c in pending if all(v in bound for v in names(c) if v in producible)), None)
+        if ready is not None:
+            pending.remove(ready)
+            result.append(ready)
+            if isinstance(ready, Bind):
+                bound.add(ready.symbol)
+            continue
+        if not positives:
+            result.extend(pending)
+            break
+
+        def cost(c: Has) -> Any:
+            joins = len({v for v in names(c) if v in bound})
+            compiled = shared is not None and shared(list(prefix) + result + [c])
+            return (not compiled, bool(bound) and not joins, bucket(sizes[id(c)] * JOIN_SELECTIVITY ** joins),
+                    positives.index(c))
+
+        # a positive condition joining on the variable of a bind placed later would bind it instead
+        waiting = produced - bound
+        cond = min([c for c in positives if not waiting.intersection(names(c))] or positives, key=cost)
+        positives.remove(cond)
+        result.append(cond)
+        bound.update(names(cond))
+
+    return result
+
+
+def cost(rule: Iterable[Any], estimate: Callable[[Has], int], bound: Iterable[str] = ()) -> float:
+    """ Return the expected number of partial matches built when compiling the given rule in its order.
+
+    :param rule: the conditions, in the order they are compiled
+    :param estimate: returns the number of WMEs expected to match a condition
+    :param bound: the variables bound before the first condition
+    :return: the sum of the expected sizes of the joins of the positive conditions
+    """
+    bound = set(bound)
+    size = 1.0
+    total = 0.0
+    for cond in rule:
+        if isinstance(cond, Has) and not isinstance(cond, (Neg, Exists)):
+            joins = len({v for v in names(cond) if v in bound})
+            size *= estimate(cond) * JOIN_SELECTIVITY ** joins
+            total += size
+            bound.update(names(cond))
+        elif isinstance(cond, Bind):
+            bound.add(cond.symbol)
+        elif isinstance(cond, Aggregate):
+            bound.add(cond.to)
+
+    return total
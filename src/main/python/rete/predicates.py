@@ -0,0 +1,250 @@
+import math
+from typing import Any
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from rete.utils import evaluate
+from rete.utils import number
+from rete.utils import ordinal
+from rete.utils import VARIABLE
+
+
+class Predicate(object):
+    """ A test on a field of a WME, used in place of a constant in a condition.
+
+    Below every alpha node, the predicate tests on the same field are shared and indexed together, so that a WME
+    only reaches the tests it satisfies.
+    """
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and other.key() == self.key()
+
+    def __hash__(self) -> int:
+        return hash((type(self).__name__, self.key()))
+
+    def key(self) -> Tuple[Any, ...]:
+        raise NotImplementedError
+
+    def test(self, value: Any) -> bool:
+        """ Check if the given value satisfies this predicate.
+
+        :param value: the value of the field of a WME
+        :return: True if the value satisfies this predicate, False otherwise
+        """
+        raise NotImplementedError
+
+
+class Range(Predicate):
+
+    def __init__(self, low: float = None, high: float = None, low_closed: bool = True,
+                 high_closed: bool = True) -> None:
+        """ Constructor.
+
+        :param low: the lower bound, or None if unbounded
+        :param high: the upper bound, or None if unbounded
+        :param low_closed: whether the lower bound is included
+        :param high_closed: whether the upper bound is included
+        """
+        self.low = -math.inf if low is None else low
+        self.high = math.inf if high is None else high
+        self.low_closed = low_closed
+        self.high_closed = high_closed
+
+    def __repr__(self) -> str:
+        return f"{'[' if self.low_closed else '('}{self.low}, {self.high}{']' if self.high_closed else ')'}"
+
+    def key(self) -> Tuple[Any, ...]:
+        return self.low, self.high, self.low_closed, self.high_closed
+
+    def test(self, value: Any) -> bool:
+        value = ordinal(value)
+        if value is None:
+            return False
+        if value < self.low or value == self.low and not self.low_closed:
+            return False
+        if value > self.high or value == self.high and not self.high_closed:
+            return False
+
+        return True
+
+
+class Prefix(Predicate):
+
+    def __init__(self, prefix: str) -> None:
+        """ Constructor.
+
+        :param prefix: the start of the matching values
+        """
+        self.prefix = prefix
+
+    def __repr__(self) -> str:
+        return f"{self.prefix}*"
+
+    def key(self) -> Tuple[Any, ...]:
+        return self.prefix,
+
+    def test(self, value: Any) -> bool:
+        return isinstance(value, str) and value.startswith(self.prefix)
+
+
+class OneOf(Predicate):
+
+    def __init__(self, *values: Any) -> None:
+        """ Constructor.
+
+        :param values: the matching values, compared as numbers when numeric as in a `Range`
+        """
+        self.values = frozenset(map(number, values))
+
+    def __repr__(self) -> str:
+        return f"{{{', '.join(sorted(map(str, self.values)))}}}"
+
+    def key(self) -> Tuple[Any, ...]:
+        return self.values,
+
+    def test(self, value: Any) -> bool:
+        return number(value) in self.values
+
+
+class Expression(Predicate):
+    """ The template of a `Filter` referencing a single variable, tested on the field binding that variable. """
+
+    PLACEHOLDER = '$_'
+
+    def __init__(self, template: str) -> None:
+        """ Constructor.
+
+        :param template: the template, whose only variable is renamed so that equal filters of any rule are shared
+        """
+        self.template = VARIABLE.sub(self.PLACEHOLDER, template)
+
+    def __repr__(self) -> str:
+        return f"{{{self.template}}}"
+
+    def key(self) -> Tuple[Any, ...]:
+        return self.template,
+
+    def test(self, value: Any) -> bool:
+        # the template is evaluated as a `FilterNode` does, raising the same errors
+        return bool(evaluate(self.template, {self.PLACEHOLDER: value}))
+
+
+def accepts(constant: Any, value: Any) -> bool:
+    """ Check if the value of a field of a WME satisfies the given constant of a condition.
+
+    :param constant: a symbol, or a `Predicate`
+    :param value: the value of the field of the WME
+    :return: True if `value` equals or satisfies `constant`, False otherwise
+    """
+    if isinstance(constant, Predicate):
+        return constant.test(value)
+
+    return constant == value
+
+
+class IntervalTree(object):
+    """ A static centered interval tree, finding the intervals containing a point in O(log n + k). """
+
+    def __init__(self, intervals: List[Tuple[float, float, Any]]) -> None:
+        """ Constructor.
+
+        :param intervals: the list of (low, high, item), bounds included
+        """
+        self.center = None
+        self.by_low = self.by_high = []
+        self.left = self.right = None
+        if not intervals:
+            return
+
+        points = sorted(p for low, high, _ in intervals for p in (low, high))
+        self.center = points[len(points) // 2]
+        here = [i for i in intervals if i[0] <= self.center <= i[1]]
+        self.by_low = sorted(here, key=lambda i: i[0])
+        self.by_high = sorted(here, key=lambda i: i[1], reverse=True)
+        self.left = IntervalTree([i for i in intervals if i[1] < self.center])
+        self.right = IntervalTree([i for i in intervals if i[0] > self.center])
+
+    def search(self, point: float) -> Iterator[Any]:
+        """ Return the items of the intervals containing the given point.
+
+        :param point: the point to search
+        :return: the stream of items
+        """
+        node = self
+        while node is not None and node.center is not None:
+            if point < node.center:
+                for low, _, item in node.by_low:
+                    if low > point:
+                        break
+                    yield item
+                node = node.left
+            elif point > node.center:
+                for _, high, item in node.by_high:
+                    if high < point:
+                        break
+                    yield item
+                node = node.right
+            else:
+                for _, _, item in node.by_low:
+                    yield item
+                break
+
+
+class PredicateIndex(object):
+    """ The alpha nodes testing the same field with a predicate, below the same parent.
+
+    Ranges are indexed by an interval tree, prefixes and sets by the values they accept, so that finding the nodes
+    accepting a value costs O(log n + k) instead of one test per node. Expressions cannot be indexed and are tested
+    one by one.
+    """
+
+    def __init__(self) -> None:
+        self.nodes = []
+        self._ranges = []  # list of (low, high, node)
+        self._tree = None  # IntervalTree over _ranges, rebuilt on demand
+        self._prefixes = {}  # prefix -> list of node
+        self._members = {}  # value -> list of node
+        self._scanned = []  # list of node testing an Expression
+
+    def add(self, node: Any) -> None:
+        """ Index the given alpha node by its predicate.
+
+        :param node: an alpha node whose symbol is a `Predicate`
+        """
+        predicate = node.symbol
+        self.nodes.append(node)
+        if isinstance(predicate, Range):
+            self._ranges.append((predicate.low, predicate.high, node))
+            self._tree = None
+        elif isinstance(predicate, Prefix):
+            self._prefixes.setdefault(predicate.prefix, []).append(node)
+        elif isinstance(predicate, OneOf):
+            for value in predicate.values:
+                self._members.setdefault(value, []).append(node)
+        else:
+            self._scanned.append(node)
+
+    def search(self, value: Any) -> List[Any]:
+        """ Return the indexed nodes whose predicate accepts the given value.
+
+        :param value: the value of the field of a WME
+        :return: the list of matching nodes
+        """
+        result = list(self._members.get(number(value), [])) if self._members else []
+        if self._prefixes and isinstance(value, str):
+            for end in range(len(value) + 1):
+                result.extend(self._prefixes.get(value[:end], []))
+        if self._ranges:
+            point = ordinal(value)
+            if point is not None:
+                if self._tree is None:
+                    self._tree = IntervalTree(self._ranges)
+                result.extend(node for node in self._tree.search(point) if node.symbol.test(point))
+        result.extend(node for node in self._scanned if node.symbol.test(value))
+
+        return result
+
+    def find(self, predicate: Predicate) -> Optional[Any]:
+        return next((node for node in self.nodes if node.symbol == predicate), None)
@@ -0,0 +1,242 @@
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from rete.aggregates import aggregate
+from rete.common import Aggregate
+from rete.common import Bind
+from rete.common import Exists
+from rete.common import FIELDS
+from rete.common import Filter
+from rete.common import Has
+from rete.common import Ncc
+from rete.common import Neg
+from rete.common import Within
+from rete.common import WME
+from rete.nodes import AlphaMemory
+from rete.nodes import ConstantTestNode
+from rete.predicates import accepts
+from rete.utils import evaluate
+from rete.utils import is_var
+from rete.utils import variables
+
+Condition = Union[Has, Neg, Exists, Filter, Bind, Ncc, Aggregate]
+
+
+def lookup_alpha_memory(root: ConstantTestNode, cond: Has) -> Tuple[AlphaMemory, bool]:
+    """ Return the most specific existing alpha memory covering the given condition, without building any node.
+
+    :param root: the root of the alpha network
+    :param cond: the condition to look up
+    :return: the alpha memory found, and whether it contains exactly the WMEs matching the constants of `cond`
+    """
+    node = best = root
+    path = [(f, getattr(cond, f)) for f in FIELDS if not is_var(getattr(cond, f))]
+    exact = not path
+    for field, symbol in path:
+        node = next((c for c in node.children if c.field == field and c.symbol == symbol), None)
+        if node is None:
+            break
+        if node.amem is not None:
+            best = node
+            exact = field == path[-1][0]
+
+    return best.amem, exact
+
+
+def names(cond: Condition) -> List[str]:
+    """ Return the variables referenced by the given condition.
+
+    :param cond: the condition to inspect
+    :return: the list of variables referenced by `cond`
+    """
+    if isinstance(cond, Has):
+        return [v for _, v in cond.vars]
+    if isinstance(cond, Filter):
+        return variables(cond.template)
+    if isinstance(cond, Bind):
+        return variables(cond.template)
+
+    return [v for c in cond for v in names(c)]
+
+
+class Query(object):
+
+    def __init__(self, rule: Iterable[Condition], memory: Callable[[Has], Tuple[Iterable[WME], bool]]) -> None:
+        """ Constructor.
+
+        :param rule: the conditions to evaluate
+        :param memory: returns the candidate WMEs for a condition, and whether they all satisfy its constants
+        """
+        self._rule = list(rule)
+        self._memory = memory
+
+    @property
+    def rule(self) -> List[Condition]:
+        return self._rule
+
+    def plan(self, bound: Iterable[str] = ()) -> List[Tuple[Condition, List[WME], Optional[List[str]]]]:
+        """ Return the order in which the conditions are evaluated.
+
+        Positive conditions are ordered greedily, smallest candidate set first, preferring the ones sharing a
+        variable with the conditions already placed; a positive condition using a variable produced by a `Bind` or an
+        `Aggregate` waits for its producer. Every other condition is placed as soon as the variables it shares with
+        the positive conditions are bound.
+
+        :param bound: the variables bound before the evaluation starts
+        :return: the list of (condition, candidates, fields bound when the condition is evaluated)
+        """
+        bound = set(bound)
+        positives = [c for c in self._rule if isinstance(c, Has) and not isinstance(c, (Neg, Exists))]
+        produced = {c.symbol for c in self._rule if isinstance(c, Bind)}
+        produced |= {c.to for c in self._rule if isinstance(c, Aggregate)}
+        producible = bound | produced | {v for c in positives for v in names(c)}
+        candidates = {}
+        for cond in positives:
+            wmes, exact = self._memory(cond)
+            candidates[id(cond)] = list(wmes) if exact else [w for w in wmes if cond.match(w)]
+
+        result = []
+        pending = [c for c in self._rule if not any(c is p for p in positives)]
+        while positives or pending:
+            ready = next((c for c in pending if self.is_ready(c, bound, producible)), None)
+            if ready is not None:
+                pending.remove(ready)
+                result.append((ready, [], None))
+                if isinstance(ready, Bind):
+                    bound.add(ready.symbol)
+                elif isinstance(ready, Aggregate):
+                    bound.add(ready.to)
+                continue
+            if not positives:
+                result.extend((c, [], None) for c in pending)
+                break
+            # a positive condition joining on a produced variable before its producer would bind it instead
+            waiting = produced - bound
+            eligible = [c for c in positives if not waiting.intersection(names(c))] or positives
+            connected = [c for c in eligible if bound.intersection(names(c))] or eligible
+            cond = min(connected, key=lambda c: len(candidates[id(c)]))
+            positives.remove(cond)
+            fields = [f for f, v in cond.vars if v in bound]
+            result.append((cond, candidates[id(cond)], fields))
+            bound.update(names(cond))
+
+        return result
+
+    @staticmethod
+    def is_ready(cond: Condition, bound: set, producible: set) -> bool:
+        return all(v in bound for v in names(cond) if v in producible)
+
+    def run(self, binding: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+        """ Evaluate the conditions, streaming every solution as a binding dict.
+
+        :param binding: the values of the variables bound before the evaluation starts
+        :return: the stream of solutions
+        """
+        return (result for result, _ in self.solutions(binding))
+
+    def solutions(self, binding: Dict[str, Any] = None) -> Iterator[Tuple[Dict[str, Any], List[Optional[WME]]]]:
+        """ Evaluate the conditions, streaming every solution with the WMEs supporting it.
+
+        :param binding: the values of the variables bound before the evaluation starts
+        :return: the stream of (binding, WME matching each condition or None) pairs
+        """
+        binding = dict(binding or {})
+        steps = []
+        for cond, wmes, fields in self.plan(binding):
+            index = None
+            if fields:
+                index = {}
+                for w in wmes:
+                    index.setdefault(tuple(getattr(w, f) for f in fields), []).append(w)
+            position = next(i for i, c in enumerate(self._rule) if c is cond)
+            steps.append((cond, wmes, fields, index, position))
+
+        return self.solve(steps, 0, binding, [None] * len(self._rule))
+
+    def solve(self, steps: List[Any], i: int, binding: Dict[str, Any], support: List[Optional[WME]]) -> Iterator[Any]:
+        if i == len(steps):
+            if self.in_window(support):
+                yield dict(binding), list(support)
+            return
+
+        cond, wmes, fields, index, position = steps[i]
+        if not isinstance(cond, Has) or isinstance(cond, (Neg, Exists)):
+            extension = self.extend(cond, binding)
+            if extension is not None:
+                yield from self.solve(steps, i + 1, extension, support)
+            return
+
+        if index is not None:
+            wmes = index.get(tuple(binding[v] for f, v in cond.vars if f in fields), [])
+        for w in wmes:
+            for extension in self.matches(cond, [w], binding):
+                support[position] = w
+                yield from self.solve(steps, i + 1, extension, support)
+        support[position] = None
+
+    def extend(self, cond: Condition, binding: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """ Apply a condition matching no WME of its own to a partial solution.
+
+        :param cond: a `Neg`, `Exists`, `Ncc`, `Filter`, `Bind` or `Aggregate`
+        :param binding: the partial solution
+        :return: the partial solution extended by `cond`, or None if `cond` rejects it
+        """
+        if isinstance(cond, (Neg, Exists)):
+            found = any(True for _ in self.matches(cond, self._memory(cond)[0], binding))
+            return binding if found == isinstance(cond, Exists) else None
+        if isinstance(cond, Ncc):
+            return None if any(True for _ in Query(cond, self._memory).run(binding)) else binding
+        if isinstance(cond, Filter):
+            return binding if evaluate(cond.template, binding) else None
+        if isinstance(cond, Bind):
+            return self.assign(binding, cond.symbol, evaluate(cond.template, binding))
+        if isinstance(cond, Aggregate):
+            values = [result.get(cond.of) for result in Query(cond, self._memory).run(binding)]
+            defined, value = aggregate(cond.function, values)
+            return self.assign(binding, cond.to, value) if defined else None
+
+        return None
+
+    @staticmethod
+    def assign(binding: Dict[str, Any], variable: str, value: Any) -> Optional[Dict[str, Any]]:
+        """ Bind the given variable, or check its value if it is already bound.
+
+        :param binding: the partial solution
+        :param variable: the variable to bind
+        :param value: the value of the variable
+        :return: the partial solution extended with the variable, or None if it is bound to another value
+        """
+        if variable in binding:
+            return binding if binding[variable] == value else None
+
+        return {**binding, variable: value}
+
+    def in_window(self, support: List[Optional[WME]]) -> bool:
+        """ Check the temporal conditions against the WMEs of a complete match.
+
+        :param support: the WME matching each condition, or None
+        :return: True if every WME matching a `Within` follows the earlier ones within its window, False otherwise
+        """
+        return all(cond.follows(support[position], support[:position]) for position, cond in enumerate(self._rule)
+                   if isinstance(cond, Within) and support[position] is not None)
+
+    @staticmethod
+    def matches(cond: Has, wmes: Iterable[WME], binding: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        for w in wmes:
+            extension = dict(binding)
+            for field in FIELDS:
+                v = getattr(cond, field)
+                if not is_var(v):
+                    if not accepts(v, getattr(w, field)):
+                        break
+                elif extension.setdefault(v, getattr(w, field)) != getattr(w, field):
+                    break
+            else:
+                yield extension
@@ -0,0 +1,511 @@
+""" A match server sharing one warm network between processes, over a Unix or TCP socket.
+
+Every message is a frame: a 4-byte big-endian length followed by a JSON document. A client sends batches of
+requests, each frame holding a list of `{"id", "op", ...}` objects; the server answers every batch with one frame
+holding the list of `{"id", "result"}` or `{"id", "error"}` objects, in order. Frames can be pipelined: a client may
+send many batches before reading the answers, as long as it keeps reading them meanwhile. Production events are
+pushed to the subscribed connections as frames holding a single `{"event", "production", "binding"}` object.
+
+    PYTHONPATH=src/main/python python -m rete.server rules.xml --unix /tmp/rete.sock
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import IO
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from rete.common import dump_xml
+from rete.common import parse_xml
+from rete.common import Rule
+from rete.common import WME
+from rete.events import Event
+from rete.network import create_network
+
+LENGTH = struct.Struct('>I')
+Address = Union[str, Tuple[str, int]]  # the path of a Unix socket, or a (host, port) pair
+
+
+class ServerError(Exception):
+    """ A request failed on the server. """
+
+
+def write_frame(sock: socket.socket, message: Any) -> None:
+    payload = json.dumps(message, separators=(',', ':'), default=str).encode('utf-8')
+    sock.sendall(LENGTH.pack(len(payload)) + payload)
+
+
+def read_frame(file: IO[bytes]) -> Optional[Any]:
+    """ Read the next frame from the given stream.
+
+    :param file: the stream of a socket
+    :return: the message, None if the stream is closed
+    """
+    head = file.read(LENGTH.size)
+    if len(head) < LENGTH.size:
+        return None
+    length, = LENGTH.unpack(head)
+    payload = file.read(length)
+    if len(payload) < length:
+        return None
+    return json.loads(payload)
+
+
+class Handler(socketserver.StreamRequestHandler):
+
+    def setup(self) -> None:
+        super(Handler, self).setup()
+        self.lock = threading.Lock()  # serializes the frames written to the connection
+        self.subscriptions = {}  # name of the production -> listener
+        self.events = queue.Queue()  # the events to push, written by a thread of their own, None to stop it
+        self.writer = None
+
+    def handle(self) -> None:
+        while True:
+            requests = read_frame(self.rfile)
+            if requests is None:
+                return
+            responses = self.server.match.execute(self, requests)
+            self.push(responses)
+
+    def finish(self) -> None:
+        self.server.match.unsubscribe_all(self)
+        if self.writer is not None:
+            self.events.put(None)
+            self.writer.join()
+        super(Handler, self).finish()
+
+    def push(self, message: Any) -> None:
+        with self.lock:
+            write_frame(self.request, message)
+
+    def post(self, event: Any) -> None:
+        """ Queue the given event, to be pushed without blocking the thread raising it. """
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.write_events, daemon=True)
+            self.writer.start()
+        self.events.put(event)
+
+    def write_events(self) -> None:
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            try:
+                self.push(event)
+            except OSError:
+                return  # the connection is closing
+
+
+class MatchServer(object):
+    """ Serve `add_wme`, `remove_wme`, `query` and production event subscriptions of a network over a socket.
+
+    The connections are served by one thread each, and the operations of a batch are applied under a single lock,
+    as one batch of events: subscribers receive the net changes of the batch. The events are queued, and written by
+    a thread of every subscribed connection, so that a slow subscriber does not hold the lock. WMEs are designated
+    by their fields, and productions by their `name`; only the rete engine raises production events.
+    """
+
+    def __init__(self, network: Any, address: Address) -> None:
+        """ Constructor.
+
+        :param network: the network to serve
+        :param address: the path of a Unix socket, or a (host, port) pair; port 0 picks a free port
+        """
+        self._network = network
+        self._lock = threading.Lock()
+        self._wmes = {}  # (identifier, attribute, value) -> WME added through the server
+        if isinstance(address, str):
+            self._server = socketserver.ThreadingUnixStreamServer(address, Handler)
+        else:
+            self._server = socketserver.ThreadingTCPServer(address, Handler)
+        self._server.daemon_threads = True
+        self._server.match = self
+        self._thread = None
+
+    def __enter__(self) -> 'MatchServer':
+        self.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    @property
+    def address(self) -> Address:
+        return self._server.server_address
+
+    def start(self) -> None:
+        """ Serve in a background thread. """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def production(self, name: str) -> Any:
+        for production in self._network.rules:
+            if getattr(production, 'name', None) == name:
+                return production
+
+        raise KeyError(f"unknown production: '{name}'")
+
+    def execute(self, connection: Handler, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """ Apply a batch of requests received on the given connection.
+
+        :param connection: the connection the batch was received on
+        :param requests: the requests
+        :return: the responses, in the order of the requests
+        """
+        responses = []
+        with self._lock, self._network.batch():
+            for request in requests:
+                operation = getattr(self, f"on_{request.get('op')}", None)
+                if operation is None:
+                    responses.append({'id': request.get('id'), 'error': f"unknown operation: '{request.get('op')}'"})
+                    continue
+                try:
+                    result = operation(connection, request)
+                except Exception as e:
+                    responses.append({'id': request.get('id'), 'error': f"{type(e).__name__}: {e}"})
+                else:
+                    responses.append({'id': request.get('id'), 'result': result})
+
+        return responses
+
+    def on_add_wme(self, connection: Handler, request: Dict[str, Any]) -> bool:
+        key = tuple(request['wme'])
+        if key in self._wmes:
+            return False
+        wme = self._wmes[key] = WME(*key)
+        self._network.add_wme(wme)
+        return True
+
+    def on_remove_wme(self, connection: Handler, request: Dict[str, Any]) -> bool:
+        wme = self._wmes.pop(tuple(request['wme']), None)
+        if wme is None:
+            return False
+        self._network.remove_wme(wme)
+        return True
+
+    def on_query(self, connection: Handler, request: Dict[str, Any]) -> List[Dict[str, Any]]:
+        rule, _ = parse_xml(request['rule'])[0]
+        return list(self._network.query(rule, request.get('binding')))
+
+    def on_subscribe(self, connection: Handler, request: Dict[str, Any]) -> bool:
+        name = request['production']
+        production = self.production(name)
+        if name in connection.subscriptions:
+            return False
+
+        def listener(event: Event) -> None:
+            connection.post({'event': event.kind, 'production': name, 'binding': event.binding})
+
+        connection.subscriptions[name] = listener
+        production.subscribe(listener)
+        return True
+
+    def on_unsubscribe(self, connection: Handler, request: Dict[str, Any]) -> bool:
+        listener = connection.subscriptions.pop(request['production'], None)
+        if listener is None:
+            return False
+        self.production(request['production']).unsubscribe(listener)
+        return True
+
+    def unsubscribe_all(self, connection: Handler) -> None:
+        with self._lock:
+            for name, listener in connection.subscriptions.items():
+                try:
+                    self.production(name).unsubscribe(listener)
+                except KeyError:
+                    pass  # removed meanwhile
+            connection.subscriptions.clear()
+
+
+class Connection(object):
+    """ A connection to a match server, sending batches of requests and reading their responses. """
+
+    def __init__(self, address: Address) -> None:
+        """ Constructor.
+
+        :param address: the path of a Unix socket, or a (host, port) pair
+        """
+        if isinstance(address, str):
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.connect(address)
+        self._file = self._socket.makefile('rb')
+        self._next = 0
+
+    def send(self, requests: List[Dict[str, Any]]) -> None:
+        """ Send a batch of requests without waiting for the response.
+
+        :param requests: the requests, given an id in place
+        """
+        for request in requests:
+            request['id'] = self._next
+            self._next += 1
+        write_frame(self._socket, requests)
+
+    def receive(self) -> Any:
+        """ Read the next frame: the responses to the oldest batch not answered yet, or an event.
+
+        :return: the list of responses, or the event
+        """
+        message = read_frame(self._file)
+        if message is None:
+            raise ConnectionError('the server closed the connection')
+        return message
+
+    def call(self, requests: List[Dict[str, Any]]) -> List[Any]:
+        """ Send a batch of requests and wait for the results.
+
+        :param requests: the requests
+        :return: the results, in order
+        """
+        self.send(requests)
+        return results(self.receive())
+
+    def shutdown(self) -> None:
+        """ Stop the reads and writes in progress on this connection, from another thread. """
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already closed
+
+    def close(self) -> None:
+        self._file.close()
+        self._socket.close()
+
+
+def results(responses: List[Dict[str, Any]]) -> List[Any]:
+    errors = [r['error'] for r in responses if 'error' in r]
+    if errors:
+        raise ServerError('; '.join(errors))
+    return [r['result'] for r in responses]
+
+
+class Client(object):
+    """ A client of a match server, drawing its connections from a pool so that it can be shared between threads::
+
+        client = Client('/tmp/rete.sock')
+        client.add_wme('B1', 'on', 'B2')
+        with client.pipeline() as pipeline:
+            for wme in wmes:
+                pipeline.add_wme(wme.identifier, wme.attribute, wme.value)
+    """
+
+    def __init__(self, address: Address, pool_size: int = 4) -> None:
+        """ Constructor.
+
+        :param address: the path of a Unix socket, or a (host, port) pair
+        :param pool_size: the maximum number of connections open at once
+        """
+        self._address = address
+        self._pool = queue.LifoQueue()
+        self._slots = threading.Semaphore(pool_size)
+        self._subscriptions = []
+
+    def __enter__(self) -> 'Client':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        """ Borrow a connection from the pool, opening it if needed, waiting if they are all in use. """
+        self._slots.acquire()
+        try:
+            try:
+                connection = self._pool.get_nowait()
+            except queue.Empty:
+                connection = Connection(self._address)
+            try:
+                yield connection
+            except ServerError:
+                self._pool.put(connection)
+                raise
+            except BaseException:
+                connection.close()  # its responses may be pending
+                raise
+            self._pool.put(connection)
+        finally:
+            self._slots.release()
+
+    def call(self, *requests: Dict[str, Any]) -> List[Any]:
+        with self.connection() as connection:
+            return connection.call(list(requests))
+
+    def add_wme(self, identifier: str, attribute: str, value: str) -> bool:
+        return self.call({'op': 'add_wme', 'wme': [identifier, attribute, value]})[0]
+
+    def remove_wme(self, identifier: str, attribute: str, value: str) -> bool:
+        return self.call({'op': 'remove_wme', 'wme': [identifier, attribute, value]})[0]
+
+    def query(self, rule: Rule, binding: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        return self.call({'op': 'query', 'rule': dump_xml([(rule, {})]), 'binding': binding})[0]
+
+    def pipeline(self, batch: int = 100) -> 'Pipeline':
+        return Pipeline(self, batch)
+
+    def subscribe(self, production: str, callback: Callable[[Dict[str, Any]], None]) -> 'Subscription':
+        """ Call the given callback, in a background thread, with every event of the given production.
+
+        :param production: the name of the production
+        :param callback: the callable receiving the events, as `{"event", "production", "binding"}` objects
+        :return: the subscription, to be closed once done
+        """
+        subscription = Subscription(self._address, production, callback)
+        self._subscriptions.append(subscription)
+        return subscription
+
+    def close(self) -> None:
+        for subscription in self._subscriptions:
+            subscription.close()
+        self._subscriptions.clear()
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+class Pipeline(object):
+    """ Requests queued and sent as batches, all written before the last response is read.
+
+    The responses are read by a thread of their own while the batches are written: the server blocks writing the
+    responses nobody reads, and would stop reading the batches in turn.
+    """
+
+    def __init__(self, client: Client, batch: int) -> None:
+        """ Constructor.
+
+        :param client: the client whose connection to use
+        :param batch: the maximum number of requests per frame
+        """
+        self._client = client
+        self._batch = max(1, batch)
+        self._requests = []
+        self.results = []
+
+    def __enter__(self) -> 'Pipeline':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        if exc[0] is None:
+            self.execute()
+
+    def add_wme(self, identifier: str, attribute: str, value: str) -> None:
+        self._requests.append({'op': 'add_wme', 'wme': [identifier, attribute, value]})
+
+    def remove_wme(self, identifier: str, attribute: str, value: str) -> None:
+        self._requests.append({'op': 'remove_wme', 'wme': [identifier, attribute, value]})
+
+    def query(self, rule: Rule, binding: Optional[Dict[str, Any]] = None) -> None:
+        self._requests.append({'op': 'query', 'rule': dump_xml([(rule, {})]), 'binding': binding})
+
+    def execute(self) -> List[Any]:
+        """ Send the queued requests.
+
+        :return: the results of the requests, in order
+        """
+        requests, self._requests = self._requests, []
+        batches = [requests[i:i + self._batch] for i in range(0, len(requests), self._batch)]
+        responses = []
+        failures = []
+
+        def receive():
+            try:
+                for _ in batches:
+                    responses.extend(connection.receive())
+            except BaseException as e:
+                failures.append(e)
+
+        with self._client.connection() as connection:
+            reader = threading.Thread(target=receive, daemon=True)
+            reader.start()
+            try:
+                for batch in batches:
+                    connection.send(batch)
+            except BaseException:
+                connection.shutdown()
+                raise
+            finally:
+                reader.join()
+            if failures:
+                raise failures[0]
+        self.results = results(responses)
+        return self.results
+
+
+class Subscription(object):
+    """ A connection receiving the events of a production, read by a background thread. """
+
+    def __init__(self, address: Address, production: str, callback: Callable[[Dict[str, Any]], None]) -> None:
+        self._connection = Connection(address)
+        self._callback = callback
+        self._responses = queue.Queue()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        self._connection.send([{'op': 'subscribe', 'production': production}])
+        results(self._responses.get())
+
+    def run(self) -> None:
+        try:
+            while True:
+                message = self._connection.receive()
+                if isinstance(message, dict):
+                    self._callback(message)
+                else:
+                    self._responses.put(message)
+        except (OSError, ValueError, ConnectionError):
+            self._responses.put([{'error': 'the connection closed'}])
+
+    def close(self) -> None:
+        self._connection.shutdown()
+        self._connection.close()
+        self._thread.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('rules', help='the XML file of the productions, see `parse_xml`')
+    parser.add_argument('--unix', help='the path of the Unix socket to listen on')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7777)
+    parser.add_argument('--engine', default='rete', choices=['rete', 'treat'])
+    args = parser.parse_args()
+
+    network = create_network(args.engine)
+    with open(args.rules) as file:
+        for lhs, rhs in parse_xml(file.read()):
+            network.add_production(lhs, **rhs)
+    server = MatchServer(network, args.unix or (args.host, args.port))
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,464 @@
+import copy
+import functools
+from contextvars import ContextVar
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from rete.events import ADDED
+from rete.events import notify
+from rete.events import REMOVED
+
+STATE = ContextVar('STATE', default=None)  # the Session whose working memory is being matched, if any
+OWNER = '__session__'  # the key of the session an object was created in, among the attributes of the object
+DEFERRED = {}  # class -> {name -> Local}, the Local attributes installed once a session is forked
+INSTALLED = False  # whether a session was forked
+PENDING = {}  # id(object) -> (object, session, restore), the objects whose Local attributes are restored on first read
+
+
+class Local(object):
+    """ An attribute holding a separate value for every session, in place of the state of a node, token or WME.
+
+    The value is stored in the object itself outside sessions and in the session the object was created in; in any
+    other session, in the slots that session keeps for the object. A missing value is created with the given factory,
+    so that a new session starts empty, or inherited from the parent of a forked session, copied on first access. The
+    values of an object still pending in `PENDING` are restored first.
+    """
+
+    def __init__(
+            self,
+            factory: Callable[..., Any],
+            bound: bool = False,
+            inherit: Optional[Callable[[Any], Any]] = copy.copy,
+    ) -> None:
+        """ Constructor.
+
+        :param factory: the callable creating the initial value
+        :param bound: whether the factory expects the object owning the attribute
+        :param inherit: the callable copying the value of the parent of a forked session, None to start afresh
+        """
+        self.factory = factory
+        self.bound = bound
+        self.inherit = inherit
+        self.name = None
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.name = name
+
+    def __get__(self, instance: Any, owner: type = None) -> Any:
+        if instance is None:
+            return self
+
+        return self.get(instance, STATE.get())
+
+    def __set__(self, instance: Any, value: Any) -> None:
+        state = STATE.get()
+        if OWNER not in instance.__dict__:
+            # the object is being created
+            instance.__dict__[OWNER] = state
+            if state is not None:
+                state.adopt(instance)
+        self.put(instance, state, value)
+
+    def put(self, instance: Any, state: Optional['Session'], value: Any) -> None:
+        """ Set the value of this attribute of the given object, as seen by the given session.
+
+        :param instance: the object owning the attribute
+        :param state: the session, None outside sessions
+        :param value: the new value
+        """
+        attributes = instance.__dict__
+        if state is None or attributes.get(OWNER) is state:
+            attributes[self.name] = value
+        else:
+            state.slots(instance)[self.name] = value
+
+    def present(self, instance: Any, state: Optional['Session']) -> bool:
+        """ Check if the given object holds a value of this attribute for the given session, without creating it.
+
+        :param instance: the object owning the attribute
+        :param state: the session, None outside sessions
+        :return: True if the value is set, False if it would be created or inherited on access
+        """
+        return self.name in self.slots(instance, state)
+
+    def discard(self, instance: Any, state: Optional['Session']) -> None:
+        """ Drop the value of this attribute of the given object, as seen by the given session, if any.
+
+        :param instance: the object owning the attribute
+        :param state: the session, None outside sessions
+        """
+        self.slots(instance, state).pop(self.name, None)
+
+    @staticmethod
+    def slots(instance: Any, state: Optional['Session']) -> Dict[str, Any]:
+        attributes = instance.__dict__
+        return attributes if state is None or attributes.get(OWNER) is state else state.slots(instance)
+
+    def get(self, instance: Any, state: Optional['Session']) -> Any:
+        """ Return the value of this attribute of the given object, as seen by the given session.
+
+        :param instance: the object owning the attribute
+        :param state: the session, None outside sessions
+        :return: the value, created or inherited if missing
+        """
+        attributes = instance.__dict__
+        slots = attributes if state is None or attributes.get(OWNER) is state else state.slots(instance)
+        try:
+            return slots[self.name]
+        except KeyError:
+            pending = PENDING.get(id(instance))
+            if pending is not None and pending[0] is instance and pending[1] is state:
+                del PENDING[id(instance)]
+                pending[2]()
+                return self.get(instance, state)
+            if state is not None and slots is not attributes and state.forked and self.inherit is not None:
+                value = self.inherit(self.get(instance, state.parent))
+            else:
+                value = self.factory(instance) if self.bound else self.factory()
+            slots[self.name] = value
+            return value
+
+
+class Session(object):
+    """ A working memory of its own, matched against the rules compiled in a shared network.
+
+    The network keeps the topology (constant tests, joins, productions); a session keeps only the facts it was given
+    and the partial matches they produced, in slots created lazily as the nodes are first activated. Opening a
+    session is therefore O(1), and any number of them can share a network.
+
+    The operations of the network apply to a session while it is entered, as a context manager::
+
+        with session:
+            network.add_wme(wme)
+            matches = list(production.memory)
+
+    The productions should be added before the sessions are opened: the nodes compiled later are only primed with
+    the working memory they are compiled in. WMEs must not be shared between sessions either.
+
+    A forked session starts from the working memory of its parent instead, see `fork`.
+    """
+
+    def __init__(self, network: Any, parent: Optional['Session'] = None, forked: bool = False) -> None:
+        """ Constructor.
+
+        :param network: the network whose rules are matched
+        :param parent: the session forked, None for the working memory of the network itself
+        :param forked: whether to start from the working memory of the parent, rather than an empty one
+        """
+        self._network = network
+        self._parent = parent
+        self._forked = forked
+        self._slots = {}  # id(object) -> (object, {name of the Local attribute -> value})
+        self._tokens = []  # the ContextVar tokens to restore, one per enclosing `with`
+        if forked:
+            install()
+
+    def __enter__(self) -> Any:
+        self._tokens.append(STATE.set(self))
+        return self._network
+
+    def __exit__(self, *exc: Any) -> None:
+        STATE.reset(self._tokens.pop())
+
+    @property
+    def network(self) -> Any:
+        return self._network
+
+    @property
+    def parent(self) -> Optional['Session']:
+        return self._parent
+
+    @property
+    def forked(self) -> bool:
+        return self._forked
+
+    def slots(self, instance: Any) -> Dict[str, Any]:
+        """ Return the values this session holds for the given object, created elsewhere.
+
+        The object is referenced by the session, so that its identity is not reused while the session lives.
+
+        :param instance: a node, token or WME, or the network
+        :return: the values of its `Local` attributes, by name
+        """
+        try:
+            return self._slots[id(instance)][1]
+        except KeyError:
+            result = {}
+            self._slots[id(instance)] = (instance, result)
+            return result
+
+    def adopt(self, instance: Any) -> None:
+        """ Record the given object as created in this session; only transactions keep track of them.
+
+        :param instance: the object being created
+        """
+
+    def fork(self) -> 'Session':
+        """ Return a session starting from the working memory of this one, copied on write.
+
+        Every memory is copied when the fork first reaches it, so that a fork costs in proportion to the memories its
+        changes reach, not to the whole working memory. This session must not change while the fork is in use.
+
+        :return: the forked session
+        """
+        return Session(self._network, self, True)
+
+    def add_wme(self, wme: Any, ttl: Optional[float] = None) -> None:
+        with self:
+            self._network.add_wme(wme, ttl)
+
+    def remove_wme(self, wme: Any) -> None:
+        with self:
+            self._network.remove_wme(wme)
+
+    def add_logical_wme(self, wme: Any, token: Any) -> Any:
+        with self:
+            return self._network.add_logical_wme(wme, token)
+
+    def advance_clock(self, now: Optional[float] = None) -> List[Any]:
+        with self:
+            return self._network.advance_clock(now)
+
+    def focus(self, module: str) -> None:
+        with self:
+            self._network.focus(module)
+
+    def pop_focus(self) -> Optional[str]:
+        with self:
+            return self._network.pop_focus()
+
+    def matches(self, production: Any) -> List[Any]:
+        """ Return the matches of the given production in this session.
+
+        :param production: a production of the network
+        :return: the tokens in the memory of the production
+        """
+        with self:
+            return list(production.memory)
+
+
+def deferred(**locals_: Local) -> Callable[[type], type]:
+    """ Declare `Local` attributes of a class, kept as plain attributes until a session is first forked.
+
+    The objects created by the million, WMEs and tokens, are only reached from the session they are created in,
+    unless it is forked: a fork shares the objects of its parent. Their attributes are therefore plain until then,
+    which spares every access the cost of a descriptor. The objects must call `own` when created, and when first
+    used if created outside sessions.
+
+    :param locals_: the attributes, by name
+    :return: the class decorator
+    """
+    def decorate(cls: type) -> type:
+        for name, attribute in locals_.items():
+            attribute.__set_name__(cls, name)
+        DEFERRED[cls] = locals_
+        attributes.cache_clear()
+        if INSTALLED:
+            install()
+        return cls
+
+    return decorate
+
+
+def install() -> None:
+    """ Install the deferred `Local` attributes: values already set are kept, as both are stored alike. """
+    global INSTALLED
+
+    INSTALLED = True
+    for cls, locals_ in DEFERRED.items():
+        for name, attribute in locals_.items():
+            if vars(cls).get(name) is not attribute:
+                setattr(cls, name, attribute)
+
+
+def own(instance: Any) -> None:
+    """ Record the session the given object, whose `Local` attributes are deferred, is created or first used in.
+
+    :param instance: the object, kept by the session it was recorded in first
+    """
+    state = STATE.get()
+    if state is not None and OWNER not in instance.__dict__:
+        instance.__dict__[OWNER] = state
+        state.adopt(instance)
+
+
+def restore_pending() -> None:
+    """ Restore the Local attributes of all the objects still pending, before a change that could reach them. """
+    while PENDING:
+        _, (_, _, restore) = PENDING.popitem()
+        restore()
+
+
+def local(cls: type, name: str) -> Local:
+    for klass in cls.__mro__:
+        if name in vars(klass):
+            return vars(klass)[name]
+        if name in DEFERRED.get(klass, {}):
+            return DEFERRED[klass][name]
+
+    raise AttributeError(f"{cls.__name__} has no local attribute '{name}'")
+
+
+@functools.lru_cache(maxsize=None)
+def attributes(cls: type) -> Dict[str, Local]:
+    """ Return the `Local` attributes of the given class holding working memory state, by name.
+
+    The attributes a fork starts afresh, such as observers and listeners, are not part of the working memory.
+
+    :param cls: the class of a node, token or WME, or of the network
+    :return: the attributes, from the base classes down
+    """
+    result = {}
+    for klass in reversed(cls.__mro__):
+        for name, value in dict(vars(klass), **DEFERRED.get(klass, {})).items():
+            if isinstance(value, Local):
+                if value.inherit is None:
+                    result.pop(name, None)
+                else:
+                    result[name] = value
+
+    return result
+
+
+class ConflictError(Exception):
+    """ A transaction cannot be committed, as its working memory changed meanwhile. """
+
+
+class Transaction(Session):
+    """ A fork of a working memory, written back to it when committed.
+
+    The changes made inside the transaction are matched in the fork, invisible from outside. Committing writes the
+    memories the fork copied back to the original working memory, then delivers the resulting production events as
+    one batch and notifies the observers of the operations performed. Rolling back merely drops the copies: the
+    original memories were never written, so they need no undoing.
+
+    The copies hold the original memories as they were when first read, so committing them would lose the changes
+    made to the original working memory meanwhile: the commit then fails with `ConflictError`, and the transaction
+    is rolled back. The original working memory must not change while a commit is in progress.
+
+    Used as a context manager, the transaction commits when the context closes, or rolls back if it closes with an
+    exception.
+    """
+
+    def __init__(self, network: Any, parent: Optional[Session] = None) -> None:
+        """ Constructor.
+
+        :param network: the network whose rules are matched
+        :param parent: the session holding the original working memory, None for the network itself
+        """
+        super(Transaction, self).__init__(network, parent, True)
+        self._owned = []  # the objects created in this transaction
+        self._operations = []  # (name, args, kwargs, result) of the operations performed
+        self._closed = False
+        self._version = self.version(parent)
+
+    def __enter__(self) -> 'Transaction':
+        super(Transaction, self).__enter__()
+        self._network.attach(self)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        super(Transaction, self).__exit__(*exc)
+        if self._tokens or self._closed:
+            return
+
+        if exc[0] is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def on_operation(self, name: str, args: Tuple[Any, ...], kwargs: Dict[str, Any], result: Any) -> None:
+        self._operations.append((name, args, kwargs, result))
+
+    def adopt(self, instance: Any) -> None:
+        self._owned.append(instance)
+
+    def version(self, state: Optional[Session]) -> int:
+        """ Return the number of operations performed on the working memory of the given session. """
+        return local(type(self._network), 'version').get(self._network, state)
+
+    def commit(self) -> None:
+        """ Write the changes of this transaction back to the original working memory.
+
+        :raise ConflictError: if the original working memory changed since the transaction was opened
+        """
+        if self._closed:
+            raise ValueError('the transaction is closed')
+        if self.version(self._parent) != self._version:
+            self.rollback()
+            raise ConflictError('the working memory changed while the transaction was open')
+
+        self._closed = True
+        token = STATE.set(self._parent)
+        try:
+            changes = self.write_back()
+            self.notify_changes(changes)
+            for name, args, kwargs, result in self._operations:
+                self._network.notify(name, args, kwargs, result)
+        finally:
+            STATE.reset(token)
+            self.clear()
+
+    def write_back(self) -> List[Tuple[Any, List[Any], List[Any]]]:
+        """ Write the memories copied by this transaction to the original working memory, and hand it the objects
+        created in this transaction.
+
+        :return: the productions whose matches were copied, with their matches before and after
+        """
+        from rete.nodes import ProductionNode
+
+        changes = []
+        for instance, values in self._slots.values():
+            for name, value in values.items():
+                attribute = local(type(instance), name)
+                if attribute.inherit is None:
+                    continue
+                if isinstance(instance, ProductionNode) and name == '_memory':
+                    changes.append((instance, list(attribute.get(instance, self._parent)), value))
+                attribute.put(instance, self._parent, value)
+        for instance in self._owned:
+            instance.__dict__[OWNER] = self._parent
+            if self._parent is not None:
+                self._parent.adopt(instance)
+
+        return changes
+
+    def notify_changes(self, changes: List[Tuple[Any, List[Any], List[Any]]]) -> None:
+        """ Deliver the events of the given changes of the matches, as one batch.
+
+        :param changes: the productions, with their matches before and after
+        """
+        dispatcher = self._network.dispatcher
+        with dispatcher.batch():
+            for production, before, after in changes:
+                if not production.listeners:
+                    continue
+                kept = {id(t) for t in after}
+                for t in before:
+                    if id(t) not in kept:
+                        notify(production, REMOVED, t, dispatcher)
+                kept = {id(t) for t in before}
+                for t in after:
+                    if id(t) not in kept:
+                        notify(production, ADDED, t, dispatcher)
+
+    def rollback(self) -> None:
+        """ Drop the changes of this transaction. """
+        if self._closed:
+            raise ValueError('the transaction is closed')
+
+        self._closed = True
+        self.clear()
+
+    def clear(self) -> None:
+        self._slots.clear()
+        self._owned.clear()
+        self._operations.clear()
@@ -0,0 +1,462 @@
+import array
+import contextlib
+import functools
+import io
+import math
+import mmap
+import os
+import pickle
+import struct
+import sys
+import weakref
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from rete.common import Token
+from rete.common import WME
+from rete.nodes import AlphaMemory
+from rete.sessions import attributes
+from rete.sessions import PENDING
+from rete.sessions import restore_pending
+from rete.sessions import STATE
+from rete.utils import decode_value
+from rete.utils import encode_value
+from rete.utils import Identity
+
+MAGIC = b'RETESNAP'
+VERSION = 3
+HEADER = struct.Struct('<8sI1sI')  # magic, version, byte order of the tables ('l' or 'b'), number of sections
+SECTION = struct.Struct('<QQ')  # offset and length of a section
+ALIGNMENT = 8
+
+# the sections, in order
+META = 0  # pickle of the node types and the token bindings
+STRINGS = 1  # the distinct WME fields, encoded by `encode_value` and concatenated
+OFFSETS = 2  # int64[strings + 1], the offsets of the strings in STRINGS
+FIELDS = 3  # int64[3 * WMEs], the identifier, attribute and value of every WME, as indexes in STRINGS
+TIMES = 4  # float64[WMEs], the timestamp of every WME, NaN if none
+TOKENS = 5  # int64[5 * tokens], the parent, WME, node, binding and offset in STATES of every token, as indexes or -1
+STATES = 6  # pickles of the values of the Local attributes of the network, of every node and of the tokens
+NODES = 7  # int64[nodes + 1], the offsets in STATES of the pickles of the network, then of every node
+KINDS = 8  # char[strings], the type code of every string, see `encode_value`
+
+DERIVED = {'children'}  # the attributes of a token rebuilt from the others, rather than stored
+COLUMNS = 5  # the number of int64 per token in TOKENS
+
+
+class Collector(object):
+    """ Find the WMEs and tokens referenced by the state of a working memory. """
+
+    def __init__(self, stops: List[Any]) -> None:
+        """ Constructor.
+
+        :param stops: the objects not to walk into: the network and its nodes
+        """
+        self._stops = {id(o) for o in stops}
+        self._seen = set()
+        self.wmes = {}  # id(WME) -> WME, in order of discovery
+        self.tokens = {}  # id(Token) -> Token, in order of discovery
+
+    def walk(self, value: Any) -> None:
+        stack = [value]
+        while stack:
+            value = stack.pop()
+            if value is None or isinstance(value, (str, int, float, bytes)) or id(value) in self._stops:
+                continue
+            if isinstance(value, WME):
+                self.wmes.setdefault(id(value), value)
+            elif isinstance(value, Token):
+                self.tokens.setdefault(id(value), value)
+            elif id(value) not in self._seen:
+                self._seen.add(id(value))
+                if isinstance(value, dict):
+                    stack.extend(value.keys())
+                    stack.extend(value.values())
+                elif isinstance(value, (list, tuple, set, frozenset, weakref.WeakSet)):
+                    stack.extend(value)
+                elif hasattr(value, '__dict__'):
+                    stack.extend(vars(value).values())
+
+    def tree(self, state: Any) -> Tuple[List[Token], Dict[int, Dict[str, Any]]]:
+        """ Complete the tokens found with the whole trees they belong to.
+
+        Every token descends from a root token without parent, and is found in the children of its parent.
+
+        :param state: the session whose working memory is walked, None outside sessions
+        :return: the tokens, parents first, and the values of the attributes of every token having some, by id
+        """
+        tokens, extras = [], {}
+        while len(tokens) < len(self.tokens):
+            roots = {}
+            for token in self.tokens.values():
+                while token.parent is not None:
+                    token = token.parent
+                roots.setdefault(id(token), token)
+            tokens = list(roots.values())
+            for token in tokens:
+                tokens.extend(token.children)
+            for token in tokens:
+                self.tokens.setdefault(id(token), token)
+                if token.wme is not None:
+                    self.wmes.setdefault(id(token.wme), token.wme)
+                values = {name: value for name, value in read(token, state).items() if value}
+                if values:
+                    extras[id(token)] = values
+                    self.walk(values)
+
+        return tokens, extras
+
+
+class Pickler(pickle.Pickler):
+    """ Pickle the state of a working memory, replacing its WMEs, tokens and nodes, and their ids, by references. """
+
+    def __init__(self, file: io.BytesIO, refs: Dict[int, Tuple[Any, ...]]) -> None:
+        super(Pickler, self).__init__(file, pickle.HIGHEST_PROTOCOL)
+        self._file = file
+        self._refs = refs
+
+    def persistent_id(self, obj: Any) -> Optional[Tuple[Any, ...]]:
+        if type(obj) is Identity:
+            # the id of an object, as used for keys in memories, must designate the same object once restored
+            ref = self._refs.get(obj)
+            return None if ref is None else ('id',) + ref
+        return self._refs.get(id(obj))
+
+    def reducer_override(self, obj: Any) -> Any:
+        if isinstance(obj, weakref.WeakSet):
+            return weakref.WeakSet, (list(obj),)
+        return NotImplemented
+
+    def add(self, value: Any) -> int:
+        """ Append the pickle of the given value, independent of the pickles appended before.
+
+        :param value: the value to pickle
+        :return: the offset of the pickle in the file
+        """
+        offset = self._file.tell()
+        self.clear_memo()
+        self.dump(value)
+        return offset
+
+
+class Unpickler(pickle.Unpickler):
+
+    def __init__(self, file: Any, restorer: 'Restorer') -> None:
+        super(Unpickler, self).__init__(file)
+        self._restorer = restorer
+
+    def persistent_load(self, pid: Tuple[Any, ...]) -> Any:
+        if pid[0] == 'id':
+            return Identity(id(self.persistent_load(pid[1:])))
+        if pid[0] == 'network':
+            return self._restorer.network
+        if pid[0] == 'n':
+            return self._restorer.nodes[pid[1]]
+        if pid[0] == 'w':
+            return self._restorer.wme(pid[1])
+        return self._restorer.token(pid[1])
+
+
+class Reader(object):
+    """ A file reading a memory map from the given offset, so that a pickle is read without copying the rest. """
+
+    def __init__(self, data: mmap.mmap, offset: int) -> None:
+        self._data = data
+        self._position = offset
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._data) if size < 0 else min(len(self._data), self._position + size)
+        result = self._data[self._position:end]
+        self._position = end
+        return result
+
+    def readinto(self, buffer: Any) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readline(self) -> bytes:
+        end = self._data.find(b'\n', self._position)
+        return self.read(-1 if end < 0 else end + 1 - self._position)
+
+
+def read(instance: Any, state: Any) -> Dict[str, Any]:
+    return {name: attribute.get(instance, state) for name, attribute in attributes(type(instance)).items()
+            if name not in DERIVED}
+
+
+def dump(network: Any, path: str) -> None:
+    """ Write the match state of the given network to the given file.
+
+    :param network: the network, in the session entered if any
+    :param path: the file to write, replaced atomically
+    """
+    restore_pending()
+    state = STATE.get()
+    nodes = list(network.nodes())
+    nodes_state = [read(node, state) for node in nodes]
+    network_state = read(network, state)
+
+    collector = Collector([network] + nodes)
+    collector.walk(list(network.alpha_root.amem.memory))
+    collector.walk(nodes_state)
+    collector.walk(network_state)
+    tokens, extras = collector.tree(state)
+    wmes = list(collector.wmes.values())
+
+    refs = {id(network): ('network',)}
+    refs.update((id(node), ('n', i)) for i, node in enumerate(nodes))
+    refs.update((id(wme), ('w', i)) for i, wme in enumerate(wmes))
+    refs.update((id(token), ('t', i)) for i, token in enumerate(tokens))
+    buffer = io.BytesIO()
+    pickler = Pickler(buffer, refs)
+    offsets = array.array('q', (pickler.add(values) for values in [network_state] + nodes_state))
+    states = {key: pickler.add(values) for key, values in extras.items()}
+
+    meta, table = dump_tokens(tokens, refs, states)
+    meta['nodes'] = [type(node).__name__ for node in nodes]
+    sections, kinds = dump_wmes(wmes)
+    write(path, [pickle.dumps(meta, pickle.HIGHEST_PROTOCOL)] + sections + [
+        table.tobytes(), buffer.getvalue(), offsets.tobytes(), kinds])
+
+
+def dump_wmes(wmes: List[WME]) -> List[bytes]:
+    """ Lay out the given WMEs as flat arrays.
+
+    :param wmes: the WMEs, in the order of their references
+    :return: the STRINGS, OFFSETS, FIELDS and TIMES sections, and the KINDS section
+    """
+    strings = {}  # (type, value) -> index, so that 5, '5' and True, 1 are kept apart
+    fields = array.array('q')
+    times = array.array('d')
+    for wme in wmes:
+        for value in (wme.identifier, wme.attribute, wme.value):
+            fields.append(strings.setdefault((type(value), value), len(strings)))
+        times.append(math.nan if wme.timestamp is None else wme.timestamp)
+    offsets = array.array('q', [0])
+    kinds = bytearray()
+    blob = io.BytesIO()
+    for _, value in strings:
+        code, encoded = encode_value(value)
+        kinds += code
+        offsets.append(offsets[-1] + blob.write(encoded))
+
+    return [blob.getvalue(), offsets.tobytes(), fields.tobytes(), times.tobytes()], bytes(kinds)
+
+
+def dump_tokens(
+        tokens: List[Token],
+        refs: Dict[int, Tuple[Any, ...]],
+        states: Dict[int, int],
+) -> Tuple[Dict[str, Any], array.array]:
+    """ Lay out the given tokens as a flat array of indexes.
+
+    :param tokens: the tokens, parents first
+    :param refs: the references of the WMEs, tokens and nodes, by id
+    :param states: the offset of the pickle of the attributes of the tokens having some, by id
+    :return: the meta data holding the distinct bindings, and the TOKENS section
+    """
+    bindings = {}
+    table = array.array('q')
+    for token in tokens:
+        binding = -1
+        if token.binding:
+            binding = bindings.setdefault(id(token.binding), (len(bindings), token.binding))[0]
+        table.extend((
+            -1 if token.parent is None else refs[id(token.parent)][1],
+            -1 if token.wme is None else refs[id(token.wme)][1],
+            -1 if token.node is None else refs[id(token.node)][1],
+            binding,
+            states.get(id(token), -1),
+        ))
+
+    return {'bindings': [binding for _, binding in bindings.values()]}, table
+
+
+def write(path: str, sections: List[bytes]) -> None:
+    with open(path + '.tmp', 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, sys.byteorder[:1].encode(), len(sections)))
+        offset = HEADER.size + SECTION.size * len(sections)
+        for section in sections:
+            offset += -offset % ALIGNMENT
+            file.write(SECTION.pack(offset, len(section)))
+            offset += len(section)
+        for section in sections:
+            file.write(b'\0' * (-file.tell() % ALIGNMENT))
+            file.write(section)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + '.tmp', path)
+
+
+class Restorer(object):
+    """ Rebuild the match state written by `dump` from a memory map, as it is read.
+
+    The state of the network is restored at once. The state of every node is restored when first read, with the
+    WMEs and tokens it references; the rest of the map stays on disk. Deleting a token or removing a WME needs their
+    back references, so both restore whatever is still pending first. The map is closed once all the nodes are
+    restored.
+    """
+
+    def __init__(self, network: Any, path: str) -> None:
+        """ Constructor.
+
+        :param network: a network compiling the same productions, in the same order, with an empty working memory
+        :param path: the file to read
+        """
+        self.network = network
+        self.nodes = list(network.nodes())
+        self._state = STATE.get()
+        self._file = open(path, 'rb')
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []
+        try:
+            self._meta = self.check(path)
+            self._strings = [None] * (len(self.section(OFFSETS, 'q')) - 1)
+            self._wmes = [None] * len(self.section(TIMES, 'd'))
+            self._tokens = [None] * (len(self.section(TOKENS, 'q')) // COLUMNS)
+        except Exception:
+            self.close()
+            raise
+        self._remaining = len(self.nodes)
+        self._depth = 0
+
+    def check(self, path: str) -> Dict[str, Any]:
+        magic, version, order, count = HEADER.unpack_from(self._data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a snapshot of version {VERSION}")
+        if order != sys.byteorder[:1].encode():
+            raise ValueError(f"{path} was written on a machine of another byte order")
+        self._sections = [SECTION.unpack_from(self._data, HEADER.size + SECTION.size * i) for i in range(count)]
+        meta = pickle.loads(self.section(META))
+        if meta['nodes'] != [type(node).__name__ for node in self.nodes]:
+            raise ValueError(f"{path} was taken from a network compiling other productions")
+        return meta
+
+    def section(self, index: int, fmt: str = 'B') -> memoryview:
+        offset, length = self._sections[index]
+        self._views.append(memoryview(self._data)[offset:offset + length])
+        if fmt != 'B':
+            self._views.append(self._views[-1].cast(fmt))
+        return self._views[-1]
+
+    def start(self) -> None:
+        """ Restore the state of the network, and leave that of the nodes pending until it is first read. """
+        self._fields = self.section(FIELDS, 'q')
+        self._times = self.section(TIMES, 'd')
+        self._offsets = self.section(OFFSETS, 'q')
+        self._kinds = self.section(KINDS)
+        self._table = self.section(TOKENS, 'q')
+        self._states = self.section(NODES, 'q')
+        self._base = self._sections[STATES][0]
+        with self.entered():
+            for name, value in self.load(self._states[0]).items():
+                setattr(self.network, name, value)
+        for i, node in enumerate(self.nodes):
+            for attribute in attributes(type(node)).values():
+                attribute.discard(node, self._state)
+            PENDING[id(node)] = (node, self._state, functools.partial(self.restore, i))
+
+    @contextlib.contextmanager
+    def entered(self) -> Iterator[None]:
+        # the objects restored belong to the working memory restored, whichever session first reads them
+        token = STATE.set(self._state)
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            STATE.reset(token)
+        if not self._depth and not self._remaining and not self._data.closed:
+            self.finish()
+
+    def load(self, offset: int) -> Dict[str, Any]:
+        return Unpickler(Reader(self._data, self._base + offset), self).load()
+
+    def string(self, index: int) -> Any:
+        result = self._strings[index]
+        if result is None:
+            start = self._sections[STRINGS][0]
+            result = self._strings[index] = decode_value(bytes([self._kinds[index]]), self._data[
+                start + self._offsets[index]:start + self._offsets[index + 1]])
+        return result
+
+    def wme(self, index: int) -> WME:
+        result = self._wmes[index]
+        if result is None:
+            time = self._times[index]
+            result = self._wmes[index] = WME(*(self.string(self._fields[3 * index + i]) for i in range(3)),
+                                             None if math.isnan(time) else time)
+        return result
+
+    def token(self, index: int) -> Token:
+        result = self._tokens[index]
+        if result is not None:
+            return result
+
+        parent, wme, node, binding, state = self._table[COLUMNS * index:COLUMNS * (index + 1)]
+        with self.entered():
+            # the node is set once built, so that the tokens restored are not counted as created
+            result = Token(None if parent < 0 else self.token(parent), None if wme < 0 else self.wme(wme), None,
+                           None if binding < 0 else self._meta['bindings'][binding])
+            result.node = None if node < 0 else self.nodes[node]
+            self._tokens[index] = result
+            if state >= 0:
+                values = self.load(state)
+                for name, value in values.items():
+                    setattr(result, name, value)
+                for item in values.get('join_results', ()):
+                    item.wme.append_negative_join_results(item)
+
+        return result
+
+    def restore(self, index: int) -> None:
+        """ Restore the state of the given node, but for the attributes set since the restore started. """
+        node = self.nodes[index]
+        with self.entered():
+            values = self.load(self._states[index + 1])
+            local = attributes(type(node))
+            values = {name: value for name, value in values.items() if not local[name].present(node, self._state)}
+            for name, value in values.items():
+                local[name].put(node, self._state, value)
+            if isinstance(node, AlphaMemory):
+                for wme in values.get('_memory', ()):
+                    wme.add_amem(node)
+            self._remaining -= 1
+
+    def finish(self) -> None:
+        """ Restore the tokens and WMEs still on disk, referenced by no node, then close the map. """
+        self._depth += 1
+        for index in range(len(self._tokens)):
+            self.token(index)
+        for index in range(len(self._wmes)):
+            self.wme(index)
+        self.close()
+
+    def close(self) -> None:
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        self._data.close()
+        self._file.close()
+
+
+def load(network: Any, path: str) -> None:
+    """ Restore the match state written by `dump` into the given network.
+
+    :param network: a network compiling the same productions, in the same order, with an empty working memory
+    :param path: the file to read
+    """
+    if network.alpha_root.amem.memory:
+        raise ValueError('the working memory is not empty')
+
+    restorer = Restorer(network, path)
+    try:
+        restorer.start()
+    except Exception:
+        restorer.close()
+        raise
@@ -0,0 +1,167 @@
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+
+from rete.nodes import AggregateNode
+from rete.nodes import AlphaMemory
+from rete.nodes import BetaNode
+from rete.nodes import JoinNode
+from rete.nodes import NccNode
+from rete.trace import label
+
+
+class NodeStats(NamedTuple):
+    node: Any
+    alpha: Optional[int]  # number of WMEs in the alpha memory of the node, if any
+    beta: Optional[int]  # number of tokens in the memory of the node, if any
+    activations: int  # number of join activations, if a join node
+    matches: int  # number of join results, if a join node
+
+    @property
+    def fan_out(self) -> float:
+        return self.matches / self.activations if self.activations else 0.0
+
+
+class Replan(NamedTuple):
+    production: Any
+    before: float  # estimated cost of the order compiled so far
+    after: float  # estimated cost of the new order
+    activations: int  # join activations counted on the path of the production, which ranked it for replanning
+    rebuilt: bool
+
+
+class ProductionCost(NamedTuple):
+    production: Any
+    tested: float  # number of token and WME pairs tested by the joins and negations
+    created: float  # number of tokens created
+    evaluations: float  # number of filter and bind templates evaluated
+    time: float  # seconds spent in the nodes, excluding the activations they caused, if traced
+    held: float  # number of tokens held in the memories
+
+    @property
+    def work(self) -> float:
+        return self.tested + self.created + self.evaluations
+
+
+class CostReport(NamedTuple):
+    by_cpu: List[ProductionCost]  # the costliest productions first, by time if traced, then by work
+    by_memory: List[ProductionCost]  # the productions holding the most tokens first
+
+
+def path(node: Any) -> List[Any]:
+    """ Return the beta nodes from the root to the given node, excluded.
+
+    :param node: a beta node, usually a production node
+    :return: the list of the ancestors of `node`, root first
+    """
+    result = []
+    node = node.parent
+    while node is not None:
+        result.insert(0, node)
+        node = node.parent
+
+    return result
+
+
+def ancestors(node: Any) -> List[Any]:
+    """ Return the beta nodes the given node depends on: its path, and the subnetworks of the negated conjunctions
+    and aggregates on it, partner nodes included.
+
+    :param node: a beta node, usually a production node
+    :return: the list of the nodes whose results reach `node`
+    """
+    result = []
+    seen = set()
+    todo = [node]
+    while todo:
+        for n in path(todo.pop()):
+            if id(n) not in seen:
+                seen.add(id(n))
+                result.append(n)
+                if isinstance(n, (NccNode, AggregateNode)) and id(n.partner) not in seen:
+                    seen.add(id(n.partner))
+                    result.append(n.partner)
+                    todo.append(n.partner)
+
+    return result
+
+
+def node_stats(node: Any) -> NodeStats:
+    """ Return the running statistics of the given beta node.
+
+    :param node: a beta node
+    :return: the sizes of its memories and its activation counts
+    """
+    amem = getattr(node, 'amem', None)
+    memory = getattr(node, 'memory', None)
+    if isinstance(node, JoinNode):
+        return NodeStats(node, len(amem.memory), None, node.activations, node.matches)
+
+    return NodeStats(node, None if amem is None else len(amem.memory), None if memory is None else len(memory), 0, 0)
+
+
+def activations(node: Any) -> int:
+    """ Return the number of join activations performed on the path of the given node.
+
+    :param node: a beta node, usually a production node
+    :return: the sum of the activations of the join nodes above `node`
+    """
+    return sum(n.activations for n in path(node) if isinstance(n, JoinNode))
+
+
+def owned(production: Any) -> List[Any]:
+    """ Return the nodes doing work for the given production: itself, the beta nodes it depends on, and their
+    alpha memories.
+
+    :param production: a production node, or the production of another engine keeping no beta network
+    :return: the list of the nodes
+    """
+    if not isinstance(production, BetaNode):
+        return [production]
+
+    result = ancestors(production) + [production]
+    amems = {id(n.amem): n.amem for n in result if getattr(n, 'amem', None) is not None}
+
+    return result + list(amems.values())
+
+
+def cost_report(productions: Iterable[Any], times: Optional[Dict[str, float]] = None) -> CostReport:
+    """ Attribute the work counted by the nodes to the given productions, and rank them.
+
+    The work of a node shared by several productions is split evenly between them, so that the costs of all the
+    productions add up to the work of the network.
+
+    :param productions: the productions to report on
+    :param times: the time spent in every node, by label, as returned by `Tracer.exclusive`
+    :return: the costs of the productions, ranked by CPU and by memory
+    """
+    productions = list(productions)
+    nodes = {}  # id(node) -> node
+    users = {}  # id(node) -> number of productions using the node
+    for production in productions:
+        for node in owned(production):
+            nodes[id(node)] = node
+            users[id(node)] = users.get(id(node), 0) + 1
+    times = times or {}
+    labels = {}  # label -> number of nodes sharing it
+    for node in nodes.values():
+        labels[label(node)] = labels.get(label(node), 0) + 1
+
+    costs = []
+    for production in productions:
+        tested = created = evaluations = time = held = 0.0
+        for node in owned(production):
+            share = 1.0 / users[id(node)]
+            tested += share * getattr(node, 'tested', 0)
+            created += share * getattr(node, 'created', 0)
+            evaluations += share * getattr(node, 'evaluations', 0)
+            time += share * times.get(label(node), 0.0) / labels[label(node)]
+            if not isinstance(node, AlphaMemory) and getattr(node, 'memory', None) is not None:
+                held += share * len(node.memory)
+        costs.append(ProductionCost(production, tested, created, evaluations, time, held))
+
+    return CostReport(sorted(costs, key=lambda c: (c.time, c.work), reverse=True),
+                      sorted(costs, key=lambda c: c.held, reverse=True))
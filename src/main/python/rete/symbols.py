@@ -0,0 +1,150 @@
+from typing import Any
+from typing import Hashable
+from typing import Iterator
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+
+class SymbolStats(NamedTuple):
+    size: int  # number of distinct symbols
+    hits: int  # number of lookups of a known symbol
+    misses: int  # number of lookups adding a new symbol
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+
+class SymbolTable(object):
+    """ A table giving a canonical object and an integer code to every symbol.
+
+    Interned symbols are reference counted: every `intern` takes a reference, every `release` drops one and a symbol
+    left without reference is evicted, its code being reused by the next new symbol. Encoded symbols are pinned
+    instead, since the codes stored by their users must keep their meaning.
+    """
+
+    def __init__(self) -> None:
+        self._codes = {}  # key(symbol) -> code
+        self._symbols = []  # code -> canonical symbol, None for a free code
+        self._free = []  # the codes of the evicted symbols
+        self._refs = {}  # code -> number of references taken by `intern`
+        self._pinned = set()  # the codes returned by `encode`
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    @staticmethod
+    def key(symbol: Hashable) -> Hashable:
+        # True and False equal 1 and 0 as dict keys: they are tagged with their type to get codes of their own
+        return (bool, symbol) if type(symbol) is bool else symbol
+
+    def _code(self, symbol: Hashable, key: Hashable) -> int:
+        code = self._codes.get(key)
+        if code is not None:
+            self._hits += 1
+            return code
+
+        self._misses += 1
+        if self._free:
+            code = self._free.pop()
+            self._symbols[code] = symbol
+        else:
+            code = len(self._symbols)
+            self._symbols.append(symbol)
+        self._codes[key] = code
+
+        return code
+
+    def encode(self, symbol: Hashable) -> int:
+        """ Return the code of the given symbol, assigning a new one if needed.
+
+        The symbol is never evicted afterwards.
+
+        :param symbol: the symbol to encode
+        :return: the code of the symbol
+        """
+        code = self._code(symbol, self.key(symbol))
+        self._pinned.add(code)
+
+        return code
+
+    def intern(self, symbol: Any) -> Any:
+        """ Return the canonical object equal to the given symbol, taking a reference on it.
+
+        Only strings are interned, any other value is returned as it is.
+
+        :param symbol: the symbol to intern
+        :return: the canonical object equal to `symbol`
+        """
+        if type(symbol) is not str:
+            return symbol
+
+        code = self._code(symbol, symbol)
+        self._refs[code] = self._refs.get(code, 0) + 1
+
+        return self._symbols[code]
+
+    def release(self, symbol: Any) -> None:
+        """ Drop a reference taken by `intern` on the given symbol, evicting it if it was the last one.
+
+        :param symbol: the symbol to release
+        """
+        code = self._codes.get(symbol) if type(symbol) is str else None
+        if code is None or code not in self._refs:
+            return
+
+        self._refs[code] -= 1
+        if self._refs[code] <= 0:
+            del self._refs[code]
+            if code not in self._pinned:
+                del self._codes[symbol]
+                self._symbols[code] = None
+                self._free.append(code)
+
+    def lookup(self, symbol: Hashable) -> Optional[int]:
+        return self._codes.get(self.key(symbol))
+
+    def decode(self, code: int) -> Hashable:
+        return self._symbols[code]
+
+    def items(self) -> Iterator[Tuple[int, Hashable]]:
+        """ Return the code and the symbol of every symbol of this table.
+
+        :return: the stream of (code, symbol) pairs
+        """
+        return ((code, self._symbols[code]) for code in self._codes.values())
+
+    def stats(self) -> SymbolStats:
+        return SymbolStats(len(self._codes), self._hits, self._misses)
+
+
+SYMBOLS = SymbolTable()
+
+
+def intern(symbol: Any) -> Any:
+    """ Return the canonical object equal to the given symbol in the global symbol table.
+
+    :param symbol: the symbol to intern
+    :return: the canonical object equal to `symbol`
+    """
+    return SYMBOLS.intern(symbol)
+
+
+def release(*symbols: Any) -> None:
+    """ Drop a reference on each of the given symbols in the global symbol table.
+
+    :param symbols: the symbols to release
+    """
+    for symbol in symbols:
+        SYMBOLS.release(symbol)
+
+
+def stats() -> SymbolStats:
+    """ Return the size and the hit rate of the global symbol table.
+
+    :return: the statistics of the global symbol table
+    """
+    return SYMBOLS.stats()
@@ -0,0 +1,166 @@
+import copy
+import math
+import time
+from typing import Any
+from typing import List
+
+from rete.utils import Identity
+
+
+class SystemClock(object):
+
+    @staticmethod
+    def now() -> float:
+        return time.monotonic()
+
+
+class ManualClock(object):
+
+    def __init__(self, now: float = 0.0) -> None:
+        """ Constructor.
+
+        :param now: the initial time, in seconds
+        """
+        self._now = now
+
+    def now(self) -> float:
+        return self._now
+
+    def set(self, now: float) -> None:
+        self._now = now
+
+    def advance(self, seconds: float) -> float:
+        self._now += seconds
+        return self._now
+
+
+class TimerWheel(object):
+    """ A hierarchical timing wheel.
+
+    Level 0 has one slot per tick; every slot of level `n` covers a whole turn of level `n - 1`. A timer is stored
+    in the lowest level whose range covers its deadline, and moved down when the wheel reaches its slot, so
+    scheduling and cancelling are O(1) and each timer is moved at most once per level. Advancing jumps from one
+    occupied slot to the next, skipping the empty ticks between them.
+    """
+
+    def __init__(self, resolution: float = 1.0, slots: int = 64, levels: int = 4, start: float = 0.0) -> None:
+        """ Constructor.
+
+        :param resolution: the duration of a tick, in seconds
+        :param slots: the number of slots of every level
+        :param levels: the number of levels
+        :param start: the current time, in seconds
+        """
+        self._resolution = resolution
+        self._slots = slots
+        self._wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._where = {}  # id(item) -> (level, slot, deadline tick)
+        self._due = {}  # id(item) -> item, for the timers whose deadline tick is already reached
+        self._tick = math.floor(start / resolution)
+
+    def __len__(self) -> int:
+        return len(self._where) + len(self._due)
+
+    def __contains__(self, item: Any) -> bool:
+        return id(item) in self._where or id(item) in self._due
+
+    def copy(self) -> 'TimerWheel':
+        """ Return a copy of this wheel, for a fork of the working memory.
+
+        :return: a wheel holding the same timers, which can change independently
+        """
+        result = copy.copy(self)
+        result._wheels = [[dict(slot) for slot in level] for level in self._wheels]
+        result._where = dict(self._where)
+        result._due = dict(self._due)
+        return result
+
+    def schedule(self, item: Any, deadline: float) -> None:
+        """ Schedule the expiry of the given item, replacing its earlier schedule if any.
+
+        :param item: the item to expire
+        :param deadline: the time of the expiry, in seconds
+        """
+        self.cancel(item)
+        self.insert(item, math.ceil(deadline / self._resolution))
+
+    def insert(self, item: Any, tick: int) -> None:
+        delta = tick - self._tick
+        if delta <= 0:
+            self._due[Identity(id(item))] = item
+            return
+
+        level = 0
+        while level < len(self._wheels) - 1 and delta >= self._slots ** (level + 1):
+            level += 1
+        span = self._slots ** level
+        # beyond the range of the top level: parked in its farthest slot, and inserted again from there
+        slot = (min(tick, self._tick + span * (self._slots - 1)) // span) % self._slots
+        key = Identity(id(item))
+        self._wheels[level][slot][key] = item
+        self._where[key] = (level, slot, tick)
+
+    def cancel(self, item: Any) -> bool:
+        """ Cancel the expiry of the given item.
+
+        :param item: the item to cancel
+        :return: True if the item was scheduled, False otherwise
+        """
+        if self._due.pop(id(item), None) is not None:
+            return True
+        where = self._where.pop(id(item), None)
+        if where is None:
+            return False
+        del self._wheels[where[0]][where[1]][id(item)]
+        return True
+
+    def advance(self, now: float) -> List[Any]:
+        """ Move the wheel forward to the given time.
+
+        :param now: the current time, in seconds
+        :return: the items expired since the last call, in order of expiry
+        """
+        result = list(self._due.values())
+        self._due.clear()
+        target = math.floor(now / self._resolution)
+        while self._tick < target:
+            if not self._where:
+                self._tick = target
+                break
+            # the ticks reaching no occupied slot are skipped
+            self._tick = min(self.next_tick(), target)
+            for level in range(1, len(self._wheels)):
+                span = self._slots ** level
+                if self._tick % span:
+                    break
+                self.cascade(level, (self._tick // span) % self._slots)
+            result.extend(self._due.values())
+            self._due.clear()
+            bucket = self._wheels[0][self._tick % self._slots]
+            if bucket:
+                self._wheels[0][self._tick % self._slots] = {}
+                for key, item in bucket.items():
+                    del self._where[key]
+                    result.append(item)
+
+        return result
+
+    def next_tick(self) -> int:
+        """ Return the first tick after the current one at which the wheel reaches an occupied slot of any level.
+
+        :return: the tick, infinite if no timer is scheduled
+        """
+        result = math.inf
+        for level, wheel in enumerate(self._wheels):
+            span = self._slots ** level
+            first = self._tick // span + 1
+            turn = next((k for k in range(self._slots) if wheel[(first + k) % self._slots]), None)
+            if turn is not None:
+                result = min(result, (first + turn) * span)
+
+        return result
+
+    def cascade(self, level: int, slot: int) -> None:
+        bucket, self._wheels[level][slot] = self._wheels[level][slot], {}
+        for key, item in bucket.items():
+            self.insert(item, self._where.pop(key)[2])
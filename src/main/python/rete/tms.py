@@ -0,0 +1,126 @@
+from typing import Any
+from typing import List
+from typing import Tuple
+
+from rete.common import Token
+from rete.common import WME
+from rete.utils import Identity
+
+
+class TruthMaintenance(object):
+    """ Keep the logically asserted WMEs in working memory only while a production match justifies them.
+
+    Every justification is a token of a production memory. A WME asserted by several tokens is added once and
+    reference counted; when the last of its justifying tokens is deleted, it is queued for retraction. Queued
+    retractions are deferred until the operation that deleted the tokens completes, then removed one by one within a
+    single batch of events, so that listeners only receive the net changes; the retractions they cause in turn are
+    applied in the next round.
+    """
+
+    def __init__(self, network: Any) -> None:
+        """ Constructor.
+
+        :param network: the network holding the WMEs
+        """
+        self._network = network
+        self._support = {}  # (identifier, attribute, value) -> [WME, number of justifications]
+        self._justified = {}  # id(Token) -> list of WME justified by the token
+        self._pending = []
+        self._draining = False
+
+    def __len__(self) -> int:
+        return len(self._support)
+
+    def copy(self) -> 'TruthMaintenance':
+        """ Return a copy of this object, for a fork of the working memory.
+
+        :return: an object holding the same justifications, which can change independently
+        """
+        result = TruthMaintenance(self._network)
+        result._support = {k: list(v) for k, v in self._support.items()}
+        result._justified = {k: list(v) for k, v in self._justified.items()}
+        result._pending = list(self._pending)
+        return result
+
+    @staticmethod
+    def key(wme: WME) -> Tuple[Any, Any, Any]:
+        return wme.identifier, wme.attribute, wme.value
+
+    def add(self, wme: WME, token: Token) -> WME:
+        """ Assert the given WME, justified by the given production token.
+
+        :param wme: the WME to assert
+        :param token: the token of a production memory justifying the WME
+        :return: the WME held in working memory, which is an earlier equal WME if already asserted
+        """
+        if getattr(token.node, 'tms', None) is not self:
+            raise ValueError(f"{token} is not a match of a production of this network")
+
+        entry = self._support.get(self.key(wme))
+        if entry is None:
+            entry = self._support[self.key(wme)] = [wme, 0]
+            self._network.add_wme(wme)
+        entry[1] += 1
+        self._justified.setdefault(Identity(id(token)), []).append(entry[0])
+
+        return entry[0]
+
+    def supports(self, wme: WME) -> int:
+        """ Return the number of justifications of the given WME.
+
+        :param wme: the WME to check
+        :return: the number of tokens justifying the WME
+        """
+        entry = self._support.get(self.key(wme))
+        return entry[1] if entry is not None and entry[0] is wme else 0
+
+    def release(self, token: Token) -> None:
+        """ Withdraw the justifications provided by the given token, which is being deleted.
+
+        :param token: the deleted token
+        """
+        for wme in self._justified.pop(id(token), []):
+            entry = self._support.get(self.key(wme))
+            if entry is None or entry[0] is not wme:
+                continue
+            entry[1] -= 1
+            if not entry[1]:
+                del self._support[self.key(wme)]
+                self._pending.append(wme)
+
+    def transfer(self, token: Token, other: Token) -> None:
+        """ Move the justifications provided by the given token to another token for the same match.
+
+        :param token: the token being replaced
+        :param other: the token replacing it
+        """
+        justified = self._justified.pop(id(token), None)
+        if justified:
+            self._justified.setdefault(Identity(id(other)), []).extend(justified)
+
+    def discard(self, wme: WME) -> None:
+        """ Forget the justifications of the given WME, which is being removed from working memory.
+
+        :param wme: the removed WME
+        """
+        entry = self._support.get(self.key(wme))
+        if entry is not None and entry[0] is wme:
+            del self._support[self.key(wme)]
+
+    def drain(self) -> None:
+        """ Retract the WMEs which lost their last justification, until no retraction is pending. """
+        if self._draining:
+            return
+
+        self._draining = True
+        try:
+            while self._pending:
+                pending, self._pending = self._pending, []
+                with self._network.batch():
+                    for wme in pending:
+                        self._network.remove_wme(wme)
+        finally:
+            self._draining = False
+
+    def justified(self, token: Token) -> List[WME]:
+        return list(self._justified.get(id(token), []))
@@ -0,0 +1,292 @@
+""" Summarize the costliest cascades of a trace written by `Tracer.dump`.
+
+    PYTHONPATH=src/main/python python -m rete.trace trace.bin --top 10
+"""
+import argparse
+import collections
+import random
+import struct
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import IO
+from typing import Iterable
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+MAGIC = b'RETETRC1'
+KINDS = ['add_wme', 'remove_wme', 'alpha', 'left', 'right']  # the operations starting a cascade, then activations
+METHODS = {'activation': 'alpha', 'left_activation': 'left', 'right_activation': 'right'}
+COUNT = struct.Struct('<I')
+RECORD = struct.Struct('<IIIBHId')  # cascade, WME and node as indexes of strings, kind, depth, tokens, duration
+
+
+class TraceRecord(NamedTuple):
+    cascade: int  # the number of the sampled operation
+    wme: str  # the WME added or removed by the operation
+    node: str  # the node activated, or the operation for the record of the whole cascade
+    kind: str  # one of KINDS
+    depth: int  # 0 for the operation, 1 for the activations it performs directly, and so on
+    produced: int  # the number of tokens passed down to the children of the node, or by all of them for the operation
+    duration: float  # the time spent in the activation, including the activations it caused, in seconds
+
+
+class Cascade(NamedTuple):
+    cascade: int
+    wme: str
+    operation: str  # add_wme or remove_wme
+    duration: float  # the time spent in the operation, in seconds
+    activations: int
+    produced: int  # the number of tokens passed down by all the nodes
+    hottest: str  # the node the most time was spent in, excluding the activations it caused
+    hottest_time: float
+
+
+def label(node: Any) -> str:
+    name = getattr(node, 'name', None)
+    return f"{type(node).__name__} {id(node) if name is None else name}"
+
+
+class Tracer(object):
+    """ Record the node activations of a sample of the operations of a network in a ring buffer.
+
+    Every `add_wme` and `remove_wme` is sampled with the given probability; the activations of a sampled operation,
+    called its cascade, are timed and recorded, together with the number of tokens every node passes down. The
+    buffer keeps the most recent records only, so that memory is bounded whatever the duration of the trace.
+
+    Tracing wraps the activation methods of the nodes: an operation not sampled pays one indirection and one test
+    per activation. The nodes compiled later are wrapped when their production is added.
+    """
+
+    def __init__(self, network: Any, rate: float = 0.01, capacity: int = 100000, seed: Optional[int] = None) -> None:
+        """ Constructor.
+
+        :param network: the network to trace
+        :param rate: the probability that an operation is traced
+        :param capacity: the maximum number of records kept
+        :param seed: the seed of the sampling, for reproducible traces
+        """
+        self._network = network
+        self._rate = rate
+        self._random = random.Random(seed)
+        self._records = collections.deque(maxlen=capacity)
+        self._frames = None  # the tokens produced by the activations in progress, None unless sampling
+        self._cascade = 0
+        self._wme = None
+        self._produced = 0  # the number of tokens passed down in the cascade in progress
+        self._wrapped = []  # (object, name of the method wrapped)
+        self.wrap()
+        network.attach(self)
+
+    @property
+    def records(self) -> List[TraceRecord]:
+        return list(self._records)
+
+    def on_operation(self, name: str, args: Tuple[Any, ...], kwargs: Dict[str, Any], result: Any) -> None:
+        if name in ('add_production', 'remove_production'):
+            self.unwrap()
+            self.wrap()
+
+    def wrap(self) -> None:
+        for name in ('add_wme', 'remove_wme'):
+            self.patch(self._network, name, self.operation(getattr(self._network, name), name))
+        for node in self._network.nodes():
+            for name, kind in METHODS.items():
+                if hasattr(type(node), name):
+                    self.patch(node, name, self.activation(getattr(node, name), label(node), kind))
+
+    def patch(self, target: Any, name: str, method: Callable[..., Any]) -> None:
+        target.__dict__[name] = method
+        self._wrapped.append((target, name))
+
+    def unwrap(self) -> None:
+        for target, name in self._wrapped:
+            target.__dict__.pop(name, None)
+        self._wrapped.clear()
+
+    def detach(self) -> None:
+        """ Stop tracing; the records are kept. """
+        self.unwrap()
+        self._network.detach(self)
+
+    def operation(self, method: Callable[..., Any], name: str) -> Callable[..., Any]:
+        def traced(wme, *args, **kwargs):
+            if self._frames is not None or self._random.random() >= self._rate:
+                return method(wme, *args, **kwargs)
+
+            self._cascade += 1
+            self._wme = repr(wme)
+            self._frames = [[0]]
+            self._produced = 0
+            start = time.perf_counter()
+            try:
+                return method(wme, *args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                self._records.append(TraceRecord(self._cascade, self._wme, name, name, 0, self._produced, duration))
+                self._frames = None
+
+        return traced
+
+    def activation(self, method: Callable[..., Any], node: str, kind: str) -> Callable[..., Any]:
+        def traced(*args, **kwargs):
+            frames = self._frames
+            if frames is None:
+                return method(*args, **kwargs)
+
+            if kind == 'left':
+                frames[-1][0] += 1
+                self._produced += 1
+            frame = [0]
+            frames.append(frame)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                frames.pop()
+                self._records.append(TraceRecord(self._cascade, self._wme, node, kind, len(frames), frame[0],
+                                                 duration))
+
+        return traced
+
+    def dump(self, file: IO[bytes]) -> None:
+        write(self._records, file)
+
+    def summarize(self, top: int = 10) -> List[Cascade]:
+        return summarize(self._records, top)
+
+    def exclusive(self) -> Dict[str, float]:
+        return exclusive(self._records)
+
+
+def write(records: Iterable[TraceRecord], file: IO[bytes]) -> None:
+    """ Write the given records to the given binary file: a table of the strings, then fixed-size records.
+
+    :param records: the records to write
+    :param file: the file to write to
+    """
+    strings = {}
+    packed = []
+    for r in records:
+        packed.append(RECORD.pack(r.cascade, strings.setdefault(r.wme, len(strings)),
+                                  strings.setdefault(r.node, len(strings)), KINDS.index(r.kind), r.depth, r.produced,
+                                  r.duration))
+    file.write(MAGIC)
+    file.write(COUNT.pack(len(strings)))
+    for value in strings:
+        encoded = value.encode('utf-8')
+        file.write(COUNT.pack(len(encoded)))
+        file.write(encoded)
+    file.write(COUNT.pack(len(packed)))
+    file.write(b''.join(packed))
+
+
+def read(file: IO[bytes]) -> List[TraceRecord]:
+    """ Read the records written by `write` from the given binary file.
+
+    :param file: the file to read from
+    :return: the records
+    """
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError('not a trace file')
+    strings = []
+    for _ in range(COUNT.unpack(file.read(COUNT.size))[0]):
+        length, = COUNT.unpack(file.read(COUNT.size))
+        strings.append(file.read(length).decode('utf-8'))
+    count, = COUNT.unpack(file.read(COUNT.size))
+    result = []
+    for cascade, wme, node, kind, depth, produced, duration in RECORD.iter_unpack(file.read(RECORD.size * count)):
+        result.append(TraceRecord(cascade, strings[wme], strings[node], KINDS[kind], depth, produced, duration))
+
+    return result
+
+
+def cascades(records: Iterable[TraceRecord]) -> Iterable[List[TraceRecord]]:
+    """ Group the given records by cascade, leaving out the cascades whose first records were dropped from the ring
+    buffer, without the record of their operation.
+
+    :param records: the records, in the order they were recorded
+    :return: the records of every complete cascade, its operation last
+    """
+    groups = collections.OrderedDict()
+    for r in records:
+        groups.setdefault(r.cascade, []).append(r)
+    for rows in groups.values():
+        if rows[-1].depth == 0 and rows[-1].produced == sum(r.produced for r in rows[:-1]):
+            yield rows
+
+
+def spent(rows: List[TraceRecord]) -> Dict[str, float]:
+    """ Return the time spent in every node of the given cascade, excluding the activations it caused.
+
+    :param rows: the records of a complete cascade
+    :return: the time in seconds by node, the operation left out
+    """
+    children = collections.defaultdict(float)  # depth -> time spent in the activations at that depth so far
+    result = collections.defaultdict(float)
+    for r in rows:
+        # the records are appended as the activations return: the children of a record precede it
+        result[r.node] += r.duration - children.pop(r.depth + 1, 0.0)
+        children[r.depth] += r.duration
+    del result[rows[-1].node]
+
+    return result
+
+
+def exclusive(records: Iterable[TraceRecord]) -> Dict[str, float]:
+    """ Return the time spent in every node over the complete cascades of the given records, excluding the
+    activations it caused.
+
+    :param records: the records, in the order they were recorded
+    :return: the time in seconds by node
+    """
+    result = collections.defaultdict(float)
+    for rows in cascades(records):
+        for node, duration in spent(rows).items():
+            result[node] += duration
+
+    return dict(result)
+
+
+def summarize(records: Iterable[TraceRecord], top: int = 10) -> List[Cascade]:
+    """ Return the costliest cascades of the given records, with the node each spent the most time in.
+
+    The cascades whose first records were dropped from the ring buffer, without the record of their operation,
+    are left out.
+
+    :param records: the records, in the order they were recorded
+    :param top: the number of cascades to return
+    :return: the cascades, costliest first
+    """
+    result = []
+    for rows in cascades(records):
+        times = spent(rows)
+        root = rows[-1]
+        hottest = max(times, key=times.get, default='')
+        result.append(Cascade(root.cascade, root.wme, root.kind, root.duration, len(rows) - 1, root.produced, hottest,
+                              times.get(hottest, 0.0)))
+    result.sort(key=lambda c: c.duration, reverse=True)
+
+    return result[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('trace', help='the file written by `Tracer.dump`')
+    parser.add_argument('--top', type=int, default=10, help='the number of cascades to show')
+    args = parser.parse_args()
+
+    with open(args.trace, 'rb') as file:
+        cascades = summarize(read(file), args.top)
+    print(f"{'ms':>10} {'op':>10} {'activations':>11} {'tokens':>8}  {'wme':<30} hottest node")
+    for c in cascades:
+        print(f"{c.duration * 1e3:>10.3f} {c.operation:>10} {c.activations:>11} {c.produced:>8}  {c.wme:<30} "
+              f"{c.hottest} ({c.hottest_time * 1e3:.3f} ms)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from rete.common import Aggregate
+from rete.common import Exists
+from rete.common import FIELDS
+from rete.common import Has
+from rete.common import Ncc
+from rete.common import Neg
+from rete.common import Rule
+from rete.common import WME
+from rete.network import Network
+from rete.nodes import AlphaMemory
+from rete.query import names
+from rete.query import Query
+from rete.sessions import Local
+from rete.sessions import restore_pending
+from rete.stats import cost_report
+from rete.stats import CostReport
+from rete.symbols import release
+from rete.utils import is_var
+
+
+class Match(object):
+
+    def __init__(self, wmes: List[Optional[WME]], binding: Dict[str, Any]) -> None:
+        """ Constructor.
+
+        :param wmes: the WME matching each condition of the production, or None
+        :param binding: the values of the variables of the production
+        """
+        self.wmes = wmes
+        self.binding = binding
+
+    def __repr__(self) -> str:
+        return "<Match %s>" % self.wmes
+
+    @property
+    def key(self) -> Tuple[int, ...]:
+        return tuple(id(w) for w in self.wmes)
+
+    def get_binding(self, v: str) -> Any:
+        return self.binding.get(v)
+
+    def all_binding(self) -> Dict[str, Any]:
+        return dict(self.binding)
+
+
+class TreatProduction(object):
+    _memory = Local(list)
+
+    def __init__(self, lhs: Rule, **kwargs) -> None:
+        """ Constructor.
+
+        :param lhs: the conditions of the production
+        :param kwargs: the attributes of the production
+        """
+        self.lhs = lhs
+        self._memory = []
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+
+    @property
+    def memory(self) -> List[Match]:
+        return self._memory
+
+
+class TreatNetwork(Network):
+    """ A match engine keeping only alpha memories and conflict sets.
+
+    Partial matches are never stored: when a WME enters an alpha memory, the productions using that memory search
+    for the new complete matches seeded with the WME; when a WME leaves, the matches containing it are dropped.
+    Negated conjunctions are re-evaluated lazily, by recomputing the conflict set of the affected productions.
+    """
+
+    def __init__(self, clock=None):
+        super(TreatNetwork, self).__init__(clock)
+        self.productions = []
+        self._amems = {}  # the constants of a condition, as a tuple of (field, symbol) -> AlphaMemory
+        self._users = {}  # id(AlphaMemory) -> [(production, position)], None for Exists and inside Ncc or Aggregate
+
+    def nodes(self):
+        yield from super(TreatNetwork, self).nodes()
+        yield from self.productions
+
+    def cost_report(self, tracer: Any = None) -> CostReport:
+        """ Rank the productions by the matches they hold; the searches are performed by no node, and not counted.
+
+        :param tracer: ignored, no activation is traced
+        :return: the costs of the productions
+        """
+        return cost_report(self.productions)
+
+    def candidates(self, condition):
+        """
+        :type condition: Has
+        :rtype: (list of WME, bool)
+        """
+        amem = self._amems.get(self.constants(condition))
+        if amem is None:
+            return super(TreatNetwork, self).candidates(condition)
+
+        return amem.memory, True
+
+    def add_production(self, lhs, reorder=False, **kwargs):
+        """
+        :type kwargs:
+        :type lhs: Rule
+        :param reorder: ignored, the conditions are ordered again by every search
+        """
+        node = TreatProduction(lhs, **kwargs)
+        self.register(node, lhs, True)
+        self.productions.append(node)
+        node.memory.extend(Match(wmes, binding) for binding, wmes in Query(lhs, self.candidates).solutions())
+        self.notify('add_production', (lhs,), kwargs, node)
+        return node
+
+    def register(self, node: TreatProduction, conditions: Iterable[Any], top: bool) -> None:
+        for position, cond in enumerate(conditions):
+            if isinstance(cond, (Ncc, Aggregate)):
+                self.register(node, cond, False)
+            elif isinstance(cond, Has):
+                amem = self._amems.get(self.constants(cond))
+                if amem is None:
+                    amem = self._amems[self.constants(cond)] = self.build_or_share_alpha_memory(cond)
+                seeded = top and not isinstance(cond, Exists)
+                self._users.setdefault(id(amem), []).append((node, position if seeded else None))
+
+    @staticmethod
+    def constants(condition: Has) -> Tuple[Tuple[str, Any], ...]:
+        return tuple((f, getattr(condition, f)) for f in FIELDS if not is_var(getattr(condition, f)))
+
+    def remove_production(self, node):
+        self.productions.remove(node)
+        for key, amem in list(self._amems.items()):
+            users = self._users[id(amem)]
+            users[:] = [(p, position) for p, position in users if p is not node]
+            if not users:
+                del self._amems[key]
+                del self._users[id(amem)]
+                self.release(amem)
+        node.memory.clear()
+        self.notify('remove_production', (node,))
+
+    def release(self, amem: AlphaMemory) -> None:
+        """ Unlink the given alpha memory, used by no production anymore, from the alpha network and its WMEs.
+
+        :param amem: the alpha memory to release
+        """
+        if amem is self.alpha_root.amem:
+            return
+        alpha = [self.alpha_root]
+        while alpha:
+            node = alpha.pop()
+            if node.amem is amem:
+                node.amem = None
+            alpha.extend(node.children)
+        for wme in amem.memory:
+            wme.remove_memory(amem)
+
+    def affected(self, amems: Iterable[AlphaMemory]) -> Dict[int, Tuple[TreatProduction, List[Optional[int]]]]:
+        result = {}
+        for amem in amems:
+            for node, position in self._users.get(id(amem), []):
+                result.setdefault(id(node), (node, []))[1].append(position)
+
+        return result
+
+    def add_wme(self, wme, ttl=None):
+        self.stamp(wme, ttl)
+        self.alpha_root.activation(wme)
+        for node, positions in self.affected(wme.amems).values():
+            if None in positions:
+                self.recompute(node)
+                continue
+            seeded = []
+            for position in sorted(positions):
+                cond = node.lhs[position]
+                if isinstance(cond, Neg):
+                    node.memory[:] = [m for m in node.memory if not any(Query.matches(cond, [wme], m.binding))]
+                else:
+                    node.memory.extend(self.seed(node, cond, wme, seeded))
+                    seeded.append(cond)
+        self.notify('add_wme', (wme,), None if ttl is None else {'ttl': ttl})
+
+    def seed(self, node: TreatProduction, cond: Has, wme: WME, seeded: List[Has]) -> Iterable[Match]:
+        """ Return the new matches of the given production using `wme` for `cond`.
+
+        :param node: the production to match
+        :param cond: the condition matched by the new WME
+        :param wme: the new WME
+        :param seeded: the conditions already seeded with the new WME, which must not use it again
+        :return: the new matches
+        """
+        def candidates(c):
+            if c is cond:
+                return [wme], True
+            wmes, exact = self.candidates(c)
+            if any(c is s for s in seeded):
+                return [w for w in wmes if w is not wme], exact
+            return wmes, exact
+
+        return [Match(wmes, binding) for binding, wmes in Query(node.lhs, candidates).solutions()]
+
+    def remove_wme(self, wme):
+        """
+        :type wme: WME
+        """
+        restore_pending()  # the memories referencing the WME must all be restored
+        self.timers.cancel(wme)
+        amems = list(wme.amems)
+        for am in amems:
+            am.memory.remove(wme)
+            wme.remove_memory(am)
+        for node, positions in self.affected(amems).values():
+            if None in positions:
+                self.recompute(node)
+                continue
+            node.memory[:] = [m for m in node.memory if not any(w is wme for w in m.wmes)]
+            for position in positions:
+                cond = node.lhs[position]
+                if isinstance(cond, Neg):
+                    self.unblock(node, cond, wme)
+        self.notify('remove_wme', (wme,))
+        release(wme.identifier, wme.attribute, wme.value)
+
+    def unblock(self, node: TreatProduction, cond: Neg, wme: WME) -> None:
+        """ Add the matches of the given production that were blocked by `wme` only.
+
+        :param node: the production to match
+        :param cond: the negated condition matched by the removed WME
+        :param wme: the removed WME
+        """
+        bound = {v for c in node.lhs if isinstance(c, Has) and not isinstance(c, (Neg, Exists)) for v in names(c)}
+        binding = next(Query.matches(cond, [wme], {}), {})
+        existing = {m.key for m in node.memory}
+        for result, wmes in Query(node.lhs, self.candidates).solutions({k: binding[k] for k in bound & set(binding)}):
+            match = Match(wmes, result)
+            if match.key not in existing:
+                node.memory.append(match)
+
+    def recompute(self, node: TreatProduction) -> None:
+        existing = {m.key: m for m in node.memory}
+        matches = [Match(wmes, binding) for binding, wmes in Query(node.lhs, self.candidates).solutions()]
+        node.memory[:] = [existing[m.key] if m.key in existing and existing[m.key].binding == m.binding else m
+                          for m in matches]
@@ -1,2 +1,139 @@
-def is_var(name: str) -> bool:
-    return name.startswith('$')
+import operator
+import pickle
+import re
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+VARIABLE = re.compile(r'\$\w+')
+COMPARISON = re.compile(r'^\s*(\$\w+)\s*(<=|>=|<|>)\s*(\$\w+)\s*$')
+OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+CONVERSE = {'<': '>', '<=': '>=', '>': '<', '>=': '<='}
+
+# the type codes of the WME fields when serialized, with the functions encoding and decoding them
+ENCODINGS = {
+    str: (b's', lambda v: v.encode('utf-8'), lambda b: str(b, 'utf-8')),
+    bool: (b'b', lambda v: b'1' if v else b'', bool),
+    int: (b'i', lambda v: str(v).encode('ascii'), int),
+    float: (b'f', lambda v: repr(v).encode('ascii'), float),
+    type(None): (b'n', lambda v: b'', lambda b: None),
+}
+DECODINGS = {code: decode for code, _, decode in ENCODINGS.values()}
+PICKLED = b'p'  # the type code of the other values, pickled
+
+
+def is_var(name: Any) -> bool:
+    return isinstance(name, str) and name.startswith('$')
+
+
+def variables(template: str) -> List[str]:
+    """ Return the variables referenced by the given template, in order of appearance.
+
+    :param template: the template of a `Filter` or `Bind`
+    :return: the list of variables referenced by the template
+    """
+    return list(dict.fromkeys(VARIABLE.findall(template)))
+
+
+def number(value: Any) -> Any:
+    """ Return the number represented by the given value, or the value itself if it is not numeric.
+
+    :param value: a WME field or a binding
+    :return: the int or float represented by `value`, else `value`
+    """
+    if not isinstance(value, str):
+        return value
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+
+    return value
+
+
+def evaluate(template: str, binding: Dict[str, Any]) -> Any:
+    """ Evaluate the given template after replacing its variables with the given binding.
+
+    :param template: the template of a `Filter` or `Bind`
+    :param binding: the values of the variables
+    :return: the result of the evaluation
+    """
+    code = template
+    for k in binding:
+        code = code.replace(k, str(binding[k]))
+
+    return eval(code)
+
+
+def comparison(template: str) -> Optional[Tuple[str, str, str]]:
+    """ Return the operands and the operator of the given template, if it only compares two variables.
+
+    :param template: the template of a `Filter`
+    :return: the tuple (variable, operator, variable), or None if `template` is not a simple comparison
+    """
+    found = COMPARISON.match(template)
+    if not found:
+        return None
+
+    return found.group(1), found.group(2), found.group(3)
+
+
+def ordinal(value: Any) -> Optional[Any]:
+    """ Return the number represented by the given value, or None if it is not numeric.
+
+    :param value: a WME field or a binding
+    :return: the int or float represented by `value`, else None
+    """
+    value = number(value)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+
+    return value
+
+
+def encode_value(value: Any) -> Tuple[bytes, bytes]:
+    """ Serialize the given WME field, keeping its type.
+
+    :param value: the value of the field
+    :return: the type code of the value and its encoding, see `decode_value`
+    """
+    code, encode, _ = ENCODINGS.get(type(value), (PICKLED, pickle.dumps, None))
+    return code, encode(value)
+
+
+def decode_value(code: bytes, data: Any) -> Any:
+    """ Deserialize a WME field serialized by `encode_value`.
+
+    :param code: the type code of the value
+    :param data: the encoding of the value, a bytes-like object
+    :return: the value of the field
+    """
+    return DECODINGS.get(code, pickle.loads)(bytes(data))
+
+
+def compare(value1: Any, op: str, value2: Any) -> bool:
+    """ Compare the given values as numbers; non-numeric values never satisfy a comparison.
+
+    :param value1: the left operand
+    :param op: the operator, a key of `OPERATORS`
+    :param value2: the right operand
+    :return: True if both values are numeric and satisfy the comparison, False otherwise
+    """
+    value1, value2 = ordinal(value1), ordinal(value2)
+    if value1 is None or value2 is None:
+        return False
+
+    return OPERATORS[op](value1, value2)
+
+
+class Identity(int):
+    """ The id of a token or WME, kept as a key in place of the object itself.
+
+    Being tagged, these ints are told apart from any other int when a snapshot is taken, and restored as the ids of
+    the restored objects.
+    """
+
+    __slots__ = ()
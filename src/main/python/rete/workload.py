@@ -0,0 +1,207 @@
+import json
+import random
+from typing import Any
+from typing import Dict
+from typing import IO
+from typing import Iterator
+from typing import List
+from typing import NamedTuple
+from typing import Tuple
+
+from rete.common import dump_xml
+from rete.common import Has
+from rete.common import Ncc
+from rete.common import Neg
+from rete.common import parse_xml
+from rete.common import Rule
+from rete.common import WME
+
+
+class Profile(NamedTuple):
+    rules: int = 10  # number of productions
+    conditions: int = 3  # positive conditions per production
+    selectivity: float = 0.1  # probability that two random symbols join
+    negations: float = 0.0  # fraction of productions with a negated condition
+    nccs: float = 0.0  # fraction of productions with a negated conjunction
+    attributes: int = 5  # size of the attribute vocabulary
+    wmes: int = 1000  # number of WMEs added by the stream
+    removals: float = 0.0  # ratio of removals over additions in the stream
+    seed: int = 0  # seed of the pseudo-random generator
+
+
+class Operation(NamedTuple):
+    name: str
+    args: Tuple[Any, ...]
+    kwargs: Dict[str, Any]
+
+
+class Generator(object):
+
+    def __init__(self, profile: Profile = None, **kwargs) -> None:
+        """ Constructor.
+
+        :param profile: the shape of the workload to generate
+        :param kwargs: overrides for the fields of `profile`
+        """
+        self._profile = (profile or Profile())._replace(**kwargs)
+        self._domain = max(1, round(1 / self._profile.selectivity)) if self._profile.selectivity > 0 else 1
+
+    @property
+    def profile(self) -> Profile:
+        return self._profile
+
+    def symbol(self, rnd: random.Random) -> str:
+        return f"s{rnd.randrange(self._domain)}"
+
+    def attribute(self, rnd: random.Random) -> str:
+        return f"a{rnd.randrange(self._profile.attributes)}"
+
+    def rules(self) -> List[Rule]:
+        """ Return the productions described by the profile.
+
+        Every production is a chain of `Has` conditions joined on consecutive variables, optionally followed by
+        a negated condition and a negated conjunction on the last variable of the chain.
+
+        :return: the list of generated productions
+        """
+        rnd = random.Random(self._profile.seed)
+        result = []
+        for _ in range(self._profile.rules):
+            rule = Rule()
+            for i in range(self._profile.conditions):
+                rule.append(Has(f"$v{i}", self.attribute(rnd), f"$v{i + 1}"))
+            last = f"$v{self._profile.conditions}"
+            if rnd.random() < self._profile.negations:
+                rule.append(Neg(last, self.attribute(rnd), self.symbol(rnd)))
+            if rnd.random() < self._profile.nccs:
+                rule.append(Ncc(Has(last, self.attribute(rnd), '$n0'), Has('$n0', self.attribute(rnd), '$n1')))
+            result.append(rule)
+
+        return result
+
+    def productions(self) -> List[Tuple[Rule, Dict[str, str]]]:
+        return [(rule, {'name': f"p{i}"}) for i, rule in enumerate(self.rules())]
+
+    def to_xml(self) -> str:
+        """ Return the productions described by the profile in the format read by `parse_xml`.
+
+        :return: the XML document of the generated productions
+        """
+        return dump_xml(self.productions())
+
+    def operations(self) -> Iterator[Operation]:
+        """ Return the stream of `add_wme` and `remove_wme` operations described by the profile.
+
+        Removals always target a WME added earlier in the stream and not removed yet.
+
+        :return: the stream of operations
+        """
+        rnd = random.Random(self._profile.seed + 1)
+        alive = []
+        added = 0
+        while added < self._profile.wmes:
+            if alive and rnd.random() < self._profile.removals / (1 + self._profile.removals):
+                wme = alive.pop(rnd.randrange(len(alive)))
+                yield Operation('remove_wme', (wme,), {})
+            else:
+                wme = WME(self.symbol(rnd), self.attribute(rnd), self.symbol(rnd))
+                alive.append(wme)
+                added += 1
+                yield Operation('add_wme', (wme,), {})
+
+
+class Recorder(object):
+
+    def __init__(self, network: Any = None) -> None:
+        """ Constructor.
+
+        :param network: the network to record, if any
+        """
+        self._operations = []
+        if network is not None:
+            network.attach(self)
+
+    @property
+    def operations(self) -> List[Operation]:
+        return self._operations
+
+    def on_operation(self, name: str, args: Tuple[Any, ...], kwargs: Dict[str, Any], result: Any) -> None:
+        if name == 'add_production':
+            args = (args[0], result)
+        self._operations.append(Operation(name, args, kwargs))
+
+    def replay(self, network: Any) -> None:
+        """ Apply the recorded operations, in order, to the given network.
+
+        WMEs are copied, with their timestamp, so that the same recording can be replayed on many networks.
+
+        :param network: the network to apply the operations to
+        """
+        wmes = {}
+        productions = {}
+        for name, args, kwargs in self._operations:
+            if name == 'add_wme':
+                wme = wmes[id(args[0])] = WME(args[0].identifier, args[0].attribute, args[0].value,
+                                              timestamp=args[0].timestamp)
+                network.add_wme(wme, **kwargs)
+            elif name == 'remove_wme' and id(args[0]) in wmes:
+                network.remove_wme(wmes.pop(id(args[0])))
+            elif name == 'add_production':
+                productions[id(args[1])] = network.add_production(args[0], **kwargs)
+            elif name == 'remove_production' and id(args[0]) in productions:
+                network.remove_production(productions[id(args[0])])
+
+    def dump(self, file: IO[str]) -> None:
+        """ Write the recorded operations to the given file, one JSON object per line.
+
+        The removals of WMEs and productions added before the recording started are skipped, as they cannot be replayed.
+
+        :param file: the file to write to
+        """
+        refs = {}
+        lines = 0
+        for name, args, kwargs in self._operations:
+            if name == 'add_wme':
+                refs[id(args[0])] = lines
+                record = {'op': name, 'wme': [args[0].identifier, args[0].attribute, args[0].value]}
+                if args[0].timestamp is not None:
+                    record['timestamp'] = args[0].timestamp
+                record.update(kwargs)
+            elif name == 'add_production':
+                refs[id(args[1])] = lines
+                record = {'op': name, 'xml': dump_xml([(args[0], kwargs)])}
+            elif id(args[0]) in refs:
+                record = {'op': name, 'ref': refs[id(args[0])]}
+            else:
+                continue
+            file.write(json.dumps(record) + '\n')
+            lines += 1
+
+    @classmethod
+    def load(cls, file: IO[str]) -> 'Recorder':
+        """ Read the operations written by `dump` from the given file.
+
+        :param file: the file to read from
+        :return: a recorder holding the operations read
+        """
+        recorder = cls()
+        targets = []
+        for line in file:
+            record = json.loads(line)
+            name = record['op']
+            if name == 'add_wme':
+                target = WME(*record['wme'], timestamp=record.get('timestamp'))
+                args = (target,)
+                kwargs = {'ttl': record['ttl']} if 'ttl' in record else {}
+            elif name == 'add_production':
+                lhs, kwargs = parse_xml(record['xml'])[0]
+                target = object()
+                args = (lhs, target)
+            else:
+                target = None
+                args = (targets[record['ref']],)
+                kwargs = {}
+            targets.append(target)
+            recorder.operations.append(Operation(name, args, kwargs))
+
+        return recorder
@@ -0,0 +1,17 @@
+def matches(production, *variables):
+    """ Return the values bound to the given variables by every match of the given production, sorted.
+
+    :type production: ProductionNode
+    :type variables: str
+    :rtype: list of tuple
+    """
+    return sorted(tuple(m.get_binding(v) for v in variables) for m in production.memory)
+
+
+def bindings(tokens):
+    """ Return all the bindings of every given token, sorted, to compare matches whatever their variables.
+
+    :type tokens: list of Token
+    :rtype: list of tuple
+    """
+    return sorted(tuple(sorted(m.all_binding().items())) for m in tokens)
@@ -0,0 +1,151 @@
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Aggregate
+from rete import Filter
+from rete import Has
+from rete import Rule
+from rete.aggregates import AGGREGATORS
+from rete.common import dump_xml
+from rete.common import parse_xml
+from rete.common import WME
+from rete.network import create_network
+from rete.network import Network
+
+from helpers import matches
+
+
+class TestAggregators(TestCase):
+
+    def test__incremental(self):
+        for function, exp in [
+            ('count', [1, 2, 3, 2, 1]),
+            ('sum', [5, 7, 16, 11, 9]),
+            ('min', ['5', '2', '2', '2', '9']),
+            ('max', ['5', '5', '9', '9', '9']),
+            ('collect', [('5',), ('5', '2'), ('5', '2', '9'), ('2', '9'), ('9',)]),
+        ]:
+            with self.subTest(function=function):
+                aggregator = AGGREGATORS[function]()
+                result = []
+                for add, key, value in [(True, 1, '5'), (True, 2, '2'), (True, 3, '9'), (False, 1, '5'),
+                                        (False, 2, '2')]:
+                    (aggregator.add if add else aggregator.remove)(key, value)
+                    result.append(aggregator.value)
+
+                assert_that(result, function).is_equal_to(exp)
+
+    def test__compaction(self):
+        aggregator = AGGREGATORS['max']()
+        for key in range(1000):
+            aggregator.add(key, key)
+        for key in range(999):
+            aggregator.remove(key, key)
+
+        assert_that(aggregator.value, 'compaction').is_equal_to(999)
+        assert_that(len(aggregator._heap), 'compaction').is_less_than(100)
+
+
+class TestAggregate(TestCase):
+
+    def test__count(self):
+        rule = Rule(Has('$u', 'is-a', 'user'), Aggregate('count', '$n', Has('$u', 'login', 'failed'),
+                                                         Has('$u', 'from', '$ip')), Filter('$n > 1'))
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                network = create_network(engine)
+                production = network.add_production(rule)
+                failed = WME('ann', 'login', 'failed')
+                for wme in [WME('ann', 'is-a', 'user'), WME('bob', 'is-a', 'user'), failed, WME('ann', 'from', 'h1'),
+                            WME('ann', 'from', 'h2'), WME('bob', 'login', 'failed'), WME('bob', 'from', 'h1')]:
+                    network.add_wme(wme)
+
+                assert_that(matches(production, '$u', '$n'), engine).is_equal_to([('ann', 2)])
+
+                network.add_wme(WME('bob', 'from', 'h3'))
+                network.add_wme(WME('ann', 'from', 'h3'))
+                assert_that(matches(production, '$u', '$n'), engine).is_equal_to([('ann', 3), ('bob', 2)])
+
+                network.remove_wme(failed)
+                assert_that(matches(production, '$u', '$n'), engine).is_equal_to([('bob', 2)])
+
+    def test__existing_wmes(self):
+        rule = Rule(Has('$u', 'is-a', 'user'), Aggregate('count', '$c', Has('$u', 'score', '$s')))
+        shared = Rule(Has('$u', 'is-a', 'user'), Aggregate('count', '$c', Has('$u', 'score', '$s')),
+                      Filter('$c > 0'))
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                network = create_network(engine)
+                network.add_wme(WME('u1', 'is-a', 'user'))
+                network.add_wme(WME('u1', 'score', 9))
+                first = network.add_production(rule)
+                second = network.add_production(shared)
+
+                assert_that(matches(first, '$u', '$c'), engine).is_equal_to([('u1', 1)])
+                assert_that(matches(second, '$u', '$c'), engine).is_equal_to([('u1', 1)])
+
+    def test__join_on_value(self):
+        # the users with the best score of their team
+        rule = Rule(Has('$t', 'is-a', 'team'),
+                    Aggregate('max', '$best', Has('$p', 'member', '$t'), Has('$p', 'score', '$s'), of='$s'),
+                    Has('$w', 'score', '$best'), Has('$w', 'member', '$t'))
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                network = create_network(engine)
+                production = network.add_production(rule)
+                best = WME('bob', 'score', '10')
+                for wme in [WME('red', 'is-a', 'team'), WME('ann', 'member', 'red'), WME('ann', 'score', '7'),
+                            WME('bob', 'member', 'red'), best]:
+                    network.add_wme(wme)
+
+                assert_that(matches(production, '$t', '$w'), engine).is_equal_to([('red', 'bob')])
+
+                network.remove_wme(best)
+                assert_that(matches(production, '$t', '$w'), engine).is_equal_to([('red', 'ann')])
+
+    def test__events(self):
+        network = Network()
+        production = network.add_production(Rule(
+            Has('$u', 'is-a', 'user'), Aggregate('min', '$first', Has('$u', 'login', '$t'), of='$t')))
+        events = []
+        production.subscribe(events.append)
+        network.add_wme(WME('ann', 'is-a', 'user'))
+        for t in ['10', '5', '7']:
+            network.add_wme(WME('ann', 'login', t))
+
+        assert_that([(e.kind, e.binding['$first']) for e in events], 'events').is_equal_to(
+            [('added', '10'), ('removed', '10'), ('added', '5')])
+
+    def test__delete_group(self):
+        network = Network()
+        production = network.add_production(Rule(
+            Has('$p', 'age', '$a'), Aggregate('count', '$n', Has('$d', 'owner', '$p'))))
+        events = []
+        production.subscribe(events.append)
+        age = WME('p1', 'age', '30')
+        network.add_wme(age)
+        owners = [WME(f'd{i}', 'owner', 'p1') for i in range(3)]
+        for wme in owners:
+            network.add_wme(wme)
+        events.clear()
+
+        network.remove_wme(owners[0])
+        assert_that([(e.kind, e.binding['$n']) for e in events], 'owner').is_equal_to([('removed', 3), ('added', 2)])
+        events.clear()
+
+        network.remove_wme(age)
+        assert_that([(e.kind, e.binding['$n']) for e in events], 'group').is_equal_to([('removed', 2)])
+        assert_that(production.memory, 'group').is_empty()
+
+    def test__invalid(self):
+        assert_that(Aggregate).raises(ValueError).when_called_with('median', '$m', Has('$x', 'a', '$v'), of='$v')
+        assert_that(Aggregate).raises(ValueError).when_called_with('sum', '$m', Has('$x', 'a', '$v'))
+        assert_that(Network().add_production).raises(ValueError).when_called_with(
+            Rule(Aggregate('count', '$n', Has('$x', 'a', '$v'))))
+
+    def test__xml(self):
+        rule = Rule(Has('$t', 'is-a', 'team'), Aggregate('sum', '$total', Has('$p', 'score', '$s'), of='$s'))
+        lhs, _ = parse_xml(dump_xml([(rule, {})]))[0]
+
+        assert_that(lhs, 'xml').is_equal_to(rule)
@@ -0,0 +1,100 @@
+from unittest import skipIf
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Bind
+from rete import Exists
+from rete import Filter
+from rete import Has
+from rete import Ncc
+from rete import Neg
+from rete import Rule
+from rete.columnar import ColumnarMemory
+from rete.columnar import np
+from rete.common import WME
+from rete.network import Network
+from rete.workload import Generator
+
+WMES = [
+    WME('B1', 'on', 'B2'),
+    WME('B1', 'on', 'B3'),
+    WME('B1', 'color', 'red'),
+    WME('B2', 'on', 'table'),
+    WME('B2', 'left-of', 'B3'),
+    WME('B2', 'color', 'blue'),
+    WME('B3', 'left-of', 'B4'),
+    WME('B3', 'on', 'table'),
+    WME('B3', 'color', 'red'),
+    WME('B1', 'self', 'B1'),
+]
+
+
+def normalize(solutions):
+    return sorted(sorted(s.items()) for s in solutions)
+
+
+@skipIf(np is None, 'numpy is not installed')
+class TestColumnarMemory(TestCase):
+
+    def memory(self):
+        memory = ColumnarMemory(capacity=4)
+        memory.extend(WMES)
+
+        return memory
+
+    def test__solutions(self):
+        network = Network()
+        for wme in WMES:
+            network.add_wme(WME(wme.identifier, wme.attribute, wme.value))
+        memory = self.memory()
+        for i, rule in enumerate([
+            Rule(Has('$x', 'on', '$y'), Has('$y', 'left-of', '$z'), Has('$z', 'color', 'red')),
+            Rule(Has('$x', 'on', '$y'), Has('$y', 'left-of', '$z'), Neg('$z', 'color', 'red')),
+            Rule(Has('$x', 'self', '$x'), Has('$x', 'color', '$c')),
+            Rule(Has('$x', 'on', '$y'), Has('$x', 'color', '$c'), Has('$y', '$a', '$c')),
+            Rule(Has('$x', 'on', '$y'), Has('$z', 'left-of', '$w')),
+            Rule(Has('$x', 'on', '$y'), Neg('$x', 'unknown', '$w')),
+            Rule(Has('$x', 'on', '$y'), Neg('$w', 'self', '$w')),
+            Rule(Has('$x', 'on', '$y'), Exists('$y', 'left-of', '$z')),
+            Rule(Has('$x', 'on', '$y'), Exists('$w', 'unknown', '$w')),
+            Rule(Has('$x', 'on', '$y'), Bind('len("$y")', '$n'), Filter('$n > 2')),
+        ]):
+            with self.subTest(i=i, rule=rule):
+                result = normalize(memory.solutions(rule))
+
+                assert_that(result, 'solutions').is_equal_to(normalize(network.query(rule)))
+
+    def test__support(self):
+        memory = self.memory()
+
+        result = memory.match(Rule(Has('$x', 'on', '$y'), Has('$y', 'left-of', '$z'), Has('$z', 'color', 'red')))
+
+        assert_that([[memory.wmes[r] for r in row] for row in result.support.tolist()], 'support').is_equal_to(
+            [[WMES[0], WMES[4], WMES[8]]])
+
+    def test__remove(self):
+        memory = self.memory()
+        rule = Rule(Has('$x', 'on', '$y'))
+
+        for wme in WMES[:6]:
+            memory.remove(wme)
+
+        assert_that(len(memory), 'remove').is_equal_to(4)
+        assert_that(normalize(memory.solutions(rule)), 'remove').is_equal_to(
+            normalize([{'$x': 'B3', '$y': 'table'}]))
+
+    def test__workload(self):
+        generator = Generator(rules=8, conditions=3, selectivity=0.2, negations=0.5, wmes=300, seed=5)
+        network = Network()
+        memory = ColumnarMemory()
+        for op in generator.operations():
+            network.add_wme(op.args[0])
+            if op.args[0].amems:
+                memory.append(op.args[0])
+
+        for rule in generator.rules():
+            assert_that(memory.count(rule), 'workload').is_equal_to(len(list(network.query(rule))))
+
+    def test__unsupported(self):
+        assert_that(self.memory().match).raises(ValueError).when_called_with(Rule(Ncc(Has('$x', 'on', '$y'))))
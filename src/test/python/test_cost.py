@@ -0,0 +1,138 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Aggregate
+from rete import Filter
+from rete import Has
+from rete import Ncc
+from rete import Neg
+from rete import Rule
+from rete.common import WME
+from rete.network import create_network
+from rete.nodes import AggregatePartnerNode
+from rete.nodes import JoinNode
+from rete.nodes import NccPartnerNode
+from rete.snapshots import dump
+from rete.snapshots import load
+from rete.stats import owned
+from rete.trace import label
+from rete.trace import Tracer
+
+
+class TestCost(TestCase):
+
+    def setUp(self):
+        self.network = create_network()
+        self.red = self.network.add_production(Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red')), name='red')
+        self.heavy = self.network.add_production(
+            Rule(Has('$x', 'on', '$y'), Has('$y', 'weight', '$w'), Filter('"$x" != "B0" and $w > 5')), name='heavy')
+        self.free = self.network.add_production(Rule(Has('$x', 'on', '$y'), Neg('$y', 'on', '$z')), name='free')
+
+    def play(self, count=10):
+        for i in range(count):
+            self.network.add_wme(WME(f'B{i}', 'on', 'T'))
+            self.network.add_wme(WME(f'C{i}', 'on', f'B{i}'))
+            self.network.add_wme(WME(f'B{i}', 'weight', str(i)))
+        self.color = WME('T', 'color', 'red')
+        self.network.add_wme(self.color)
+
+    def test__shared(self):
+        self.play()
+        report = self.network.cost_report()
+        costs = {c.production.name: c for c in report.by_cpu}
+
+        nodes = {id(n): n for p in self.network.rules for n in owned(p)}.values()
+        for field in ('tested', 'created'):
+            with self.subTest(field=field):
+                total = sum(getattr(n, field, 0) for n in nodes)
+                assert_that(sum(getattr(c, field) for c in costs.values()), field).is_close_to(total, 1e-9)
+        assert_that(costs['heavy'].evaluations, 'evaluations').is_equal_to(10)
+        assert_that(costs['red'].evaluations, 'evaluations').is_zero()
+
+        # the three productions share the join of their first condition
+        first = next(n for n in owned(self.red) if isinstance(n, JoinNode))
+        assert_that(first.tested, 'shared').is_equal_to(20)
+        assert_that(costs['red'].tested, 'shared').is_greater_than_or_equal_to(20 / 3)
+
+    def test__ranking(self):
+        self.play()
+        report = self.network.cost_report()
+
+        assert_that([c.work for c in report.by_cpu], 'cpu').is_sorted(reverse=True)
+        assert_that([c.held for c in report.by_memory], 'memory').is_sorted(reverse=True)
+        assert_that(report.by_memory[0].production, 'memory').is_not_equal_to(self.red)
+        assert_that({c.production for c in report.by_cpu}, 'cpu').is_equal_to(set(self.network.rules))
+
+    def test__held(self):
+        self.play()
+        before = {c.production: c.held for c in self.network.cost_report().by_memory}
+        self.network.remove_wme(self.color)
+        after = {c.production: c.held for c in self.network.cost_report().by_memory}
+
+        assert_that(before[self.red] - after[self.red], 'held').is_close_to(10, 1e-9)
+        assert_that(after[self.heavy], 'held').is_equal_to(before[self.heavy])
+
+    def test__traced(self):
+        tracer = Tracer(self.network, rate=1.0)
+        self.play()
+        report = self.network.cost_report(tracer)
+
+        assert_that([c.time for c in report.by_cpu], 'time').is_sorted(reverse=True)
+        assert_that(report.by_cpu[-1].time, 'time').is_positive()
+        # all the time is attributed, but that of the alpha memory of every WME, which no production uses
+        root = label(self.network.alpha_root.amem)
+        spent = sum(t for node, t in tracer.exclusive().items() if node != root)
+        assert_that(sum(c.time for c in report.by_cpu), 'time').is_close_to(spent, 1e-9)
+
+    def test__partners(self):
+        production = self.network.add_production(Rule(
+            Has('$x', 'on', '$y'), Ncc(Has('$y', 'color', '$c'), Has('$c', 'shade', 'dark')),
+            Aggregate('count', '$n', Has('$z', 'on', '$x'))), name='partners')
+        self.play()
+        partners = [n for n in owned(production) if isinstance(n, (NccPartnerNode, AggregatePartnerNode))]
+
+        assert_that(partners, 'partners').is_length(2)
+        assert_that(sum(n.created for n in partners if isinstance(n, AggregatePartnerNode)), 'partners').is_positive()
+
+    def test__speculative(self):
+        self.play()
+        before = [(c.production, c.work) for c in self.network.cost_report().by_cpu]
+        fork = self.network.fork()
+        for i in range(10):
+            fork.add_wme(WME(f'D{i}', 'on', 'T'))
+        with self.assertRaises(RuntimeError):
+            with self.network.transaction():
+                self.network.add_wme(WME('E', 'on', 'T'))
+                raise RuntimeError('rhs failed')
+
+        assert_that([(c.production, c.work) for c in self.network.cost_report().by_cpu], 'speculative').is_equal_to(
+            before)
+        with self.network.transaction():
+            self.network.add_wme(WME('E', 'on', 'T'))
+        assert_that(self.network.cost_report().by_cpu[0].work, 'committed').is_greater_than(before[0][1])
+
+    def test__snapshot(self):
+        self.play()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'snapshot')
+            dump(self.network, path)
+            restored = create_network()
+            for production in self.network.rules:
+                restored.add_production(self.network.rules[production][0], name=production.name)
+            load(restored, path)
+
+        assert_that([(c.production.name, c.created) for c in restored.cost_report().by_cpu], 'snapshot').is_equal_to(
+            [(c.production.name, c.created) for c in self.network.cost_report().by_cpu])
+
+    def test__treat(self):
+        network = create_network('treat')
+        production = network.add_production(Rule(Has('$x', 'on', '$y')), name='on')
+        network.add_wme(WME('B1', 'on', 'B2'))
+        network.add_wme(WME('B2', 'on', 'B3'))
+
+        report = network.cost_report()
+        assert_that([(c.production, c.held, c.work) for c in report.by_memory], 'treat').is_equal_to(
+            [(production, 2, 0)])
@@ -0,0 +1,80 @@
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Has
+from rete import Neg
+from rete import Rule
+from rete.common import WME
+from rete.events import ADDED
+from rete.events import REMOVED
+from rete.network import Network
+
+
+class TestListeners(TestCase):
+
+    def setUp(self):
+        self.network = Network()
+        self.production = self.network.add_production(Rule(
+            Has('$x', 'on', '$y'), Has('$y', 'left-of', '$z'), Neg('$z', 'color', 'red')))
+        self.events = []
+        self.production.subscribe(self.events.append)
+
+    def summary(self):
+        return [(e.kind, e.binding) for e in self.events]
+
+    def test__synchronous(self):
+        wmes = [WME('B1', 'on', 'B2'), WME('B2', 'left-of', 'B3'), WME('B3', 'color', 'red')]
+
+        self.network.add_wme(wmes[0])
+        assert_that(self.events, 'sync').is_empty()
+        self.network.add_wme(wmes[1])
+        assert_that(self.summary(), 'sync').is_equal_to([(ADDED, {'$x': 'B1', '$y': 'B2', '$z': 'B3'})])
+        self.network.add_wme(wmes[2])
+        assert_that(self.summary()[1:], 'sync').is_equal_to([(REMOVED, {'$x': 'B1', '$y': 'B2', '$z': 'B3'})])
+        assert_that(self.events[1].token, 'sync').is_same_as(self.events[0].token)
+        assert_that(self.events[1].production, 'sync').is_same_as(self.production)
+
+    def test__remove_wme(self):
+        wmes = [WME('B1', 'on', 'B2'), WME('B2', 'left-of', 'B3'), WME('B2', 'left-of', 'B4')]
+        for wme in wmes:
+            self.network.add_wme(wme)
+
+        self.network.remove_wme(wmes[0])
+
+        assert_that([kind for kind, _ in self.summary()], 'remove').is_equal_to([ADDED, ADDED, REMOVED, REMOVED])
+        assert_that(self.production.memory, 'remove').is_empty()
+
+    def test__batch(self):
+        with self.network.batch():
+            self.network.add_wme(WME('B1', 'on', 'B2'))
+            self.network.add_wme(WME('B2', 'left-of', 'B3'))
+            with self.network.batch():
+                self.network.add_wme(WME('B2', 'left-of', 'B4'))
+            self.network.add_wme(WME('B4', 'color', 'red'))
+            assert_that(self.events, 'batch').is_empty()
+
+        assert_that(self.summary(), 'batch').is_equal_to([(ADDED, {'$x': 'B1', '$y': 'B2', '$z': 'B3'})])
+
+    def test__unsubscribe(self):
+        self.production.unsubscribe(self.events.append)
+
+        self.network.add_wme(WME('B1', 'on', 'B2'))
+        self.network.add_wme(WME('B2', 'left-of', 'B3'))
+
+        assert_that(self.events, 'unsubscribe').is_empty()
+        assert_that(self.production.memory, 'unsubscribe').is_length(1)
+
+    def test__batch_error(self):
+        def fail(event):
+            raise RuntimeError(event.binding['$z'])
+
+        self.production.subscribe(fail)
+        with self.assertRaises(RuntimeError) as raised:
+            with self.network.batch():
+                self.network.add_wme(WME('B1', 'on', 'B2'))
+                self.network.add_wme(WME('B2', 'left-of', 'B3'))
+                self.network.add_wme(WME('B2', 'left-of', 'B4'))
+
+        assert_that(str(raised.exception), 'error').is_equal_to('B3')
+        assert_that([e.binding['$z'] for e in self.events], 'error').is_equal_to(['B3', 'B4'])
@@ -0,0 +1,93 @@
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Exists
+from rete import Has
+from rete import Neg
+from rete import Rule
+from rete.common import dump_xml
+from rete.common import parse_xml
+from rete.common import WME
+from rete.network import create_network
+from rete.network import Network
+from rete.nodes import ExistsNode
+
+
+class TestExists(TestCase):
+
+    def setUp(self):
+        # the users having at least a failed login
+        self.rule = Rule(Has('$u', 'is-a', 'user'), Exists('$u', 'login', 'failed'))
+
+    @staticmethod
+    def users(production):
+        return sorted(m.get_binding('$u') for m in production.memory)
+
+    def test__exists(self):
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                network = create_network(engine)
+                production = network.add_production(self.rule)
+                first = WME('ann', 'login', 'failed')
+                network.add_wme(WME('ann', 'is-a', 'user'))
+                network.add_wme(WME('bob', 'is-a', 'user'))
+                assert_that(self.users(production), engine).is_empty()
+
+                network.add_wme(first)
+                network.add_wme(WME('bob', 'login', 'failed'))
+                assert_that(self.users(production), engine).is_equal_to(['ann', 'bob'])
+
+                network.remove_wme(first)
+                assert_that(self.users(production), engine).is_equal_to(['bob'])
+
+    def test__counting(self):
+        network = Network()
+        production = network.add_production(Rule(Has('$u', 'is-a', 'user'), Exists('$u', 'login', '$how')))
+        node = production.parent
+        events = []
+        production.subscribe(events.append)
+        wmes = [WME('ann', 'login', 'failed'), WME('ann', 'login', 'ok'), WME('ann', 'login', 'locked')]
+        network.add_wme(WME('ann', 'is-a', 'user'))
+        for wme in wmes:
+            network.add_wme(wme)
+
+        assert_that(node, 'counting').is_instance_of(ExistsNode)
+        assert_that(node.count(node.memory[0]), 'counting').is_equal_to(3)
+        assert_that(production.memory, 'counting').is_length(1)
+        assert_that([e.kind for e in events], 'counting').is_equal_to(['added'])
+
+        for wme in wmes:
+            network.remove_wme(wme)
+
+        assert_that(node.count(node.memory[0]), 'counting').is_zero()
+        assert_that([e.kind for e in events], 'counting').is_equal_to(['added', 'removed'])
+
+    def test__existing_wmes(self):
+        network = Network()
+        network.add_wme(WME('ann', 'is-a', 'user'))
+        network.add_wme(WME('ann', 'login', 'failed'))
+        network.add_wme(WME('bob', 'is-a', 'user'))
+        production = network.add_production(self.rule)
+
+        assert_that(self.users(production), 'existing').is_equal_to(['ann'])
+
+    def test__negation(self):
+        network = Network()
+        production = network.add_production(Rule(Has('$u', 'is-a', 'user'), Neg('$u', 'login', '$how')))
+        blockers = [WME('ann', 'login', 'failed'), WME('ann', 'login', 'ok')]
+        network.add_wme(WME('ann', 'is-a', 'user'))
+        for wme in blockers:
+            network.add_wme(wme)
+
+        network.remove_wme(blockers[0])
+        assert_that(self.users(production), 'negation').is_empty()
+
+        network.remove_wme(blockers[1])
+        assert_that(self.users(production), 'negation').is_equal_to(['ann'])
+
+    def test__xml(self):
+        lhs, _ = parse_xml(dump_xml([(self.rule, {})]))[0]
+
+        assert_that(lhs, 'xml').is_equal_to(self.rule)
+        assert_that(lhs[1], 'xml').is_instance_of(Exists)
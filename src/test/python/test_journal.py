@@ -0,0 +1,226 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Has
+from rete import Neg
+from rete import OneOf
+from rete import Prefix
+from rete import Range
+from rete import Rule
+from rete.common import WME
+from rete.journal import Journal
+from rete.journal import JOURNAL
+from rete.journal import SNAPSHOT
+from rete.network import create_network
+from rete.predicates import Predicate
+from rete.timers import ManualClock
+from rete.workload import Generator
+
+
+class Even(Predicate):
+
+    def key(self):
+        return ()
+
+    def test(self, value):
+        return value.isdigit() and int(value) % 2 == 0
+
+
+class TestJournal(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @staticmethod
+    def matches(network):
+        return sorted((p.name, tuple(sorted(t.all_binding().items()))) for p in network.rules for t in p.memory)
+
+    @staticmethod
+    def play(network, snapshot=None):
+        generator = Generator(rules=4, conditions=2, selectivity=0.2, wmes=300, removals=0.3)
+        productions = [network.add_production(rule, **kwargs) for rule, kwargs in generator.productions()]
+        alive = {}  # a WME equal to one in working memory would be removed in its place, so it is skipped
+        for i, op in enumerate(generator.operations()):
+            wme = op.args[0]
+            fact = (wme.identifier, wme.attribute, wme.value)
+            if op.name == 'add_wme' and fact not in alive:
+                alive[fact] = wme
+                network.add_wme(wme)
+            elif op.name == 'remove_wme' and alive.get(fact) is wme:
+                del alive[fact]
+                network.remove_wme(wme)
+            if snapshot is not None and i == 200:
+                snapshot()
+        network.remove_production(productions[1])
+
+    def test__recover(self):
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                directory = os.path.join(self.directory, engine)
+                network = create_network(engine)
+                with Journal(network, directory, sync_every=16):
+                    self.play(network)
+
+                recovered = create_network(engine)
+                journal = Journal(recovered, directory)
+                journal.close()
+
+                assert_that(self.matches(recovered), engine).is_equal_to(self.matches(network))
+                assert_that(journal.recovered, engine).is_equal_to(journal.sequence)
+
+    def test__snapshot(self):
+        network = create_network()
+        journal = Journal(network, self.directory)
+        self.play(network, journal.snapshot)
+        journal.close()
+        size = os.path.getsize(os.path.join(self.directory, JOURNAL))
+
+        recovered = create_network()
+        with Journal(recovered, self.directory) as resumed:
+            assert_that(self.matches(recovered), 'snapshot').is_equal_to(self.matches(network))
+            assert_that(resumed.sequence, 'snapshot').is_equal_to(journal.sequence)
+            recovered.add_wme(WME('s0', 'a0', 's1'))
+            network.add_wme(WME('s0', 'a0', 's1'))
+        assert_that(os.path.getsize(os.path.join(self.directory, JOURNAL)), 'tail').is_greater_than(size)
+
+        again = create_network()
+        Journal(again, self.directory).close()
+        assert_that(self.matches(again), 'resumed').is_equal_to(self.matches(network))
+
+    def test__periodic_snapshot(self):
+        network = create_network()
+        with Journal(network, self.directory, snapshot_every=50) as journal:
+            self.play(network)
+
+        assert_that(os.path.exists(os.path.join(self.directory, SNAPSHOT)), 'snapshot').is_true()
+        recovered = create_network()
+        with Journal(recovered, self.directory) as resumed:
+            assert_that(resumed.recovered, 'tail').is_less_than(journal.sequence)
+        assert_that(self.matches(recovered), 'snapshot').is_equal_to(self.matches(network))
+
+    def test__group_commit(self):
+        network = create_network()
+        path = os.path.join(self.directory, JOURNAL)
+        with Journal(network, self.directory, sync_every=3) as journal:
+            network.add_wme(WME('B1', 'on', 'B2'))
+            network.add_wme(WME('B2', 'on', 'table'))
+
+            assert_that(journal.pending, 'buffered').is_equal_to(2)
+            assert_that(os.path.getsize(path), 'buffered').is_zero()
+
+            network.add_wme(WME('B3', 'on', 'table'))
+            assert_that(journal.pending, 'synced').is_zero()
+            assert_that(os.path.getsize(path), 'synced').is_positive()
+
+    def test__torn_tail(self):
+        network = create_network()
+        network.add_production(Rule(Has('$x', 'on', '$y'), Neg('$y', 'color', 'red')), name='p')
+        with Journal(network, self.directory, sync_every=1):
+            network.add_wme(WME('B1', 'on', 'B2'))
+            network.add_wme(WME('B3', 'on', 'B4'))
+            network.add_wme(WME('B2', 'color', 'red'))
+        path = os.path.join(self.directory, JOURNAL)
+        with open(path, 'rb+') as file:
+            file.truncate(os.path.getsize(path) - 3)
+
+        recovered = create_network()
+        recovered.add_production(Rule(Has('$x', 'on', '$y'), Neg('$y', 'color', 'red')), name='p')
+        with Journal(recovered, self.directory) as journal:
+            assert_that(journal.recovered, 'torn').is_equal_to(2)
+            assert_that(self.matches(recovered), 'torn').is_length(2)
+            recovered.add_wme(WME('B2', 'color', 'red'))
+
+        again = create_network()
+        again.add_production(Rule(Has('$x', 'on', '$y'), Neg('$y', 'color', 'red')), name='p')
+        Journal(again, self.directory).close()
+        assert_that(self.matches(again), 'repaired').is_equal_to(self.matches(network))
+        assert_that(self.matches(network), 'repaired').is_equal_to([('p', (('$x', 'B3'), ('$y', 'B4')))])
+
+    def test__predicates(self):
+        rule = Rule(Has('$x', 'age', Range(18, 65, high_closed=False)), Has('$x', 'city', Prefix('San ')),
+                    Neg('$x', 'role', OneOf('guest', 'banned')))
+        network = create_network()
+        with Journal(network, self.directory):
+            network.add_production(rule, name='p')
+            for name, age, city, role in [('ann', '30', 'San Diego', 'admin'), ('bob', '65', 'San Jose', 'owner'),
+                                          ('eve', '50', 'San Marino', 'guest')]:
+                network.add_wme(WME(name, 'age', age))
+                network.add_wme(WME(name, 'city', city))
+                network.add_wme(WME(name, 'role', role))
+
+        recovered = create_network()
+        Journal(recovered, self.directory).close()
+        assert_that([lhs for lhs, _ in recovered.rules.values()], 'predicates').is_equal_to([rule])
+        assert_that(self.matches(recovered), 'predicates').is_equal_to([('p', (('$x', 'ann'),))])
+
+    def test__unserializable(self):
+        network = create_network()
+        with Journal(network, self.directory):
+            with self.assertRaises(TypeError):
+                network.add_production(Rule(Has('$x', 'age', Even())))
+
+            assert_that(network.rules, 'refused').is_empty()
+
+    def test__duplicate(self):
+        network = create_network()
+        with Journal(network, self.directory):
+            wme = WME('B1', 'on', 'B2')
+            network.add_wme(wme)
+            network.add_wme(wme)
+            network.remove_wme(wme)
+
+        recovered = create_network()
+        Journal(recovered, self.directory).close()
+        assert_that(recovered.alpha_root.amem.memory, 'duplicate').is_empty()
+
+    def test__typed_fields(self):
+        values = [5, 2.5, True, False, None, '5', 'ünï', (1, 'a')]
+        network = create_network()
+        with Journal(network, self.directory):
+            for i, value in enumerate(values):
+                network.add_wme(WME(f'w{i}', 'value', value))
+            network.add_wme(WME('age', 7, 'n'))
+
+        recovered = create_network()
+        Journal(recovered, self.directory).close()
+        result = [(w.identifier, w.attribute, w.value) for w in recovered.alpha_root.amem.memory]
+
+        assert_that([w[2] for w in result[:-1]], 'typed').is_equal_to(values)
+        assert_that([type(w[2]) for w in result[:-1]], 'typed').is_equal_to([type(v) for v in values])
+        assert_that(result[-1], 'typed').is_equal_to(('age', 7, 'n'))
+
+    def test__typed_join(self):
+        rule = Rule(Has('$x', 'age', '$a'), Has('$y', 'limit', '$a'))
+        network = create_network()
+        with Journal(network, self.directory):
+            network.add_production(rule)
+            network.add_wme(WME('ann', 'age', 5))
+
+        recovered = create_network()
+        Journal(recovered, self.directory).close()
+        recovered.add_wme(WME('lim', 'limit', 5))
+
+        assert_that(list(recovered.rules)[0].memory, 'typed').is_length(1)
+
+    def test__ttl(self):
+        network = create_network()
+        with Journal(network, self.directory) as journal:
+            network.add_wme(WME('B1', 'on', 'B2'), ttl=5)
+            network.add_wme(WME('B2', 'on', 'B3'))
+            journal.snapshot()
+            network.add_wme(WME('B3', 'on', 'B4'), ttl=5)
+
+        clock = ManualClock()
+        recovered = create_network(clock=clock)
+        Journal(recovered, self.directory).close()
+        clock.advance(10)
+
+        assert_that(recovered.advance_clock(), 'ttl').contains_only(WME('B1', 'on', 'B2'), WME('B3', 'on', 'B4'))
+        assert_that(recovered.alpha_root.amem.memory, 'ttl').is_equal_to([WME('B2', 'on', 'B3')])
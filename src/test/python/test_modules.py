@@ -0,0 +1,109 @@
+import random
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Filter
+from rete import Has
+from rete import Ncc
+from rete import Neg
+from rete import Rule
+from rete.common import WME
+from rete.network import Network
+
+from helpers import bindings
+
+
+class TestModules(TestCase):
+
+    def test__focus_stack(self):
+        network = Network()
+
+        assert_that(network.focused, 'focus').is_equal_to('MAIN')
+
+        network.focus('a')
+        network.focus('b')
+        assert_that(network.focus_stack, 'focus').is_equal_to(['MAIN', 'a', 'b'])
+        assert_that(network.pop_focus(), 'focus').is_equal_to('b')
+        assert_that(network.focused, 'focus').is_equal_to('a')
+
+    def test__unlinked(self):
+        network = Network()
+        shared = Has('$x', 'type', 'car')
+        first = network.add_production(Rule(shared, Has('$x', 'owner', '$p')), module='a')
+        second = network.add_production(Rule(shared, Has('$x', 'color', '$c')), module='b')
+        network.focus('a')
+        for i in range(10):
+            network.add_wme(WME(f'c{i}', 'type', 'car'))
+            network.add_wme(WME(f'c{i}', 'owner', 'ann'))
+            network.add_wme(WME(f'c{i}', 'color', 'red'))
+
+        assert_that(first.memory, 'unlinked').is_length(10)
+        assert_that(second.memory, 'unlinked').is_empty()
+        assert_that(second.parent.activations, 'unlinked').is_zero()
+        assert_that(first.parent.parent.parent.activations, 'unlinked').is_equal_to(10)
+
+        network.focus('b')
+        assert_that(second.memory, 'unlinked').is_length(10)
+        assert_that(second.parent.activations, 'unlinked').is_equal_to(20)
+
+    @staticmethod
+    def facts(rnd):
+        result = []
+        for i in range(40):
+            result.append((f'c{i}', 'type', rnd.choice(['car', 'van'])))
+            result.append((f'c{i}', 'owner', f'p{rnd.randint(0, 7)}'))
+            result.append((f'c{i}', 'price', str(rnd.randint(0, 100))))
+            if rnd.random() < 0.3:
+                result.append((f'c{i}', 'stolen', 'yes'))
+        for i in range(8):
+            result.append((f'p{i}', 'age', str(rnd.randint(10, 90))))
+        rnd.shuffle(result)
+        return result
+
+    def test__same_matches(self):
+        rnd = random.Random(5)
+        rules = [
+            (Rule(Has('$c', 'type', 'car'), Has('$c', 'owner', '$p'), Has('$p', 'age', '$a')), 'a'),
+            (Rule(Has('$c', 'type', '$t'), Has('$c', 'owner', '$p'), Neg('$c', 'stolen', 'yes')), 'b'),
+            (Rule(Has('$c', 'type', 'car'), Has('$p', 'age', '$a'), Has('$c', 'owner', '$p')), 'b'),
+            (Rule(Has('$c', 'owner', '$p'), Ncc(Has('$p', 'age', '$a'), Filter('$a > 50'))), 'c'),
+            (Rule(Has('$p', 'age', '$a'), Has('$c', 'price', '$v'), Filter('$v < $a')), 'c'),
+            (Rule(Has('$c', 'type', 'car'), Has('$c', 'owner', '$p')), 'MAIN'),
+        ]
+        facts = self.facts(rnd)
+
+        networks = [Network(), Network()]  # the first one ignores the modules
+        modules = [['MAIN'] * len(rules), [m for _, m in rules]]
+        productions = [[n.add_production(r, module=m) for (r, _), m in zip(rules[:3], ms)]
+                       for n, ms in zip(networks, modules)]
+        alive = [[], []]
+        for step, fact in enumerate(facts):
+            if step == len(facts) // 2:
+                for network, found, ms in zip(networks, productions, modules):
+                    found.extend(network.add_production(r, module=m) for (r, _), m in zip(rules[3:], ms[3:]))
+            if step % 15 == 0:
+                networks[1].focus(rnd.choice(['a', 'b', 'c', 'MAIN']))
+            for network, wmes in zip(networks, alive):
+                wmes.append(WME(*fact))
+                network.add_wme(wmes[-1])
+            if step % 7 == 0:
+                victim = rnd.randrange(len(alive[0]))
+                for network, wmes in zip(networks, alive):
+                    network.remove_wme(wmes.pop(victim))
+        for module in ['a', 'b', 'c', 'MAIN']:
+            networks[1].focus(module)
+
+        for i, (exp, production) in enumerate(zip(*productions)):
+            with self.subTest(rule=i):
+                assert_that(bindings(production.memory), str(i)).is_equal_to(bindings(exp.memory))
+
+    def test__modules_not_shared(self):
+        network = Network()
+        rule = Rule(Has('$x', 'type', 'car'))
+        first = network.add_production(rule, module='a')
+        second = network.add_production(rule, module='b')
+
+        assert_that(second, 'shared').is_not_same_as(first)
+        assert_that(second.parent, 'shared').is_same_as(first.parent)
+        assert_that(network.add_production(rule, module='a'), 'shared').is_same_as(first)
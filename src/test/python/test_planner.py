@@ -0,0 +1,122 @@
+import random
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Aggregate
+from rete import Bind
+from rete import Filter
+from rete import Has
+from rete import Ncc
+from rete import Neg
+from rete import Rule
+from rete.common import WME
+from rete.network import Network
+from rete.planner import reorder
+
+from helpers import matches
+
+SIZES = {'type': 1000, 'owner': 100, 'name': 10, 'color': 50}
+
+
+def estimate(cond):
+    return SIZES[cond.attribute]
+
+
+class TestReorder(TestCase):
+
+    def test__selective_first(self):
+        rule = Rule(Has('$x', 'type', '$t'), Has('$x', 'owner', '$o'), Filter('$t != 1'), Has('$o', 'name', 'ann'))
+
+        assert_that(reorder(rule, estimate), 'selective').is_equal_to(Rule(
+            Has('$o', 'name', 'ann'), Has('$x', 'owner', '$o'), Has('$x', 'type', '$t'), Filter('$t != 1')))
+
+    def test__connected_first(self):
+        rule = Rule(Has('$x', 'owner', '$o'), Has('$y', 'color', '$c'), Has('$x', 'type', 'car'))
+
+        assert_that(reorder(rule, estimate), 'connected').is_equal_to(Rule(
+            Has('$y', 'color', '$c'), Has('$x', 'owner', '$o'), Has('$x', 'type', 'car')))
+
+    def test__filters_and_binds(self):
+        rule = Rule(Has('$x', 'type', '$t'), Has('$x', 'owner', '$o'), Bind('$o + 1', '$n'), Filter('$n > 2'),
+                    Filter('$t > 0'))
+
+        assert_that(reorder(rule, estimate), 'filters').is_equal_to(Rule(
+            Has('$x', 'owner', '$o'), Bind('$o + 1', '$n'), Filter('$n > 2'), Has('$x', 'type', '$t'),
+            Filter('$t > 0')))
+
+    def test__bind_producer(self):
+        rule = Rule(Has('$x', 'type', '$p'), Bind('$p * 2', '$d'), Has('$y', 'name', '$d'))
+
+        assert_that(reorder(rule, estimate), 'producer').is_equal_to(rule)
+
+    def test__barriers(self):
+        rule = Rule(Has('$x', 'type', '$t'), Has('$x', 'color', '$c'), Neg('$x', 'owner', '$o'),
+                    Has('$x', 'owner', '$p'), Has('$p', 'name', '$n'),
+                    Aggregate('count', '$k', Has('$y', 'type', '$t'), Has('$y', 'color', '$c')))
+
+        assert_that(reorder(rule, estimate), 'barriers').is_equal_to(Rule(
+            Has('$x', 'color', '$c'), Has('$x', 'type', '$t'), Neg('$x', 'owner', '$o'),
+            Has('$x', 'owner', '$p'), Has('$p', 'name', '$n'),
+            Aggregate('count', '$k', Has('$y', 'color', '$c'), Has('$y', 'type', '$t'))))
+
+
+class TestNetworkReorder(TestCase):
+
+    def test__same_matches(self):
+        rnd = random.Random(3)
+        facts = []
+        for i in range(60):
+            facts.append((f'c{i}', 'type', rnd.choice(['car', 'bike', 'van'])))
+            facts.append((f'c{i}', 'owner', f'p{rnd.randint(0, 9)}'))
+            if rnd.random() < 0.3:
+                facts.append((f'c{i}', 'stolen', 'yes'))
+        for i in range(10):
+            facts.append((f'p{i}', 'age', str(rnd.randint(10, 90))))
+        facts.append(('p3', 'name', 'ann'))
+        rules = [
+            Rule(Has('$c', 'type', '$t'), Has('$c', 'owner', '$p'), Has('$p', 'age', '$a'), Filter('$a > 50')),
+            Rule(Has('$c', 'type', '$t'), Has('$c', 'owner', '$p'), Neg('$c', 'stolen', 'yes'),
+                 Has('$p', 'age', '$a'), Filter('$a > 50')),
+            Rule(Has('$c', 'type', 'van'), Has('$c', 'owner', '$p'), Ncc(Has('$p', 'name', '$n'), Filter('1 > 0')),
+                 Has('$p', 'age', '$a'), Bind('$a', '$b'), Filter('$b < 40')),
+            Rule(Has('$c', 'type', '$t'), Has('$p', 'name', 'ann'), Has('$c', 'owner', '$p')),
+        ]
+        for i, rule in enumerate(rules):
+            with self.subTest(rule=i):
+                results = []
+                for flag in [False, True]:
+                    network = Network()
+                    wmes = [WME(*fact) for fact in facts]
+                    for wme in wmes[:100]:
+                        network.add_wme(wme)
+                    production = network.add_production(rule, reorder=flag)
+                    for wme in wmes[100:]:
+                        network.add_wme(wme)
+                    for wme in wmes[::9]:
+                        network.remove_wme(wme)
+                    results.append(matches(production, '$c', '$p'))
+
+                assert_that(results[1], str(i)).is_equal_to(results[0])
+
+    def test__bind_producer(self):
+        rule = Rule(Has('$x', 'price', '$p'), Bind('$p * 2', '$d'), Has('$y', 'cost', '$d'))
+        network = Network()
+        for i in range(20):
+            network.add_wme(WME(f'i{i}', 'price', i))
+        network.add_wme(WME('c1', 'cost', 4))
+        production = network.add_production(rule, reorder=True)
+        network.replan()
+
+        assert_that(matches(production, '$x', '$y'), 'producer').is_equal_to([('i2', 'c1')])
+
+    def test__sharing(self):
+        network = Network()
+        for i in range(20):
+            network.add_wme(WME(f'c{i}', 'type', 'car'))
+        first = network.add_production(Rule(Has('$c', 'type', 'car'), Has('$c', 'owner', '$p')), reorder=True)
+        network.add_wme(WME('c0', 'owner', 'ann'))
+        second = network.add_production(Rule(Has('$c', 'type', 'car'), Has('$c', 'owner', '$p'),
+                                             Has('$p', 'age', '$a')), reorder=True)
+
+        assert_that(second.parent.parent.parent, 'sharing').is_same_as(first.parent)
@@ -0,0 +1,209 @@
+import random
+from unittest import skipIf
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Filter
+from rete import Has
+from rete import OneOf
+from rete import Prefix
+from rete import Range
+from rete import Rule
+from rete.columnar import ColumnarMemory
+from rete.columnar import np
+from rete.common import WME
+from rete.network import create_network
+from rete.network import Network
+from rete.nodes import FilterNode
+from rete.predicates import Expression
+from rete.predicates import IntervalTree
+from rete.predicates import PredicateIndex
+
+from helpers import matches
+
+
+class Probe(object):
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+
+class TestPredicates(TestCase):
+
+    def test__test(self):
+        for predicate, value, exp in [
+            (Range(10, 20), '10', True),
+            (Range(10, 20, low_closed=False), '10', False),
+            (Range(10, 20), 20.0, True),
+            (Range(10, 20, high_closed=False), '20', False),
+            (Range(low=10), '1e9', True),
+            (Range(high=0), '-3', True),
+            (Range(10, 20), 'fifteen', False),
+            (Prefix('err'), 'error', True),
+            (Prefix('err'), 'warning', False),
+            (OneOf('red', 'blue'), 'red', True),
+            (OneOf('red', 'blue'), 'green', False),
+            (OneOf('5', 'red'), 5, True),
+            (OneOf(5), '5.0', True),
+            (OneOf('5'), '6', False),
+        ]:
+            with self.subTest(predicate=predicate, value=value):
+                assert_that(predicate.test(value), f"{predicate} {value}").is_equal_to(exp)
+
+    def test__equality(self):
+        assert_that(Range(1, 2), 'equality').is_equal_to(Range(1, 2))
+        assert_that(Range(1, 2), 'equality').is_not_equal_to(Range(1, 2, high_closed=False))
+        assert_that(OneOf('a', 'b'), 'equality').is_equal_to(OneOf('b', 'a'))
+        assert_that(OneOf('5'), 'equality').is_equal_to(OneOf(5))
+        assert_that(Prefix('a'), 'equality').is_not_equal_to(OneOf('a'))
+        assert_that(Has('$x', 'age', Range(18)), 'equality').is_equal_to(Has('$x', 'age', Range(18)))
+
+    def test__interval_tree(self):
+        rnd = random.Random(7)
+        intervals = []
+        for i in range(200):
+            low = rnd.randint(0, 1000)
+            intervals.append((low, low + rnd.randint(0, 100), i))
+        tree = IntervalTree(intervals)
+        for point in [-1, 0, 17, 500, 555.5, 1000, 1100]:
+            with self.subTest(point=point):
+                exp = sorted(i for low, high, i in intervals if low <= point <= high)
+                assert_that(sorted(tree.search(point)), str(point)).is_equal_to(exp)
+
+    def test__index(self):
+        index = PredicateIndex()
+        probes = [Probe(Range(0, 10)), Probe(Range(5, 15, low_closed=False)), Probe(Prefix('ab')), Probe(Prefix('')),
+                  Probe(OneOf('abc', '7'))]
+        for probe in probes:
+            index.add(probe)
+        for value in ['5', '7', '7.0', 7, '12', 'abc', 'ax', '-1']:
+            with self.subTest(value=value):
+                exp = [p for p in probes if p.symbol.test(value)]
+                result = index.search(value)
+                assert_that(result, value).contains_only(*exp)
+                assert_that(result, value).does_not_contain_duplicates()
+
+
+class TestAlphaPredicates(TestCase):
+
+    def test__match(self):
+        rule = Rule(Has('$p', 'age', Range(18, 65, high_closed=False)), Has('$p', 'city', Prefix('San ')),
+                    Has('$p', 'role', OneOf('admin', 'owner')))
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                network = create_network(engine)
+                production = network.add_production(rule)
+                for name, age, city, role in [('ann', '30', 'San Diego', 'admin'), ('bob', '65', 'San Jose', 'owner'),
+                                              ('cid', '17', 'San Remo', 'admin'), ('dan', '40', 'Santiago', 'owner'),
+                                              ('eve', '50', 'San Marino', 'guest'), ('fay', '18', 'San Luis', 'owner')]:
+                    network.add_wme(WME(name, 'age', age))
+                    network.add_wme(WME(name, 'city', city))
+                    network.add_wme(WME(name, 'role', role))
+
+                assert_that(matches(production, '$p'), engine).is_equal_to([('ann',), ('fay',)])
+
+    def test__same_as_filter(self):
+        rnd = random.Random(11)
+        bounds = [(rnd.randint(0, 50), rnd.randint(50, 100)) for _ in range(20)]
+        network = Network()
+        indexed = [network.add_production(Rule(Has('$x', 'score', Range(low, high)), Has('$x', 'team', '$t')))
+                   for low, high in bounds]
+        filtered = [network.add_production(Rule(Has('$x', 'score', '$s'), Has('$x', 'team', '$t'),
+                                                Filter(f'{low} <= $s <= {high}'))) for low, high in bounds]
+        for i in range(100):
+            network.add_wme(WME(f'p{i}', 'score', str(rnd.randint(-10, 110))))
+            network.add_wme(WME(f'p{i}', 'team', f't{i % 3}'))
+
+        for (low, high), exp, production in zip(bounds, filtered, indexed):
+            with self.subTest(low=low, high=high):
+                assert_that(matches(production, '$x', '$t'), f"{low}-{high}").is_equal_to(
+                    matches(exp, '$x', '$t'))
+
+    def test__sharing(self):
+        network = Network()
+        for low in [10, 20, 30]:
+            network.add_production(Rule(Has('$x', 'score', Range(low)), Has('$x', 'team', '$t')))
+        network.add_production(Rule(Has('$x', 'score', Range(10)), Has('$x', 'name', '$n')))
+        score = next(c for c in network.alpha_root.children if c.symbol == 'score')
+
+        assert_that(list(score.children), 'sharing').is_length(3)
+        assert_that(score._indexes['value'].search('25'), 'sharing').is_length(2)
+
+    def test__existing_wmes(self):
+        network = Network()
+        network.add_wme(WME('ann', 'score', '42'))
+        network.add_wme(WME('bob', 'score', '7'))
+        production = network.add_production(Rule(Has('$x', 'score', Range(10, 50))))
+
+        assert_that(matches(production, '$x'), 'existing').is_equal_to([('ann',)])
+
+
+@skipIf(np is None, 'numpy is not installed')
+class TestColumnarPredicates(TestCase):
+
+    def test__select(self):
+        memory = ColumnarMemory(capacity=4)
+        memory.extend([WME('ann', 'score', '42'), WME('bob', 'score', '7'), WME('cid', 'score', 'n/a'),
+                       WME('ann', 'city', 'San Diego')])
+        rule = Rule(Has('$x', 'score', Range(5, 50)), Has('$x', 'city', Prefix('San')))
+
+        assert_that(list(memory.solutions(rule)), 'select').is_equal_to([{'$x': 'ann'}])
+
+    def test__expression(self):
+        # the other symbols of the table, such as 'ann', would raise a NameError when evaluated
+        memory = ColumnarMemory()
+        memory.extend([WME('ann', 'score', 42), WME('bob', 'score', 7), WME('ann', 'city', 'San Diego')])
+        rule = Rule(Has('$x', 'score', Expression('$_ > 10')))
+
+        assert_that(list(memory.solutions(rule)), 'expression').is_equal_to([{'$x': 'ann'}])
+
+        memory.append(WME('cid', 'score', 'n/a'))
+        assert_that(memory.count).raises(NameError).when_called_with(rule)
+
+
+class TestFilterPushdown(TestCase):
+
+    @staticmethod
+    def filters(node):
+        return isinstance(node, FilterNode) + sum(TestFilterPushdown.filters(child) for child in node.children)
+
+    def test__pushdown(self):
+        rule = Rule(Has('$x', 'on', '$y'), Filter('"$y" != "table"'), Has('$x', 'size', '$s'), Filter('$s > 2'))
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                network = create_network(engine)
+                production = network.add_production(rule)
+                for wme in [WME('B1', 'on', 'B2'), WME('B2', 'on', 'table'), WME('B1', 'size', '3'),
+                            WME('B2', 'size', '5'), WME('B3', 'on', 'B1'), WME('B3', 'size', '1')]:
+                    network.add_wme(wme)
+
+                assert_that([m.get_binding('$x') for m in production.memory], engine).is_equal_to(['B1'])
+
+    def test__alpha_memory(self):
+        network = Network()
+        network.add_wme(WME('B1', 'on', 'B2'))
+        network.add_wme(WME('B2', 'on', 'table'))
+        production = network.add_production(Rule(Has('$x', 'on', '$y'), Filter('"$y" != "table"')))
+        network.add_wme(WME('B3', 'on', 'table'))
+
+        assert_that(self.filters(network.beta_root), 'alpha').is_zero()
+        assert_that(production.parent.amem.memory, 'alpha').is_equal_to([WME('B1', 'on', 'B2')])
+
+    def test__errors(self):
+        # as in a `FilterNode`, an unquoted symbol is evaluated as a name
+        rule = Rule(Has('$x', 'on', '$y'), Filter('$y != "table"'))
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                network = create_network(engine)
+                network.add_production(rule)
+
+                assert_that(network.add_wme).raises(NameError).when_called_with(WME('B1', 'on', 'B2'))
+
+    def test__sharing(self):
+        network = Network()
+        first = network.add_production(Rule(Has('$x', 'on', '$y'), Filter('"$y" != "table"')))
+        second = network.add_production(Rule(Has('$a', 'on', '$b'), Has('$a', 'color', '$c'),
+                                             Filter('"$b" != "table"')))
+
+        assert_that(second.parent.parent.parent.amem, 'sharing').is_same_as(first.parent.amem)
@@ -0,0 +1,104 @@
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Bind
+from rete import Filter
+from rete import Has
+from rete import Ncc
+from rete import Neg
+from rete import Rule
+from rete.common import WME
+from rete.network import create_network
+from rete.network import Network
+from rete.query import Query
+
+WMES = [
+    WME('B1', 'on', 'B2'),
+    WME('B1', 'on', 'B3'),
+    WME('B1', 'color', 'red'),
+    WME('B2', 'on', 'table'),
+    WME('B2', 'left-of', 'B3'),
+    WME('B2', 'color', 'blue'),
+    WME('B3', 'left-of', 'B4'),
+    WME('B3', 'on', 'table'),
+    WME('B3', 'color', 'red'),
+]
+
+
+class TestQuery(TestCase):
+
+    def network(self, *rules):
+        network = Network()
+        for rule in rules:
+            network.add_production(rule)
+        for wme in WMES:
+            network.add_wme(WME(wme.identifier, wme.attribute, wme.value))
+
+        return network
+
+    def test__query(self):
+        for i, (rule, exp) in enumerate([
+            (Rule(Has('$x', 'on', '$y'), Has('$y', 'left-of', '$z'), Has('$z', 'color', 'red')),
+             [{'$x': 'B1', '$y': 'B2', '$z': 'B3'}]),
+            (Rule(Has('$x', 'on', 'table'), Has('$x', 'color', '$c')),
+             [{'$x': 'B2', '$c': 'blue'}, {'$x': 'B3', '$c': 'red'}]),
+            (Rule(Has('$x', 'on', '$y'), Has('$y', 'left-of', '$z'), Neg('$z', 'color', 'red')),
+             [{'$x': 'B1', '$y': 'B3', '$z': 'B4'}]),
+            (Rule(Has('$x', 'on', '$y'), Has('$y', 'left-of', '$z'), Ncc(Has('$z', 'color', 'red'),
+                                                                         Has('$z', 'on', '$w'))),
+             [{'$x': 'B1', '$y': 'B3', '$z': 'B4'}]),
+            (Rule(Has('$x', 'on', '$y'), Filter('"$y" != "table"'), Filter('"$x" == "B1"')),
+             [{'$x': 'B1', '$y': 'B2'}, {'$x': 'B1', '$y': 'B3'}]),
+            (Rule(Filter('$n > 2'), Bind('len("$y")', '$n'), Has('$x', 'on', '$y')),
+             [{'$x': 'B2', '$y': 'table', '$n': 5}, {'$x': 'B3', '$y': 'table', '$n': 5}]),
+            (Rule(Has('$x', 'on', '$x')),
+             []),
+        ]):
+            networks = [self.network(), self.network(Rule(Has('$x', 'on', '$y')), Rule(Has('$x', 'color', 'red')))]
+            for j, network in enumerate(networks):
+                with self.subTest(i=i, j=j, rule=rule):
+                    result = list(network.query(rule))
+
+                    assert_that(sorted(result, key=repr), 'query').is_equal_to(sorted(exp, key=repr))
+
+    def test__produced_variable(self):
+        # the smaller condition joins on a variable produced by the `Bind` written before it
+        rule = Rule(Has('$x', 'price', '$p'), Bind('$p * 2', '$d'), Has('$y', 'cost', '$d'))
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                network = create_network(engine)
+                production = network.add_production(rule)
+                for i in range(20):
+                    network.add_wme(WME(f'i{i}', 'price', i))
+                network.add_wme(WME('c1', 'cost', 4))
+
+                result = list(network.query(rule))
+
+                assert_that(result, engine).is_equal_to([{'$x': 'i2', '$p': 2, '$d': 4, '$y': 'c1'}])
+                assert_that([m.all_binding() for m in production.memory], engine).is_equal_to(result)
+
+    def test__binding(self):
+        network = self.network()
+
+        result = list(network.query(Rule(Has('$x', 'on', '$y')), {'$x': 'B2'}))
+
+        assert_that(result, 'binding').is_equal_to([{'$x': 'B2', '$y': 'table'}])
+
+    def test__no_nodes_left(self):
+        network = self.network(Rule(Has('$x', 'on', '$y')))
+        before = network.dump()
+
+        list(network.query(Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red'), Neg('$x', 'color', 'blue'))))
+
+        assert_that(network.dump(), 'query').is_equal_to(before)
+
+    def test__plan(self):
+        network = self.network(Rule(Has('$x', 'color', 'red')), Rule(Has('$x', 'on', '$y')))
+        c0 = Has('$x', 'on', '$y')
+        c1 = Has('$y', 'left-of', '$z')
+        c2 = Has('$z', 'color', 'red')
+
+        result = [step[0] for step in Query(Rule(c0, c1, c2), network.candidates).plan()]
+
+        assert_that(result, 'plan').is_equal_to([c1, c2, c0])
@@ -0,0 +1,112 @@
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Aggregate
+from rete import Filter
+from rete import Has
+from rete import Ncc
+from rete import Neg
+from rete import Rule
+from rete.common import WME
+from rete.network import Network
+from rete.nodes import JoinNode
+
+from helpers import matches
+
+
+class TestStats(TestCase):
+
+    def test__stats(self):
+        network = Network()
+        production = network.add_production(Rule(Has('$x', 'type', 'car'), Has('$x', 'owner', '$p')))
+        for i in range(4):
+            network.add_wme(WME(f'c{i}', 'type', 'car'))
+        network.add_wme(WME('c0', 'owner', 'ann'))
+        network.add_wme(WME('c1', 'owner', 'bob'))
+        joins = [s for s in network.stats(production) if isinstance(s.node, JoinNode)]
+
+        assert_that([(s.alpha, s.activations, s.matches) for s in joins], 'stats').is_equal_to([(4, 4, 4), (2, 6, 2)])
+        assert_that(joins[1].fan_out, 'stats').is_close_to(1 / 3, 1e-9)
+        assert_that(network.stats(production)[-2].beta, 'stats').is_equal_to(4)
+
+    def test__fork(self):
+        network = Network()
+        production = network.add_production(Rule(Has('$x', 'type', 'car'), Has('$x', 'owner', '$p')))
+        for i in range(4):
+            network.add_wme(WME(f'c{i}', 'type', 'car'))
+        fork = network.fork()
+        fork.add_wme(WME('c0', 'owner', 'ann'))
+        with fork:
+            forked = [(s.activations, s.matches) for s in network.stats(production) if isinstance(s.node, JoinNode)]
+
+        # the counters of the joins are kept apart for every working memory, as the rest of their state
+        assert_that(forked, 'fork').is_equal_to([(4, 4), (5, 1)])
+        assert_that([(s.activations, s.matches) for s in network.stats(production) if isinstance(s.node, JoinNode)],
+                    'fork').is_equal_to([(4, 4), (4, 0)])
+
+
+class TestRemoveProduction(TestCase):
+
+    def test__remove(self):
+        for i, rule in enumerate([
+            Rule(Has('$x', 'type', 'car'), Has('$x', 'owner', '$p'), Filter('1 > 0')),
+            Rule(Has('$x', 'type', 'car'), Neg('$x', 'stolen', 'yes')),
+            Rule(Has('$x', 'type', 'car'), Ncc(Has('$x', 'owner', '$p'), Has('$p', 'age', '$a'))),
+            Rule(Has('$x', 'type', 'car'), Aggregate('count', '$n', Has('$x', 'owner', '$p'))),
+        ]):
+            with self.subTest(rule=i):
+                network = Network()
+                for wme in [WME('c0', 'type', 'car'), WME('c0', 'owner', 'ann'), WME('ann', 'age', '30')]:
+                    network.add_wme(wme)
+                production = network.add_production(rule)
+                network.remove_production(production)
+                network.add_wme(WME('c1', 'type', 'car'))
+                network.add_wme(WME('c1', 'stolen', 'yes'))
+
+                assert_that(list(network.beta_root.children), str(i)).is_empty()
+                assert_that(list(network.alpha_root.amem.children), str(i)).is_empty()
+
+
+class TestReplan(TestCase):
+
+    def setUp(self):
+        self.network = Network()
+        self.production = self.network.add_production(Rule(Has('$x', 'type', '$t'), Has('$x', 'owner', '$p'),
+                                                           Has('$p', 'name', 'ann')))
+        for i in range(50):
+            self.network.add_wme(WME(f'c{i}', 'type', 'car'))
+            self.network.add_wme(WME(f'c{i}', 'owner', f'p{i % 10}'))
+        self.network.add_wme(WME('p3', 'name', 'ann'))
+
+    def test__replan(self):
+        events = []
+        self.production.subscribe(events.append)
+        before = matches(self.production, '$x', '$p')
+        report = self.network.replan()
+
+        assert_that(report, 'replan').is_length(1)
+        assert_that(report[0].rebuilt, 'replan').is_true()
+        assert_that(report[0].after, 'replan').is_less_than(report[0].before)
+        assert_that(report[0].activations, 'replan').is_greater_than(0)
+        assert_that(matches(self.production, '$x', '$p'), 'replan').is_equal_to(before)
+        assert_that(events, 'replan').is_empty()
+        assert_that(self.network.rules[self.production][1][0], 'replan').is_equal_to(Has('$p', 'name', 'ann'))
+
+        self.network.add_wme(WME('c99', 'owner', 'p3'))
+        self.network.add_wme(WME('c99', 'type', 'van'))
+        assert_that([e.kind for e in events], 'replan').is_equal_to(['added'])
+        assert_that(self.network.replan()[0].rebuilt, 'replan').is_false()
+
+    def test__logical_wmes(self):
+        token = self.production.memory[0]
+        self.network.add_logical_wme(WME(token.get_binding('$x'), 'owned-by', 'ann'), token)
+        self.network.replan()
+        derived = [w for w in self.network.alpha_root.amem.memory if w.attribute == 'owned-by']
+
+        assert_that(derived, 'logical').is_length(1)
+
+        supporting = next(w for w in self.network.alpha_root.amem.memory if w.attribute == 'name')
+        self.network.remove_wme(supporting)
+        assert_that([w for w in self.network.alpha_root.amem.memory if w.attribute == 'owned-by'],
+                    'logical').is_empty()
@@ -0,0 +1,137 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Has
+from rete import Rule
+from rete.network import create_network
+from rete.server import Client
+from rete.server import MatchServer
+from rete.server import ServerError
+
+
+class TestServer(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.network = create_network()
+        self.production = self.network.add_production(Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red')),
+                                                      name='red')
+        self.server = MatchServer(self.network, os.path.join(self.tmp.name, 'rete.sock'))
+        self.server.start()
+        self.client = Client(self.server.address, pool_size=2)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.close()
+        self.tmp.cleanup()
+
+    def test__operations(self):
+        assert_that(self.client.add_wme('B1', 'on', 'B2'), 'add').is_true()
+        assert_that(self.client.add_wme('B1', 'on', 'B2'), 'add').is_false()
+        self.client.add_wme('B2', 'color', 'red')
+
+        assert_that(self.production.memory, 'add').is_length(1)
+        assert_that(self.client.query(Rule(Has('$x', 'on', '$y'))), 'query').is_equal_to([{'$x': 'B1', '$y': 'B2'}])
+        assert_that(self.client.query(Rule(Has('$x', '$a', '$y')), {'$a': 'color'}), 'query').is_equal_to(
+            [{'$x': 'B2', '$a': 'color', '$y': 'red'}])
+
+        assert_that(self.client.remove_wme('B2', 'color', 'red'), 'remove').is_true()
+        assert_that(self.client.remove_wme('B2', 'color', 'red'), 'remove').is_false()
+        assert_that(self.production.memory, 'remove').is_empty()
+
+    def test__pipeline(self):
+        with self.client.pipeline(batch=7) as pipeline:
+            for i in range(50):
+                pipeline.add_wme(f'B{i}', 'on', 'B0')
+            pipeline.add_wme('B0', 'color', 'red')
+            pipeline.remove_wme('B3', 'on', 'B0')
+            pipeline.query(Rule(Has('$x', 'color', '$c')))
+
+        assert_that(pipeline.results, 'pipeline').is_equal_to([True] * 52 + [[{'$x': 'B0', '$c': 'red'}]])
+        assert_that(self.production.memory, 'pipeline').is_length(49)
+
+    def test__large_pipeline(self):
+        with self.client.pipeline() as pipeline:
+            for i in range(1000):
+                pipeline.add_wme(f'B{i}', 'on', 'T')
+        big = 'x' * 100000
+
+        done = threading.Event()
+        results = []
+
+        def work():
+            # the responses outgrow the socket buffers long before the batches are all written
+            with self.client.pipeline(batch=1) as pipeline:
+                for i in range(30):
+                    pipeline.query(Rule(Has('$x', 'on', '$y')))
+                    pipeline.add_wme(f'C{i}', 'size', big)
+            results.extend(pipeline.results)
+            done.set()
+
+        threading.Thread(target=work, daemon=True).start()
+        assert_that(done.wait(30), 'deadlock').is_true()
+        assert_that([len(r) for r in results[::2]], 'results').is_equal_to([1000] * 30)
+        assert_that(results[1::2], 'results').is_equal_to([True] * 30)
+
+    def test__errors(self):
+        with self.assertRaises(ServerError):
+            self.client.call({'op': 'drop'})
+        with self.assertRaises(ServerError):
+            self.client.subscribe('blue', print)
+
+        assert_that(self.client.add_wme('B1', 'on', 'B2'), 'recovered').is_true()
+
+    def test__subscribe(self):
+        received = []
+        done = threading.Event()
+
+        def callback(event):
+            received.append(event)
+            if len(received) == 2:
+                done.set()
+
+        subscription = self.client.subscribe('red', callback)
+        with self.client.pipeline() as pipeline:
+            pipeline.add_wme('B1', 'on', 'B2')
+            pipeline.add_wme('B2', 'color', 'red')
+            pipeline.add_wme('B9', 'on', 'B8')
+            pipeline.remove_wme('B9', 'on', 'B8')
+        self.client.remove_wme('B1', 'on', 'B2')
+
+        assert_that(done.wait(5), 'events').is_true()
+        assert_that([(e['event'], e['binding']['$x']) for e in received], 'events').is_equal_to(
+            [('added', 'B1'), ('removed', 'B1')])
+        subscription.close()
+        self.client.add_wme('B1', 'on', 'B2')
+        assert_that(received, 'closed').is_length(2)
+
+    def test__pool(self):
+        errors = []
+
+        def work(n):
+            try:
+                for i in range(20):
+                    self.client.add_wme(f'T{n}-{i}', 'on', 'B0')
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert_that(errors, 'pool').is_empty()
+        assert_that(self.network.alpha_root.amem.memory, 'pool').is_length(120)
+        assert_that(self.client._pool.qsize(), 'pool').is_less_than_or_equal_to(2)
+
+    def test__tcp(self):
+        network = create_network()
+        with MatchServer(network, ('127.0.0.1', 0)) as server, Client(server.address) as client:
+            client.add_wme('B1', 'on', 'B2')
+
+            assert_that(client.query(Rule(Has('$x', 'on', 'B2'))), 'tcp').is_equal_to([{'$x': 'B1'}])
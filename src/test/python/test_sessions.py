@@ -0,0 +1,272 @@
+import gc
+import random
+import threading
+import weakref
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Aggregate
+from rete import Exists
+from rete import Filter
+from rete import Has
+from rete import Ncc
+from rete import Neg
+from rete import Rule
+from rete.common import WME
+from rete.network import create_network
+from rete.sessions import ConflictError
+from rete.workload import Recorder
+
+from helpers import bindings
+
+RULES = [
+    Rule(Has('$c', 'type', 'car'), Has('$c', 'owner', '$p'), Neg('$c', 'stolen', 'yes')),
+    Rule(Has('$c', 'owner', '$p'), Ncc(Has('$p', 'age', '$a'), Filter('$a > 50'))),
+    Rule(Has('$p', 'age', '$a'), Has('$c', 'price', '$v'), Filter('$v < $a')),
+    Rule(Has('$p', 'age', '$a'), Exists('$c', 'owner', '$p'), Aggregate('count', '$n', Has('$d', 'owner', '$p'))),
+]
+
+
+def facts(seed):
+    rnd = random.Random(seed)
+    result = []
+    for i in range(20):
+        result.append((f'c{i}', 'type', rnd.choice(['car', 'van'])))
+        result.append((f'c{i}', 'owner', f'p{rnd.randint(0, 4)}'))
+        result.append((f'c{i}', 'price', str(rnd.randint(0, 100))))
+        if rnd.random() < 0.3:
+            result.append((f'c{i}', 'stolen', 'yes'))
+    for i in range(5):
+        result.append((f'p{i}', 'age', str(rnd.randint(10, 90))))
+    rnd.shuffle(result)
+    return result
+
+
+class TestSessions(TestCase):
+
+    @staticmethod
+    def play(network, seed, add_wme, remove_wme):
+        wmes = [WME(*fact) for fact in facts(seed)]
+        for wme in wmes:
+            add_wme(wme)
+        for wme in wmes[::5]:
+            remove_wme(wme)
+
+    def test__isolated(self):
+        for engine in ['rete', 'treat']:
+            network = create_network(engine)
+            productions = [network.add_production(rule) for rule in RULES]
+            sessions = [network.session() for _ in range(3)]
+            for seed, session in enumerate(sessions):
+                self.play(network, seed, session.add_wme, session.remove_wme)
+            for seed, session in enumerate(sessions):
+                exp = create_network(engine)
+                expected = [exp.add_production(rule) for rule in RULES]
+                self.play(exp, seed, exp.add_wme, exp.remove_wme)
+                for i, (production, reference) in enumerate(zip(productions, expected)):
+                    with self.subTest(engine=engine, session=seed, rule=i):
+                        assert_that(bindings(session.matches(production)), str(i)).is_equal_to(
+                            bindings(reference.memory))
+
+            assert_that([list(p.memory) for p in productions], engine).is_equal_to([[]] * len(RULES))
+
+    def test__context(self):
+        network = create_network()
+        production = network.add_production(Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red')))
+        session = network.session()
+        network.add_wme(WME('B2', 'color', 'red'))
+        with session:
+            network.add_wme(WME('B1', 'on', 'B2'))
+            network.add_wme(WME('B2', 'color', 'red'))
+
+            assert_that(list(production.memory), 'context').is_length(1)
+        assert_that(list(production.memory), 'context').is_empty()
+
+    def test__events_and_logical_wmes(self):
+        network = create_network()
+        production = network.add_production(Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red')))
+        sessions = [network.session(), network.session()]
+        events = [[], []]
+        for session, received in zip(sessions, events):
+            with session:
+                production.subscribe(received.append)
+        support = WME('B2', 'color', 'red')
+        sessions[0].add_wme(WME('B1', 'on', 'B2'))
+        sessions[0].add_wme(support)
+        token = sessions[0].matches(production)[0]
+        sessions[0].add_logical_wme(WME('B1', 'above', 'red'), token)
+
+        assert_that([e.kind for e in events[0]], 'events').is_equal_to(['added'])
+        assert_that(events[1], 'events').is_empty()
+
+        sessions[0].remove_wme(support)
+        with sessions[0]:
+            assert_that(network.alpha_root.amem.memory, 'logical').is_equal_to([WME('B1', 'on', 'B2')])
+        assert_that([e.kind for e in events[0]], 'events').is_equal_to(['added', 'removed'])
+
+
+class TestFork(TestCase):
+
+    def setUp(self):
+        self.network = create_network()
+        self.productions = [self.network.add_production(rule) for rule in RULES]
+        self.wmes = [WME(*fact) for fact in facts(0)]
+        for wme in self.wmes:
+            self.network.add_wme(wme)
+
+    def snapshot(self):
+        return [bindings(p.memory) for p in self.productions]
+
+    def test__what_if(self):
+        before = self.snapshot()
+        changes = [WME(*fact) for fact in facts(1)[:30]]
+        fork = self.network.fork()
+        for wme in changes:
+            fork.add_wme(wme)
+        for wme in self.wmes[::4]:
+            fork.remove_wme(wme)
+
+        exp = create_network()
+        expected = [exp.add_production(rule) for rule in RULES]
+        for wme in [WME(w.identifier, w.attribute, w.value) for w in self.wmes] + changes:
+            exp.add_wme(wme)
+        for wme in list(exp.alpha_root.amem.memory):
+            if any(wme == w for w in self.wmes[::4]):
+                exp.remove_wme(wme)
+        for i, (production, reference) in enumerate(zip(self.productions, expected)):
+            with self.subTest(rule=i):
+                assert_that(bindings(fork.matches(production)), str(i)).is_equal_to(bindings(reference.memory))
+        assert_that(self.snapshot(), 'parent').is_equal_to(before)
+        assert_that(self.network.alpha_root.amem.memory, 'parent').is_length(len(self.wmes))
+
+    def test__nested(self):
+        production = self.productions[0]
+        fork = self.network.fork()
+        fork.add_wme(WME('c99', 'type', 'car'))
+        fork.add_wme(WME('c99', 'owner', 'p1'))
+        nested = fork.fork()
+        nested.remove_wme(next(t for t in nested.matches(production) if t.get_binding('$c') == 'c99').wmes[0])
+
+        assert_that(len(fork.matches(production)), 'nested').is_equal_to(len(production.memory) + 1)
+        assert_that(nested.matches(production), 'nested').is_length(len(production.memory))
+
+    def test__fork_session(self):
+        # the WMEs and tokens of a session created before any fork, with plain attributes, are shared by its forks
+        production = self.productions[0]
+        session = self.network.session()
+        session.add_wme(WME('c99', 'type', 'car'))
+        owner = WME('c99', 'owner', 'p1')
+        session.add_wme(owner)
+        fork = session.fork()
+        fork.remove_wme(owner)
+
+        assert_that(session.matches(production), 'session').is_length(1)
+        assert_that(fork.matches(production), 'fork').is_empty()
+
+    def test__copy_on_write(self):
+        fork = self.network.fork()
+        fork.add_wme(WME('x', 'unrelated', 'y'))
+
+        assert_that(fork._slots, 'copy on write').is_length(3)  # the network, the root alpha memory and the WME
+
+    def test__logical_wmes(self):
+        production = self.network.add_production(Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red')))
+        events = []
+        production.subscribe(events.append)
+        support = WME('B2', 'color', 'red')
+        self.network.add_wme(WME('B1', 'on', 'B2'))
+        self.network.add_wme(support)
+        self.network.add_logical_wme(WME('B1', 'above', 'red'), production.memory[0])
+        fork = self.network.fork()
+        fork.remove_wme(support)
+
+        with fork:
+            assert_that([w for w in self.network.alpha_root.amem.memory if w.attribute == 'above'],
+                        'fork').is_empty()
+        assert_that([w for w in self.network.alpha_root.amem.memory if w.attribute == 'above'],
+                    'parent').is_length(1)
+        assert_that([e.kind for e in events], 'events').is_equal_to(['added'])
+
+
+class TestTransaction(TestCase):
+
+    def setUp(self):
+        self.network = create_network()
+        self.production = self.network.add_production(Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red'),
+                                                           Neg('$x', 'stolen', 'yes')))
+        self.events = []
+        self.production.subscribe(self.events.append)
+        self.recorder = Recorder(self.network)
+        self.wmes = [WME('B1', 'on', 'B2'), WME('B2', 'color', 'red'), WME('B3', 'on', 'B2')]
+        for wme in self.wmes:
+            self.network.add_wme(wme)
+        self.events.clear()
+
+    def bindings(self):
+        return sorted(t.get_binding('$x') for t in self.production.memory)
+
+    def test__commit(self):
+        added = WME('B4', 'on', 'B2')
+        with self.network.transaction():
+            self.network.add_wme(added)
+            self.network.add_wme(WME('B1', 'stolen', 'yes'))
+            self.network.remove_wme(self.wmes[2])
+
+            assert_that(self.bindings(), 'inside').is_equal_to(['B4'])
+            assert_that(self.events, 'inside').is_empty()
+
+        assert_that(self.bindings(), 'commit').is_equal_to(['B4'])
+        assert_that(sorted((e.kind, e.binding['$x']) for e in self.events), 'commit').is_equal_to(
+            [('added', 'B4'), ('removed', 'B1'), ('removed', 'B3')])
+        assert_that([o.name for o in self.recorder.operations][-3:], 'commit').is_equal_to(
+            ['add_wme', 'add_wme', 'remove_wme'])
+
+        self.network.remove_wme(added)
+        assert_that(self.bindings(), 'after').is_empty()
+
+    def test__rollback(self):
+        operations = len(self.recorder.operations)
+        with self.assertRaises(RuntimeError):
+            with self.network.transaction():
+                self.network.add_wme(WME('B4', 'on', 'B2'))
+                self.network.remove_wme(self.wmes[1])
+                raise RuntimeError('rhs failed')
+
+        assert_that(self.bindings(), 'rollback').is_equal_to(['B1', 'B3'])
+        assert_that(self.network.alpha_root.amem.memory, 'rollback').is_equal_to(self.wmes)
+        assert_that(self.events, 'rollback').is_empty()
+        assert_that(self.recorder.operations, 'rollback').is_length(operations)
+
+        self.network.remove_wme(self.wmes[1])
+        assert_that(self.bindings(), 'after').is_empty()
+
+    def test__conflict(self):
+        with self.assertRaises(ConflictError):
+            with self.network.transaction():
+                self.network.add_wme(WME('B4', 'on', 'B2'))
+                writer = threading.Thread(target=self.network.add_wme, args=(WME('B5', 'on', 'B2'),))
+                writer.start()
+                writer.join()
+
+        assert_that(self.bindings(), 'conflict').is_equal_to(['B1', 'B3', 'B5'])
+
+    def test__owned(self):
+        fork = self.network.fork()
+        with fork:
+            wme = WME('B9', 'on', 'B2')
+            self.network.add_wme(wme)
+            self.network.remove_wme(wme)
+        created = weakref.ref(wme)
+        del wme
+        gc.collect()
+
+        assert_that(created(), 'released').is_none()
+
+    def test__explicit_rollback(self):
+        with self.network.transaction() as transaction:
+            self.network.remove_wme(self.wmes[0])
+            transaction.rollback()
+
+        assert_that(transaction.closed, 'closed').is_true()
+        assert_that(self.bindings(), 'rollback').is_equal_to(['B1', 'B3'])
@@ -0,0 +1,204 @@
+import io
+import os
+import pickle
+import random
+import tempfile
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Aggregate
+from rete import Exists
+from rete import Filter
+from rete import Has
+from rete import Ncc
+from rete import Neg
+from rete import Rule
+from rete import Within
+from rete.common import WME
+from rete.network import create_network
+from rete.nodes import JoinNode
+from rete.sessions import PENDING
+from rete.snapshots import Pickler
+from rete.timers import ManualClock
+from rete.utils import Identity
+
+RULES = [
+    (Rule(Has('$c', 'type', 'car'), Has('$c', 'owner', '$p'), Neg('$c', 'stolen', 'yes')), 'MAIN'),
+    (Rule(Has('$c', 'owner', '$p'), Ncc(Has('$p', 'age', '$a'), Filter('$a > 50'))), 'MAIN'),
+    (Rule(Has('$p', 'age', '$a'), Has('$c', 'price', '$v'), Filter('$v < $a')), 'MAIN'),
+    (Rule(Has('$p', 'age', '$a'), Exists('$c', 'owner', '$p'), Aggregate('count', '$n', Has('$d', 'owner', '$p'))),
+     'MAIN'),
+    (Rule(Has('$c', 'type', 'van'), Has('$c', 'owner', '$p'), Has('$p', 'age', '$a')), 'fleet'),
+    (Rule(Has('$c', 'owner', '$p'), Within('$c', 'price', '$v', window=30)), 'MAIN'),
+]
+
+
+class TestSnapshots(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'state.snap')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @staticmethod
+    def matches(productions):
+        return [sorted(tuple(sorted(t.all_binding().items())) for t in p.memory) for p in productions]
+
+    @staticmethod
+    def facts(seed):
+        rnd = random.Random(seed)
+        result = []
+        for i in range(20):
+            result.append((f'c{i}', 'type', rnd.choice(['car', 'van'])))
+            result.append((f'c{i}', 'owner', f'p{rnd.randint(0, 4)}'))
+            result.append((f'c{i}', 'price', str(rnd.randint(0, 100))))
+            if rnd.random() < 0.3:
+                result.append((f'c{i}', 'stolen', 'yes'))
+        for i in range(5):
+            result.append((f'p{i}', 'age', str(rnd.randint(10, 90))))
+        rnd.shuffle(result)
+        return result
+
+    @staticmethod
+    def compile(engine, clock):
+        network = create_network(engine, clock=clock)
+        return network, [network.add_production(rule, module=module) for rule, module in RULES]
+
+    @staticmethod
+    def play(network, clock, seed):
+        wmes = []
+        for fact in TestSnapshots.facts(seed):
+            clock.advance(1)
+            wmes.append(WME(*fact))
+            network.add_wme(wmes[-1])
+        for wme in wmes[::4]:
+            network.remove_wme(wme)
+        network.advance_clock()
+        return wmes
+
+    def test__restore(self):
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                clock = ManualClock()
+                network, productions = self.compile(engine, clock)
+                network.focus('fleet')
+                self.play(network, clock, 0)
+                network.pop_focus()
+                network.snapshot(self.path)
+
+                restored, copies = self.compile(engine, ManualClock(clock.now()))
+                restored.restore(self.path)
+
+                assert_that(self.matches(copies), engine).is_equal_to(self.matches(productions))
+                assert_that(restored.focus_stack, engine).is_equal_to(network.focus_stack)
+
+                # the restored memories keep matching as the original ones
+                for net in (network, restored):
+                    wmes = list(net.alpha_root.amem.memory)
+                    for wme in wmes[::3]:
+                        net.remove_wme(wme)
+                    net.focus('fleet')
+                    self.play(net, net.clock, 1)
+                assert_that(self.matches(copies), engine).is_equal_to(self.matches(productions))
+
+    def test__no_join(self):
+        clock = ManualClock()
+        network, productions = self.compile('rete', clock)
+        self.play(network, clock, 0)
+        network.snapshot(self.path)
+
+        restored, copies = self.compile('rete', ManualClock(clock.now()))
+        restored.restore(self.path)
+
+        # the counters are restored with the rest of the match state, and no activation adds to them
+        activations = [sum(n.activations for n in net.nodes() if isinstance(n, JoinNode))
+                       for net in (network, restored)]
+        assert_that(activations[1], 'joins').is_equal_to(activations[0])
+        assert_that(self.matches(copies), 'joins').is_equal_to(self.matches(productions))
+
+    def test__typed_fields(self):
+        rule = Rule(Has('$x', 'age', '$a'), Has('$y', 'limit', '$a'))
+        values = [5, '5', True, 1, 2.5, None, (1, 'a')]
+        networks = [create_network(), create_network()]
+        production = networks[0].add_production(rule)
+        for i, value in enumerate(values):
+            networks[0].add_wme(WME(f'w{i}', 'value', value))
+        networks[0].add_wme(WME('ann', 'age', 5))
+        networks[0].snapshot(self.path)
+        copy = networks[1].add_production(rule)
+        networks[1].restore(self.path)
+
+        result = [w.value for w in networks[1].alpha_root.amem.memory][:len(values)]
+        assert_that(result, 'typed').is_equal_to(values)
+        assert_that([type(v) for v in result], 'typed').is_equal_to([type(v) for v in values])
+        assert_that(list(networks[1].query(Rule(Has('$x', 'age', '$a')))), 'typed').is_equal_to(
+            [{'$x': 'ann', '$a': 5}])
+        for network in networks:
+            network.add_wme(WME('lim', 'limit', 5))
+        assert_that(self.matches([copy]), 'typed').is_equal_to(self.matches([production])).is_length(1)
+
+    def test__logical_wmes(self):
+        network = create_network()
+        production = network.add_production(Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red')))
+        support = WME('B2', 'color', 'red')
+        network.add_wme(WME('B1', 'on', 'B2'))
+        network.add_wme(support)
+        network.add_logical_wme(WME('B1', 'above', 'red'), production.memory[0])
+        network.snapshot(self.path)
+
+        restored = create_network()
+        restored.add_production(Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red')))
+        restored.restore(self.path)
+        restored.remove_wme(next(w for w in restored.alpha_root.amem.memory if w.attribute == 'color'))
+
+        assert_that(restored.alpha_root.amem.memory, 'logical').is_equal_to([WME('B1', 'on', 'B2')])
+
+    def test__mismatch(self):
+        network, _ = self.compile('rete', ManualClock())
+        network.add_wme(WME('c1', 'type', 'car'))
+        network.snapshot(self.path)
+
+        other = create_network()
+        other.add_production(RULES[0][0])
+        with self.assertRaises(ValueError):
+            other.restore(self.path)
+
+        busy, _ = self.compile('rete', ManualClock())
+        busy.add_wme(WME('c2', 'type', 'car'))
+        with self.assertRaises(ValueError):
+            busy.restore(self.path)
+
+    def test__lazy(self):
+        clock = ManualClock()
+        network, productions = self.compile('rete', clock)
+        self.play(network, clock, 0)
+        network.snapshot(self.path)
+
+        restored, copies = self.compile('rete', ManualClock(clock.now()))
+        restored.restore(self.path)
+        pending = [n for n in restored.nodes() if id(n) in PENDING]
+        assert_that(restored.fork().matches(copies[2]), 'fork').is_length(len(productions[2].memory))
+        assert_that(self.matches(copies[:1]), 'lazy').is_equal_to(self.matches(productions[:1]))
+
+        assert_that(pending, 'lazy').is_length(len(list(restored.nodes())))
+        assert_that([n for n in restored.nodes() if id(n) in PENDING], 'lazy').is_not_empty()
+        restored.remove_wme(restored.alpha_root.amem.memory[0])
+        network.remove_wme(network.alpha_root.amem.memory[0])
+        assert_that([n for n in restored.nodes() if id(n) in PENDING], 'restored').is_empty()
+        assert_that(self.matches(copies), 'restored').is_equal_to(self.matches(productions))
+
+    def test__identities(self):
+        wme = WME('B1', 'on', 'B2')
+        buffer = io.BytesIO()
+        Pickler(buffer, {id(wme): ('w', 0)}).dump([id(wme), Identity(id(wme))])
+
+        # only the tagged int is a reference to the WME, the other one is a mere number
+        class Unpickler(pickle.Unpickler):
+            def persistent_load(self, pid):
+                return pid
+
+        assert_that(Unpickler(io.BytesIO(buffer.getvalue())).load(), 'identities').is_equal_to(
+            [id(wme), ('id', 'w', 0)])
@@ -0,0 +1,98 @@
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Has
+from rete.common import parse_xml
+from rete.common import WME
+from rete.network import create_network
+from rete.nodes import ConstantTestNode
+from rete.symbols import intern
+from rete.symbols import stats
+from rete.symbols import SYMBOLS
+from rete.symbols import SymbolTable
+
+
+class TestSymbolTable(TestCase):
+
+    def test__intern(self):
+        for i, (symbol, exp_same) in enumerate([
+            (''.join(['B', '1']), True),
+            (None, True),
+            (42, True),
+        ]):
+            with self.subTest(i=i, symbol=symbol):
+                table = SymbolTable()
+                first = table.intern(symbol)
+                second = table.intern(''.join(['B', '1']) if isinstance(symbol, str) else symbol)
+
+                assert_that(first is second, 'intern').is_equal_to(exp_same)
+                assert_that(first, 'intern').is_equal_to(symbol)
+
+    def test__encode(self):
+        table = SymbolTable()
+
+        result = [table.encode(s) for s in ['on', 'B1', 'on', 'B2', 'B1']]
+
+        assert_that(result, 'encode').is_equal_to([0, 1, 0, 2, 1])
+        assert_that([table.decode(c) for c in result], 'encode').is_equal_to(['on', 'B1', 'on', 'B2', 'B1'])
+        assert_that(table.lookup('B3'), 'encode').is_none()
+
+        result = [table.encode(s) for s in [1, True, 0, False, 1.0]]
+
+        assert_that(result, 'encode').is_equal_to([3, 4, 5, 6, 3])
+        assert_that(table.decode(result[1]), 'encode').is_true()
+        assert_that(table.lookup(1), 'encode').is_not_equal_to(table.lookup(True))
+
+    def test__stats(self):
+        table = SymbolTable()
+        for s in ['on', 'B1', 'on', 'on']:
+            table.intern(s)
+
+        result = table.stats()
+
+        assert_that(result, 'stats').is_equal_to((2, 2, 2))
+        assert_that(result.hit_rate, 'stats').is_equal_to(0.5)
+        table.intern('B2')
+        assert_that(table.stats(), 'stats').is_equal_to((3, 2, 3))
+        assert_that(SymbolTable().stats().hit_rate, 'stats').is_equal_to(0.0)
+
+    def test__release(self):
+        table = SymbolTable()
+        for s in ['on', 'B1', 'on', 'B2']:
+            table.intern(s)
+        pinned = table.encode('table')
+        table.intern('table')
+
+        for s in ['on', 'B1', 'table']:
+            table.release(s)
+
+        assert_that(table.lookup('B1'), 'release').is_none()
+        assert_that(table.lookup('on'), 'release').is_equal_to(0)
+        assert_that(table.lookup('table'), 'release').is_equal_to(pinned)
+        assert_that(table.encode('B3'), 'release').is_equal_to(1)
+        assert_that(dict(table.items()), 'release').is_equal_to({0: 'on', 1: 'B3', 2: 'B2', 3: 'table'})
+
+    def test__remove_wme(self):
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                network = create_network(engine)
+                wme = WME('B9', 'on', ''.join(['evicted-', engine]))
+                network.add_wme(wme)
+                network.remove_wme(wme)
+
+                assert_that(SYMBOLS.lookup(''.join(['evicted-', engine])), engine).is_none()
+                assert_that(SYMBOLS.lookup('on'), engine).is_not_none()
+
+    def test__global(self):
+        before = stats()
+        wmes = [WME(''.join(['B', '1']), 'on', 'table') for _ in range(2)]
+        has = parse_xml('<data><production><lhs><has identifier="$x" attribute="on" value="table"/></lhs>'
+                        '<rhs/></production></data>')[0][0][0]
+        node = ConstantTestNode('attribute', ''.join(['o', 'n']))
+
+        assert_that(wmes[0].identifier is wmes[1].identifier, 'global').is_true()
+        assert_that(wmes[0].value is has.value, 'global').is_true()
+        assert_that(node.symbol is Has('$x', 'on', '$y').attribute, 'global').is_true()
+        assert_that(intern('on') is wmes[0].attribute, 'global').is_true()
+        assert_that(stats().hits, 'global').is_greater_than(before.hits)
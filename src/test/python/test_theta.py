@@ -0,0 +1,103 @@
+import random
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Filter
+from rete import Has
+from rete import Rule
+from rete.common import ComparisonTest
+from rete.common import WME
+from rete.network import create_network
+from rete.network import Network
+from rete.nodes import FilterNode
+from rete.nodes import SortedMemory
+from rete.nodes import ThetaJoinNode
+from rete.utils import comparison
+
+from helpers import matches
+
+
+def nodes(node):
+    yield node
+    for child in node.children:
+        yield from nodes(child)
+
+
+class TestComparison(TestCase):
+
+    def test__comparison(self):
+        for template, exp in [
+            ('$a < $b', ('$a', '<', '$b')),
+            (' $a>=$b ', ('$a', '>=', '$b')),
+            ('$a < 10', None),
+            ('$a < $b and $b < $c', None),
+            ('$a == $b', None),
+        ]:
+            with self.subTest(template=template):
+                assert_that(comparison(template), template).is_equal_to(exp)
+
+
+class TestThetaJoin(TestCase):
+
+    def test__nodes(self):
+        network = Network()
+        production = network.add_production(Rule(Has('$a', 'price', '$p1'), Has('$b', 'price', '$p2'),
+                                                 Filter('$p1 < $p2')))
+        join = production.parent
+
+        assert_that(join, 'nodes').is_instance_of(ThetaJoinNode)
+        assert_that(join.parent, 'nodes').is_instance_of(SortedMemory)
+        assert_that(join.tests, 'nodes').is_equal_to([ComparisonTest('value', '>', '$p1')])
+        assert_that([n for n in nodes(network.beta_root) if isinstance(n, FilterNode)], 'nodes').is_empty()
+
+    def test__operators(self):
+        prices = ['5', '10', '10', '20', 'n/a']
+        for template in ['$p1 < $p2', '$p1 <= $p2', '$p2 > $p1', '$p1 >= $p2', '$p2 < $p1']:
+            with self.subTest(template=template):
+                network = Network()
+                production = network.add_production(Rule(Has('$a', 'price', '$p1'), Has('$b', 'price', '$p2'),
+                                                         Filter(template)))
+                for i, price in enumerate(prices):
+                    network.add_wme(WME(f'i{i}', 'price', price))
+
+                numeric = [(f'i{i}', float(p)) for i, p in enumerate(prices) if p != 'n/a']
+                exp = sorted((a, b) for a, p1 in numeric for b, p2 in numeric
+                             if eval(template.replace('$p1', str(p1)).replace('$p2', str(p2))))
+                assert_that(matches(production, '$a', '$b'), template).is_equal_to(exp)
+
+    def test__same_as_treat(self):
+        rule = Rule(Has('$a', 'team', '$t'), Has('$a', 'score', '$s1'), Has('$b', 'team', '$t'),
+                    Has('$b', 'score', '$s2'), Filter('$s1 > $s2'))
+        rnd = random.Random(5)
+        facts = []
+        for i in range(30):
+            facts.append((f'p{i}', 'team', f't{i % 4}'))
+            facts.append((f'p{i}', 'score', str(rnd.randint(0, 20))))
+        results = {}
+        for engine in ['rete', 'treat']:
+            wmes = [WME(*fact) for fact in facts]
+            network = create_network(engine)
+            production = network.add_production(rule)
+            for wme in wmes:
+                network.add_wme(wme)
+            for wme in wmes[::7]:
+                network.remove_wme(wme)
+            results[engine] = matches(production, '$a', '$b')
+
+        assert_that(results['rete'], 'treat').is_not_empty()
+        assert_that(results['rete'], 'treat').is_equal_to(results['treat'])
+
+    def test__existing_wmes(self):
+        network = Network()
+        for name, price in [('a', '1'), ('b', '2'), ('c', '3')]:
+            network.add_wme(WME(name, 'price', price))
+        first = network.add_production(Rule(Has('$a', 'price', '$p1'), Has('$b', 'price', '$p2'),
+                                            Filter('$p1 < $p2')))
+        second = network.add_production(Rule(Has('$a', 'price', '$p1'), Has('$b', 'price', '$p2'),
+                                             Filter('$p1 < $p2'), Has('$b', 'name', '$n')))
+        network.add_wme(WME('c', 'name', 'cee'))
+
+        assert_that(matches(first, '$a', '$b'), 'existing').is_equal_to([('a', 'b'), ('a', 'c'), ('b', 'c')])
+        assert_that(matches(second, '$a', '$n'), 'existing').is_equal_to([('a', 'cee'), ('b', 'cee')])
+        assert_that(second.parent.parent.parent, 'existing').is_same_as(first.parent)
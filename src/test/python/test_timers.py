@@ -0,0 +1,116 @@
+import math
+import random
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Has
+from rete import Rule
+from rete.common import WME
+from rete.network import create_network
+from rete.timers import ManualClock
+from rete.timers import TimerWheel
+
+
+class TestTimerWheel(TestCase):
+
+    def test__advance(self):
+        for deadline, early, late in [
+            (3, 2, 3),
+            (63, 62, 63),
+            (64, 63, 64),
+            (500, 499, 500),
+            (4096 * 3 + 7, 4096 * 3 + 6, 4096 * 3 + 7),
+            (64 ** 4 + 5, 64 ** 4 + 4, 64 ** 4 + 5),
+            (2.5, 2, 3),
+        ]:
+            with self.subTest(deadline=deadline):
+                wheel = TimerWheel(start=1)
+                wheel.schedule('item', deadline)
+
+                assert_that(wheel.advance(early), str(deadline)).is_empty()
+                assert_that(wheel.advance(late), str(deadline)).is_equal_to(['item'])
+                assert_that(len(wheel), str(deadline)).is_zero()
+
+    def test__order(self):
+        wheel = TimerWheel(resolution=0.5, slots=4, levels=2)
+        for item, deadline in [('c', 9), ('a', 1), ('d', 30), ('b', 3.2)]:
+            wheel.schedule(item, deadline)
+
+        assert_that(wheel.advance(10), 'order').is_equal_to(['a', 'b', 'c'])
+        assert_that(wheel.advance(100), 'order').is_equal_to(['d'])
+
+    def test__cancel(self):
+        wheel = TimerWheel(start=10)
+        wheel.schedule('past', 5)
+        wheel.schedule('kept', 200)
+        wheel.schedule('cancelled', 200)
+        wheel.schedule('moved', 200)
+        wheel.schedule('moved', 20)
+
+        assert_that(wheel.cancel('cancelled'), 'cancel').is_true()
+        assert_that(wheel.cancel('cancelled'), 'cancel').is_false()
+        assert_that(wheel.cancel('missing'), 'cancel').is_false()
+        assert_that(wheel.advance(10), 'cancel').is_equal_to(['past'])
+        assert_that(wheel.advance(300), 'cancel').is_equal_to(['moved', 'kept'])
+
+    def test__skip(self):
+        rnd = random.Random(3)
+        wheel = TimerWheel(slots=4, levels=3)
+        deadlines = {f'i{n}': rnd.uniform(0, 200) for n in range(300)}
+        for item, deadline in deadlines.items():
+            wheel.schedule(item, deadline)
+        now, expired = 0, []
+        while now < 250:
+            now += rnd.randint(1, 30)
+            result = wheel.advance(now)
+            with self.subTest(now=now):
+                exp = sorted(i for i, d in deadlines.items() if math.ceil(d) <= now and i not in expired)
+                assert_that(sorted(result), str(now)).is_equal_to(exp)
+                ticks = [math.ceil(deadlines[i]) for i in result]
+                assert_that(ticks, str(now)).is_equal_to(sorted(ticks))
+            expired.extend(result)
+
+        assert_that(len(wheel), 'skip').is_zero()
+        assert_that(wheel.next_tick(), 'skip').is_equal_to(math.inf)
+
+
+class TestExpiry(TestCase):
+
+    def test__ttl(self):
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                clock = ManualClock(100)
+                network = create_network(engine, clock=clock)
+                production = network.add_production(Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red')))
+                short, long, kept = WME('B1', 'on', 'B2'), WME('B2', 'color', 'red'), WME('B3', 'on', 'B2')
+                network.add_wme(short, ttl=5)
+                network.add_wme(long, ttl=30)
+                network.add_wme(kept)
+
+                clock.advance(4)
+                assert_that(network.advance_clock(), engine).is_empty()
+                assert_that(production.memory, engine).is_length(2)
+
+                clock.advance(1)
+                assert_that(network.advance_clock(), engine).is_equal_to([short])
+                assert_that(production.memory, engine).is_length(1)
+
+                network.remove_wme(kept)
+                assert_that(network.advance_clock(1000), engine).is_equal_to([long])
+                assert_that(network.alpha_root.amem.memory, engine).is_empty()
+                assert_that(len(network.timers), engine).is_zero()
+
+    def test__batch(self):
+        clock = ManualClock()
+        network = create_network(clock=clock)
+        production = network.add_production(Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red')))
+        events = []
+        production.subscribe(events.append)
+        network.add_wme(WME('B1', 'on', 'B2'), ttl=10)
+        with network.batch():
+            network.add_wme(WME('B2', 'color', 'red'), ttl=10)
+
+            assert_that(network.advance_clock(10), 'batch').is_length(2)
+
+        assert_that(events, 'batch').is_empty()
@@ -0,0 +1,87 @@
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Has
+from rete import Neg
+from rete import Rule
+from rete.common import Token
+from rete.common import WME
+from rete.network import Network
+
+
+class TestTruthMaintenance(TestCase):
+
+    def setUp(self):
+        self.network = Network()
+        # (x on y) => logically (y under x)
+        self.under = self.network.add_production(Rule(Has('$x', 'on', '$y')))
+        self.under.subscribe(self.derive('$y', 'under', '$x'))
+        # (x under y), not (x color red) => logically (x covered yes)
+        self.covered = self.network.add_production(Rule(Has('$x', 'under', '$y'), Neg('$x', 'color', 'red')))
+        self.covered.subscribe(self.derive('$x', 'covered', 'yes'))
+
+    def derive(self, identifier, attribute, value):
+        def listener(event):
+            if event.kind == 'added':
+                binding = event.binding
+                self.network.add_logical_wme(WME(binding.get(identifier, identifier), attribute,
+                                                 binding.get(value, value)), event.token)
+
+        return listener
+
+    def facts(self):
+        return sorted(repr(w) for w in self.network.alpha_root.amem.memory)
+
+    def test__cascade(self):
+        base = WME('B1', 'on', 'B2')
+        with self.network.batch():
+            self.network.add_wme(base)
+
+        assert_that(self.facts(), 'cascade').is_equal_to(['(B1 ^on B2)', '(B2 ^covered yes)', '(B2 ^under B1)'])
+
+        self.network.remove_wme(base)
+
+        assert_that(self.facts(), 'cascade').is_empty()
+        assert_that(len(self.network.tms), 'cascade').is_zero()
+
+    def test__reference_counting(self):
+        first, second = WME('B1', 'on', 'B3'), WME('B2', 'on', 'B3')
+        for wme in [first, second]:
+            with self.network.batch():
+                self.network.add_wme(wme)
+        covered = next(w for w in self.network.alpha_root.amem.memory if w.attribute == 'covered')
+
+        assert_that(self.network.tms.supports(covered), 'refcount').is_equal_to(2)
+
+        self.network.remove_wme(first)
+        assert_that(self.facts(), 'refcount').contains('(B3 ^covered yes)')
+        assert_that(self.network.tms.supports(covered), 'refcount').is_equal_to(1)
+
+        self.network.remove_wme(second)
+        assert_that(self.facts(), 'refcount').is_empty()
+
+    def test__negation(self):
+        with self.network.batch():
+            self.network.add_wme(WME('B1', 'on', 'B2'))
+
+        with self.network.batch():
+            self.network.add_wme(WME('B2', 'color', 'red'))
+
+        assert_that(self.facts(), 'negation').does_not_contain('(B2 ^covered yes)')
+        assert_that(self.facts(), 'negation').contains('(B2 ^under B1)')
+
+    def test__manual_removal(self):
+        base = WME('B1', 'on', 'B2')
+        with self.network.batch():
+            self.network.add_wme(base)
+        derived = next(w for w in self.network.alpha_root.amem.memory if w.attribute == 'covered')
+
+        self.network.remove_wme(derived)
+        self.network.remove_wme(base)
+
+        assert_that(self.facts(), 'manual').is_empty()
+
+    def test__invalid_justification(self):
+        assert_that(self.network.add_logical_wme).raises(ValueError).when_called_with(
+            WME('B1', 'on', 'B2'), Token(None, None))
@@ -0,0 +1,89 @@
+import io
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Has
+from rete import Neg
+from rete import Rule
+from rete.common import WME
+from rete.network import Network
+from rete.trace import read
+from rete.trace import summarize
+from rete.trace import Tracer
+
+
+class TestTrace(TestCase):
+
+    def setUp(self):
+        self.network = Network()
+        self.production = self.network.add_production(
+            Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red'), Neg('$x', 'stolen', 'yes')), name='red')
+
+    def play(self, count=10):
+        for i in range(count):
+            self.network.add_wme(WME(f'B{i}', 'on', 'T'))
+        self.network.add_wme(WME('T', 'color', 'red'))
+        self.network.add_wme(WME('B0', 'stolen', 'yes'))
+
+    def test__records(self):
+        tracer = Tracer(self.network, rate=1.0)
+        self.play()
+
+        records = tracer.records
+        assert_that({r.kind for r in records}, 'kinds').is_equal_to({'add_wme', 'alpha', 'left', 'right'})
+        assert_that([r.cascade for r in records if r.depth == 0], 'cascades').is_equal_to(list(range(1, 13)))
+        red = [r for r in records if r.wme == '(T ^color red)']
+        assert_that(red[-1].produced, 'produced').is_equal_to(20)  # 10 tokens of the join, then of the negation
+        assert_that(sum(r.produced for r in red[:-1]), 'produced').is_equal_to(20)
+        assert_that([r.node for r in red if r.kind == 'left' and r.node.startswith('ProductionNode')],
+                    'production').is_equal_to(['ProductionNode red'] * 10)
+
+    def test__summarize(self):
+        tracer = Tracer(self.network, rate=1.0)
+        self.play()
+
+        cascades = tracer.summarize(top=3)
+        assert_that(cascades, 'top').is_length(3)
+        assert_that([c.duration for c in cascades], 'sorted').is_sorted(reverse=True)
+        red = next(c for c in summarize(tracer.records, top=100) if c.wme == '(T ^color red)')
+        assert_that(red.produced, 'red').is_equal_to(20)
+        assert_that(red.hottest, 'red').is_not_empty()
+        assert_that(red.hottest_time, 'red').is_less_than_or_equal_to(red.duration)
+
+    def test__sampling(self):
+        tracer = Tracer(self.network, rate=0.3, seed=1)
+        self.play(100)
+        sampled = [r for r in tracer.records if r.depth == 0]
+
+        assert_that(len(sampled), 'sampled').is_between(15, 45)
+        assert_that(tracer.records, 'sampled').is_length(len(sampled) + sum(1 for r in tracer.records if r.depth))
+
+        tracer.detach()
+        assert_that(self.network.__dict__, 'detach').does_not_contain_key('add_wme')
+        assert_that(self.production.__dict__, 'detach').does_not_contain_key('left_activation')
+
+    def test__ring_buffer(self):
+        tracer = Tracer(self.network, rate=1.0, capacity=25)
+        self.play()
+
+        assert_that(tracer.records, 'capacity').is_length(25)
+        cascades = summarize(tracer.records, top=100)
+        assert_that(cascades, 'truncated').is_length(len({r.cascade for r in tracer.records}) - 1)
+
+    def test__dump_and_read(self):
+        tracer = Tracer(self.network, rate=1.0)
+        self.play()
+        buffer = io.BytesIO()
+        tracer.dump(buffer)
+        buffer.seek(0)
+
+        assert_that(read(buffer), 'read').is_equal_to(tracer.records)
+
+    def test__new_production(self):
+        tracer = Tracer(self.network, rate=1.0)
+        self.network.add_production(Rule(Has('$x', 'on', '$y'), Has('$x', 'size', '$s')), name='sized')
+        self.network.add_wme(WME('B1', 'size', '3'))
+        self.network.add_wme(WME('B1', 'on', 'B2'))
+
+        assert_that([r.node for r in tracer.records], 'new').contains('ProductionNode sized')
@@ -0,0 +1,115 @@
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Has
+from rete import Ncc
+from rete import Neg
+from rete import Rule
+from rete.common import WME
+from rete.network import create_network
+from rete.workload import Generator
+
+WMES = [
+    WME('B1', 'on', 'B2'),
+    WME('B1', 'on', 'B3'),
+    WME('B1', 'color', 'red'),
+    WME('B2', 'on', 'table'),
+    WME('B2', 'left-of', 'B3'),
+    WME('B2', 'color', 'blue'),
+    WME('B3', 'left-of', 'B4'),
+    WME('B3', 'on', 'table'),
+    WME('B3', 'color', 'red'),
+]
+
+
+def matches(production):
+    return sorted(tuple(repr(w) for w in m.wmes) for m in production.memory)
+
+
+class TestTreatNetwork(TestCase):
+
+    def test__parity(self):
+        for i, rule in enumerate([
+            Rule(Has('$x', 'on', '$y'), Has('$y', 'left-of', '$z'), Has('$z', 'color', 'red')),
+            Rule(Has('$x', 'on', '$y'), Has('$y', 'left-of', '$z'), Neg('$z', 'color', 'red')),
+            Rule(Has('$x', 'on', '$y'), Has('$y', 'left-of', '$z'), Ncc(Has('$z', 'color', 'red'),
+                                                                        Has('$z', 'on', '$w'))),
+            Rule(Has('$x', 'self', '$y'), Has('$x', 'color', 'red'), Has('$y', 'color', 'red')),
+        ]):
+            with self.subTest(i=i, rule=rule):
+                result = []
+                for engine in ['rete', 'treat']:
+                    network = create_network(engine)
+                    production = network.add_production(rule)
+                    for wme in WMES + [WME('B1', 'self', 'B1')]:
+                        network.add_wme(WME(wme.identifier, wme.attribute, wme.value))
+                    result.append(matches(production))
+
+                assert_that(result[1], 'treat').is_equal_to(result[0])
+
+    def test__add_production_on_the_fly(self):
+        network = create_network('treat')
+        for wme in WMES:
+            network.add_wme(wme)
+
+        production = network.add_production(Rule(Has('$x', 'on', '$y'), Has('$y', 'left-of', '$z')))
+
+        assert_that(matches(production), 'treat').is_equal_to([
+            ('(B1 ^on B2)', '(B2 ^left-of B3)'),
+            ('(B1 ^on B3)', '(B3 ^left-of B4)'),
+        ])
+
+    def test__remove_wme(self):
+        network = create_network('treat')
+        production = network.add_production(Rule(Has('$x', 'on', '$y'), Neg('$y', 'color', 'red')))
+        for wme in WMES:
+            network.add_wme(wme)
+        assert_that(matches(production), 'treat').is_length(3)
+
+        network.remove_wme(WMES[8])
+        assert_that(matches(production), 'treat').is_length(4)
+
+        network.remove_wme(WMES[0])
+        assert_that(sorted(m.get_binding('$y') for m in production.memory), 'treat').is_equal_to(
+            ['B3', 'table', 'table'])
+
+    def test__workload(self):
+        generator = Generator(rules=6, conditions=2, selectivity=0.25, negations=0.5, nccs=0.5, wmes=150,
+                              removals=0.5, seed=3)
+        network = create_network('treat')
+        productions = [network.add_production(rule) for rule in generator.rules()]
+        for op in generator.operations():
+            getattr(network, op.name)(*op.args)
+
+        for production in productions:
+            result = sorted(sorted(m.binding.items()) for m in production.memory)
+            exp = sorted(sorted(b.items()) for b in network.query(production.lhs))
+
+            assert_that(result, 'workload').is_equal_to(exp)
+
+    def test__remove_production(self):
+        network = create_network('treat')
+        production = network.add_production(Rule(Has('$x', 'on', '$y')))
+        network.remove_production(production)
+
+        network.add_wme(WMES[0])
+
+        assert_that(production.memory, 'treat').is_empty()
+
+    def test__release_alpha_memories(self):
+        network = create_network('treat')
+        kept = network.add_production(Rule(Has('$x', 'on', '$y')))
+        for _ in range(3):
+            production = network.add_production(Rule(Has('$x', 'on', '$y'), Has('$y', 'color', 'red')))
+            network.add_wme(WME('B2', 'color', 'red'))
+            network.remove_production(production)
+        wme = WME('B1', 'on', 'B2')
+        network.add_wme(wme)
+
+        assert_that(network._amems, 'released').is_length(1)
+        assert_that(wme.amems, 'released').is_length(2)  # the root alpha memory and the one of `kept`
+        assert_that([m.get_binding('$y') for m in kept.memory], 'kept').is_equal_to(['B2'])
+
+    def test__unknown_engine(self):
+        assert_that(create_network).raises(ValueError).when_called_with('leaps')
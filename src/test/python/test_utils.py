@@ -8,6 +8,7 @@ from rete import Filter
 from rete import Has
 from rete import Ncc
 from rete import Rule
+from rete.common import dump_xml
 from rete.common import parse_xml
 from rete.utils import is_var
 
@@ -31,6 +32,19 @@ class Test(TestCase):
 
                     assert_that(result, 'parse_xml').is_equal_to(exp)
 
+    def test__dump_xml(self):
+        for i, (name, rhs) in enumerate([
+            ('example.xml', {}),
+            ('example.xml', {'name': 'p0'}),
+            ('example.xml', {'name': 'p0', 'module': 'sensors'}),
+        ]):
+            with self.subTest(i=i, name=name, rhs=rhs):
+                with open(os.path.join(FIXTURES, name), 'r') as file:
+                    lhs = parse_xml(file.read())[0][0]
+                    result = parse_xml(dump_xml([(lhs, rhs)]))
+
+                    assert_that(result, 'dump_xml').is_equal_to([(lhs, rhs)])
+
     def test__is_var(self):
         for i, (name, exp) in enumerate([
             ('$s', True),
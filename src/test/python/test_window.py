@@ -0,0 +1,119 @@
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Has
+from rete import Rule
+from rete import Within
+from rete.common import dump_xml
+from rete.common import parse_xml
+from rete.common import WME
+from rete.network import create_network
+from rete.network import Network
+from rete.timers import ManualClock
+
+
+class TestWithin(TestCase):
+
+    def setUp(self):
+        # a failed login followed by a password reset of the same user within 30s
+        self.rule = Rule(Has('$u', 'login', 'failed'), Within('$u', 'reset', '$how', window=30))
+
+    def matches(self, production):
+        return sorted((t.get_binding('$u'), t.get_binding('$how')) for t in production.memory)
+
+    def test__followed_by(self):
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                clock = ManualClock()
+                network = create_network(engine, clock=clock)
+                production = network.add_production(self.rule)
+                network.add_wme(WME('bob', 'reset', 'early'))
+                clock.advance(5)
+                network.add_wme(WME('ann', 'login', 'failed'))
+                network.add_wme(WME('bob', 'login', 'failed'))
+                clock.advance(10)
+                network.add_wme(WME('ann', 'reset', 'mail'))
+                clock.advance(21)
+                network.add_wme(WME('bob', 'reset', 'late'))
+                network.add_wme(WME('ann', 'reset', 'sms'))
+
+                assert_that(self.matches(production), engine).is_equal_to([('ann', 'mail')])
+
+    def test__explicit_timestamps(self):
+        network = Network()
+        production = network.add_production(self.rule)
+        for wme in [WME('ann', 'login', 'failed', timestamp=100), WME('ann', 'reset', 'mail', timestamp=130),
+                    WME('bob', 'login', 'failed', timestamp=140), WME('bob', 'reset', 'sms', timestamp=170.5)]:
+            network.add_wme(wme)
+
+        assert_that(self.matches(production), 'timestamps').is_equal_to([('ann', 'mail')])
+
+    def test__out_of_order(self):
+        # the failed login of ann arrives late, after her reset and one of bob, but by less than the window
+        for engine in ['rete', 'treat']:
+            with self.subTest(engine=engine):
+                network = create_network(engine)
+                production = network.add_production(self.rule)
+                for wme in [WME('ann', 'reset', 'mail', timestamp=135), WME('bob', 'reset', 'sms', timestamp=150),
+                            WME('ann', 'login', 'failed', timestamp=125),
+                            WME('bob', 'login', 'failed', timestamp=100)]:
+                    network.add_wme(wme)
+
+                assert_that(self.matches(production), engine).is_equal_to([('ann', 'mail')])
+
+    def test__eviction(self):
+        clock = ManualClock()
+        network = Network(clock)
+        production = network.add_production(self.rule)
+        window = next(iter(network.windows))
+        failed = WME('ann', 'login', 'failed')
+        network.add_wme(failed)
+        network.add_wme(WME('bob', 'reset', 'mail'))
+        clock.advance(10)
+        network.add_wme(WME('ann', 'reset', 'mail'))
+
+        assert_that(window.parent.memory, 'eviction').is_length(1)
+        assert_that(self.matches(production), 'eviction').is_length(1)
+
+        network.advance_clock(100)
+        network.add_wme(WME('ann', 'reset', 'sms'))
+
+        assert_that(window.parent.memory, 'eviction').is_empty()
+        assert_that(self.matches(production), 'eviction').is_equal_to([('ann', 'mail')])
+
+        network.remove_wme(failed)
+        assert_that(production.memory, 'eviction').is_empty()
+
+    def test__remove_wme(self):
+        clock = ManualClock()
+        network = Network(clock)
+        production = network.add_production(self.rule)
+        reset = WME('ann', 'reset', 'mail')
+        network.add_wme(reset)
+        network.remove_wme(reset)
+        network.add_wme(WME('ann', 'login', 'failed'))
+
+        assert_that(production.memory, 'remove').is_empty()
+
+    def test__sharing(self):
+        network = Network()
+        first = network.add_production(self.rule)
+        second = network.add_production(Rule(Has('$u', 'login', 'failed'), Within('$u', 'reset', '$how', window=30)))
+        third = network.add_production(Rule(Has('$u', 'login', 'failed'), Within('$u', 'reset', '$how', window=60)))
+        fourth = network.add_production(Rule(Has('$u', 'login', 'failed'), Has('$u', 'reset', '$how')))
+
+        assert_that(second, 'sharing').is_same_as(first)
+        assert_that(third, 'sharing').is_not_same_as(first)
+        assert_that(fourth.parent, 'sharing').is_not_same_as(first.parent)
+        assert_that(len(network.windows), 'sharing').is_equal_to(2)
+
+    def test__invalid(self):
+        assert_that(Network().add_production).raises(ValueError).when_called_with(
+            Rule(Within('$u', 'reset', '$how', window=30)))
+
+    def test__xml(self):
+        lhs, _ = parse_xml(dump_xml([(self.rule, {})]))[0]
+
+        assert_that(lhs, 'xml').is_equal_to(self.rule)
+        assert_that(lhs[1].window, 'xml').is_equal_to(30)
@@ -0,0 +1,162 @@
+import io
+from unittest import TestCase
+
+from assertpy import assert_that
+
+from rete import Has
+from rete import Ncc
+from rete import Neg
+from rete import Rule
+from rete import Within
+from rete.common import parse_xml
+from rete.common import WME
+from rete.network import Network
+from rete.timers import ManualClock
+from rete.workload import Generator
+from rete.workload import Profile
+from rete.workload import Recorder
+
+
+class TestGenerator(TestCase):
+
+    def test__rules(self):
+        for i, (profile, exp_len, exp_neg, exp_ncc) in enumerate([
+            (Profile(rules=5, conditions=2), 2, 0, 0),
+            (Profile(rules=5, conditions=3, negations=1.0), 4, 5, 0),
+            (Profile(rules=5, conditions=1, negations=1.0, nccs=1.0), 3, 5, 5),
+        ]):
+            with self.subTest(i=i, profile=profile):
+                rules = Generator(profile).rules()
+
+                assert_that(rules, 'rules').is_length(profile.rules)
+                assert_that([len(r) for r in rules], 'rules').contains_only(exp_len)
+                assert_that(sum(isinstance(c, Neg) for r in rules for c in r), 'rules').is_equal_to(exp_neg)
+                assert_that(sum(isinstance(c, Ncc) for r in rules for c in r), 'rules').is_equal_to(exp_ncc)
+
+    def test__to_xml(self):
+        generator = Generator(rules=3, negations=0.5, nccs=0.5, seed=7)
+
+        result = [lhs for lhs, _ in parse_xml(generator.to_xml())]
+
+        assert_that(result, 'to_xml').is_equal_to(generator.rules())
+
+    def test__operations(self):
+        for i, (profile, exp_adds) in enumerate([
+            (Profile(wmes=100), 100),
+            (Profile(wmes=100, removals=0.5), 100),
+        ]):
+            with self.subTest(i=i, profile=profile):
+                first = [(op.name, repr(op.args[0])) for op in Generator(profile).operations()]
+                second = [(op.name, repr(op.args[0])) for op in Generator(profile).operations()]
+
+                assert_that(first, 'operations').is_equal_to(second)
+                assert_that([name for name, _ in first].count('add_wme'), 'operations').is_equal_to(exp_adds)
+                if profile.removals:
+                    assert_that([name for name, _ in first], 'operations').contains('remove_wme')
+
+
+class TestRecorder(TestCase):
+
+    def record(self):
+        network = Network()
+        recorder = Recorder(network)
+        generator = Generator(rules=4, conditions=2, selectivity=0.2, wmes=200, removals=0.3)
+        productions = [network.add_production(rule) for rule in generator.rules()]
+        for op in generator.operations():
+            getattr(network, op.name)(*op.args)
+        network.remove_production(productions[-1])
+
+        return recorder, [len(p.memory) for p in productions[:-1]]
+
+    def test__replay(self):
+        recorder, exp = self.record()
+        network = Network()
+        replayed = Recorder(network)
+
+        recorder.replay(network)
+
+        productions = [op.args[1] for op in replayed.operations if op.name == 'add_production']
+        assert_that([len(p.memory) for p in productions[:-1]], 'replay').is_equal_to(exp)
+        assert_that([op.name for op in replayed.operations], 'replay').is_equal_to(
+            [op.name for op in recorder.operations])
+
+    def test__dump_and_load(self):
+        recorder, exp = self.record()
+        buffer = io.StringIO()
+        recorder.dump(buffer)
+        buffer.seek(0)
+        network = Network()
+        replayed = Recorder(network)
+
+        Recorder.load(buffer).replay(network)
+
+        productions = [op.args[1] for op in replayed.operations if op.name == 'add_production']
+        assert_that([len(p.memory) for p in productions[:-1]], 'dump').is_equal_to(exp)
+
+    def test__timestamps(self):
+        rule = Rule(Has('$u', 'login', 'failed'), Within('$u', 'alert', '$a', window=5))
+        clock = ManualClock(1.0)
+        network = Network(clock)
+        recorder = Recorder(network)
+        production = network.add_production(rule)
+        network.add_wme(WME('u1', 'login', 'failed'))
+        clock.set(30.0)
+        network.add_wme(WME('u1', 'alert', 'a1'))
+        buffer = io.StringIO()
+        recorder.dump(buffer)
+        buffer.seek(0)
+
+        for i, source in enumerate([recorder, Recorder.load(buffer)]):
+            with self.subTest(source=i):
+                network = Network(ManualClock(100.0))
+                replayed = Recorder(network)
+                source.replay(network)
+
+                assert_that(replayed.operations[0].args[1].memory, str(i)).is_length(len(production.memory))
+                assert_that([w.timestamp for w in network.alpha_root.amem.memory], str(i)).is_equal_to([1.0, 30.0])
+
+    def test__ttl(self):
+        network = Network(ManualClock())
+        recorder = Recorder(network)
+        network.add_wme(WME('B1', 'on', 'B2'), ttl=5)
+        network.add_wme(WME('B2', 'on', 'B3'))
+        buffer = io.StringIO()
+        recorder.dump(buffer)
+        buffer.seek(0)
+
+        for i, source in enumerate([recorder, Recorder.load(buffer)]):
+            with self.subTest(source=i):
+                clock = ManualClock()
+                network = Network(clock)
+                source.replay(network)
+                clock.advance(10)
+
+                assert_that(network.advance_clock(), str(i)).is_equal_to([WME('B1', 'on', 'B2')])
+
+    def test__attached_late(self):
+        network = Network()
+        production = network.add_production(Rule(Has('$x', 'on', '$y')))
+        before = WME('B1', 'on', 'B2')
+        network.add_wme(before)
+        recorder = Recorder(network)
+        network.add_wme(WME('B3', 'on', 'B4'))
+        network.remove_wme(before)
+        network.remove_production(production)
+        buffer = io.StringIO()
+        recorder.dump(buffer)
+        buffer.seek(0)
+        loaded = Recorder.load(buffer)
+        replayed = Network()
+        loaded.replay(replayed)
+
+        assert_that([op.name for op in loaded.operations], 'late').is_equal_to(['add_wme'])
+        assert_that(replayed.alpha_root.amem.memory, 'late').is_equal_to([WME('B3', 'on', 'B4')])
+
+    def test__detach(self):
+        network = Network()
+        recorder = Recorder(network)
+        network.add_production(Rule(Has('$x', 'on', '$y')))
+        network.detach(recorder)
+        network.add_wme(WME('B1', 'on', 'B2'))
+
+        assert_that([op.name for op in recorder.operations], 'detach').is_equal_to(['add_production'])